@@ -0,0 +1,169 @@
+#
+# Copyright OpenEmbedded Contributors
+#
+# SPDX-License-Identifier: GPL-2.0-only
+#
+
+"""
+Helpers for updating the buildhistory repository incrementally.
+
+Files are only rewritten when their contents change, and the paths which
+are changed during a build are recorded in the git directory so that
+buildhistory_commit only needs to stage them rather than scanning the whole
+worktree. Nothing is recorded before the repository has been created, and
+without any recorded changes only metadata-revs is committed.
+"""
+
+import os
+import re
+import shutil
+import subprocess
+
+import bb.utils
+
+CHANGES_FILE = os.path.join(".git", "buildhistory-changes")
+
+
+def record_change(histdir, path):
+    """
+    Record that path, a file or directory in the buildhistory directory
+    histdir, has been written or removed
+    """
+    if not os.path.exists(os.path.join(histdir, ".git")):
+        # Everything goes into the first commit
+        return
+    # A single short write so that lines appended by parallel tasks don't mix
+    with open(os.path.join(histdir, CHANGES_FILE), "a") as f:
+        f.write(os.path.relpath(path, histdir) + "\n")
+
+
+def write_file(histdir, path, content):
+    """
+    Write content to path unless it already contains it. Returns True if the
+    file was written.
+    """
+    try:
+        with open(path) as f:
+            if f.read() == content:
+                return False
+    except (FileNotFoundError, UnicodeDecodeError):
+        pass
+
+    bb.utils.mkdirhier(os.path.dirname(path))
+    with open(path, "w") as f:
+        f.write(content)
+    record_change(histdir, path)
+    return True
+
+
+def remove(histdir, path):
+    """
+    Remove the file or directory path if it exists. Returns True if it did.
+    """
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.unlink(path)
+    else:
+        return False
+    record_change(histdir, path)
+    return True
+
+
+def git(histdir, *args, **kwargs):
+    return subprocess.check_output(["git"] + list(args), cwd=histdir, stderr=subprocess.STDOUT, **kwargs)
+
+
+def head(histdir):
+    """
+    Returns the commit checked out in histdir, or None if there isn't one yet
+    """
+    try:
+        return git(histdir, "rev-parse", "-q", "--verify", "HEAD").decode("utf-8").strip()
+    except subprocess.CalledProcessError:
+        return None
+
+
+def stage_changes(histdir, incremental=True):
+    """
+    Stage the changes in the buildhistory repository and return True if
+    there are any apart from metadata-revs. If incremental is True and the
+    repository already has a commit, only the recorded paths are staged,
+    otherwise the whole tree is.
+    """
+    changesfile = os.path.join(histdir, CHANGES_FILE)
+    has_head = head(histdir) is not None
+
+    if incremental and has_head:
+        try:
+            with open(changesfile) as f:
+                paths = sorted(set(f.read().splitlines()))
+        except FileNotFoundError:
+            paths = []
+
+        # Expand the recorded directories, and the paths which no longer
+        # exist, into the files they contain now and the ones which are in
+        # the index so that removed files are dropped from it
+        files = set(["metadata-revs"])
+        others = []
+        for path in paths:
+            fullpath = os.path.join(histdir, path)
+            if os.path.isdir(fullpath) and not os.path.islink(fullpath):
+                for root, dirnames, filenames in os.walk(fullpath):
+                    for name in filenames + [d for d in dirnames if os.path.islink(os.path.join(root, d))]:
+                        files.add(os.path.relpath(os.path.join(root, name), histdir))
+                others.append(path)
+            elif os.path.lexists(fullpath):
+                files.add(path)
+            else:
+                others.append(path)
+        for i in range(0, len(others), 1000):
+            files.update(git(histdir, "ls-files", "-z", "--", *others[i:i + 1000]).decode("utf-8").split("\0"))
+        files.discard("")
+
+        # Write the files straight into the index with a single update,
+        # rather than having git add match every entry in it against the
+        # paths
+        git(histdir, "update-index", "--add", "--remove", "--replace", "-z", "--stdin",
+            input="".join(f + "\0" for f in sorted(files)).encode("utf-8"))
+    else:
+        git(histdir, "add", "-A", ".")
+
+    if os.path.exists(changesfile):
+        os.unlink(changesfile)
+
+    if has_head:
+        changed = subprocess.call(["git", "diff", "--cached", "--quiet", "HEAD", "--", ".", ":(exclude)metadata-revs"],
+                                  cwd=histdir) != 0
+    else:
+        changed = bool(git(histdir, "ls-files", "--", ".", ":(exclude)metadata-revs").strip())
+    return changed
+
+
+def commit(histdir, message, author):
+    """
+    Commit the staged changes in the buildhistory repository. Unlike git
+    commit this doesn't refresh the whole index from the worktree first,
+    since the changes have already been staged by stage_changes().
+    """
+    env = dict(os.environ)
+    m = re.match(r"^\s*(.*?)\s*<(.*)>\s*$", author)
+    if m:
+        env["GIT_AUTHOR_NAME"], env["GIT_AUTHOR_EMAIL"] = m.groups()
+
+    # The same clean up of the message as git commit -F does
+    message = git(histdir, "stripspace", input=message.encode("utf-8"))
+
+    parent = head(histdir)
+    tree = git(histdir, "write-tree").decode("utf-8").strip()
+    args = ["commit-tree", "--no-gpg-sign", tree]
+    if parent:
+        args += ["-p", parent]
+    rev = git(histdir, *args, input=message, env=env).decode("utf-8").strip()
+
+    subject = message.decode("utf-8").split("\n", 1)[0]
+    reflog = "commit: %s" % subject if parent else "commit (initial): %s" % subject
+    git(histdir, "update-ref", "-m", reflog, "HEAD", rev, *([parent] if parent else []))
+    subprocess.call(["git", "gc", "--auto", "--quiet"], cwd=histdir,
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return rev
@@ -12,6 +12,7 @@
 
 import sys
 import os.path
+import bisect
 import difflib
 import functools
 import git
@@ -19,8 +20,11 @@ import re
 import shlex
 import hashlib
 import collections
+import subprocess
+import threading
 import bb.utils
 import bb.tinfoil
+import oe.utils
 
 
 # How to display fields
@@ -265,8 +269,88 @@ class FileChange:
     def __lt__(self, other):
         return (self.path, self.changetype, self.oldvalue, self.oldvalue) < (other.path, other.changetype, other.oldvalue, other.oldvalue)
 
+def blob_data(blob):
+    """
+    Returns the contents of blob, which is either a GitPython blob or the
+    contents themselves as returned by read_blobs()
+    """
+    if isinstance(blob, bytes):
+        return blob
+    return blob.data_stream.read()
+
+
+def diff_trees(repopath, revision1, revision2):
+    """
+    Returns the files which differ between two revisions of the repository
+    as (changetype, apath, bpath, asha, bsha) tuples in the order listed by
+    git diff-tree. Renames are detected the same way as by GitPython's
+    Commit.diff().
+    """
+    output = subprocess.check_output(['git', 'diff-tree', '-r', '-z', '--raw', '-M', '--no-color',
+                                      revision1, revision2, '--'], cwd=repopath)
+    fields = output.decode('utf-8').split('\0')
+    files = []
+    i = 0
+    while i < len(fields) - 1:
+        # :<amode> <bmode> <asha> <bsha> <status>, followed by the path, or
+        # the old and new paths for renames and copies
+        amode, bmode, asha, bsha, status = fields[i][1:].split()
+        changetype = status[0]
+        if changetype in 'RC':
+            apath, bpath = fields[i + 1:i + 3]
+            i += 3
+        else:
+            apath = bpath = fields[i + 1]
+            i += 2
+        files.append((changetype, apath, bpath, asha, bsha))
+    return files
+
+
+def read_blobs(repopath, shas):
+    """
+    Returns a dictionary mapping the given blob object names to their
+    contents. All the blobs are read through a single git cat-file --batch
+    process rather than looking each of them up separately.
+    """
+    shas = list(dict.fromkeys(shas))
+    blobs = {}
+    if not shas:
+        return blobs
+
+    proc = subprocess.Popen(['git', 'cat-file', '--batch'], cwd=repopath,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    # Send the requests from another thread so that git never blocks on
+    # writing output which hasn't been read yet
+    def write_requests():
+        try:
+            proc.stdin.write(''.join('%s\n' % sha for sha in shas).encode('utf-8'))
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+
+    writer = threading.Thread(target=write_requests)
+    writer.start()
+    try:
+        for sha in shas:
+            header = proc.stdout.readline().split()
+            if len(header) != 3 or header[1] != b'blob':
+                raise ValueError('Unable to read blob %s from %s: %s' % (sha, repopath, b' '.join(header).decode('utf-8')))
+            blobs[sha] = proc.stdout.read(int(header[2]))
+            # Each object is followed by a newline
+            proc.stdout.read(1)
+    except BaseException:
+        proc.kill()
+        raise
+    finally:
+        writer.join()
+        proc.stdout.close()
+        proc.wait()
+    return blobs
+
+
 def blob_to_dict(blob):
-    alines = [line for line in blob.data_stream.read().decode('utf-8').splitlines()]
+    alines = [line for line in blob_data(blob).decode('utf-8').splitlines()]
     adict = {}
     for line in alines:
         splitv = [i.strip() for i in line.split('=',1)]
@@ -346,12 +430,22 @@ def compare_file_lists(alines, blines, compare_ownership=True):
             revmap_remove[translated] = []
         revmap_remove[translated].append(removal)
 
+    # The additions and removals which haven't been matched yet, as dicts
+    # so that matches can be looked up and dropped in constant time while
+    # keeping the order
+    additions = dict.fromkeys(additions)
+    removals = dict.fromkeys(removals)
+    # The additions starting with a given prefix are next to each other once
+    # sorted, order maps them back to the order of additions
+    sorted_additions = sorted(additions)
+    order = {addition: i for i, addition in enumerate(additions)}
+
     #
     # We want to detect renames of large trees of files like
     # /lib/modules/5.4.40-yocto-standard to /lib/modules/5.4.43-yocto-standard
     #
     renames = {}
-    for addition in additions.copy():
+    for addition in list(additions):
         if addition not in additions:
             continue
         translated = addition.translate(numeric_removal)
@@ -373,18 +467,19 @@ def compare_file_lists(alines, blines, compare_ownership=True):
             if commondir2 not in bdict and commondir not in adict:
                 if commondir not in renames:
                     renames[commondir] = commondir2
-                    for addition2 in additions.copy():
-                        if addition2.startswith(commondir):
+                    start = end = bisect.bisect_left(sorted_additions, commondir)
+                    while end < len(sorted_additions) and sorted_additions[end].startswith(commondir):
+                        end += 1
+                    for addition2 in sorted(sorted_additions[start:end], key=order.get):
+                        if addition2 in additions:
                             removal2 = addition2.replace(commondir, commondir2)
                             if removal2 in removals:
-                                additions.remove(addition2)
-                                removals.remove(removal2)
+                                del additions[addition2]
+                                del removals[removal2]
                     continue
             filechanges.append(FileChange(removal, FileChange.changetype_move, addition))
-            if addition in additions:
-                additions.remove(addition)
-            if removal in removals:
-                removals.remove(removal)
+            additions.pop(addition, None)
+            removals.pop(removal, None)
     for rename in renames:
         filechanges.append(FileChange(renames[rename], FileChange.changetype_move, rename))
 
@@ -527,8 +622,8 @@ def compare_dict_blobs(path, ablob, bblob, report_all, report_ver):
 
 def compare_siglists(a_blob, b_blob, taskdiff=False):
     # FIXME collapse down a recipe's tasks?
-    alines = a_blob.data_stream.read().decode('utf-8').splitlines()
-    blines = b_blob.data_stream.read().decode('utf-8').splitlines()
+    alines = blob_data(a_blob).decode('utf-8').splitlines()
+    blines = blob_data(b_blob).decode('utf-8').splitlines()
     keys = []
     pnmap = {}
     def readsigs(lines):
@@ -620,122 +715,148 @@ def compare_siglists(a_blob, b_blob, taskdiff=False):
     return '\n'.join(out)
 
 
+def changed_file_kind(path, filename):
+    """
+    Returns how a modified file in the buildhistory repository is compared
+    (see compare_changed_file()), or None if changes to it aren't reported
+    """
+    if path.startswith('packages/'):
+        if filename == 'latest':
+            return 'dict'
+        elif filename.startswith('latest.'):
+            return 'text'
+        elif filename == 'sysroot':
+            return 'sysroot'
+    elif path.startswith('images/'):
+        if filename in img_monitor_files:
+            if filename == 'files-in-image.txt':
+                return 'filelist'
+            elif filename == 'installed-package-names.txt':
+                return 'list'
+            return 'text'
+        elif filename == 'image-info.txt':
+            return 'dict'
+        elif '/image-files/' in path:
+            return 'text'
+    elif path.startswith('sdk/'):
+        if filename in img_monitor_files:
+            if filename == 'files-in-sdk.txt':
+                return 'filelist'
+            elif filename == 'installed-package-names.txt':
+                return 'list'
+            return 'text'
+        elif filename == 'sdk-info.txt':
+            return 'dict'
+    return None
+
+
+def compare_changed_file(kind, path, filename, adata, bdata, report_all, report_ver):
+    """
+    Returns the list of changes between the old and new contents of a
+    modified file in the buildhistory repository
+    """
+    if kind == 'dict':
+        return compare_dict_blobs(path, adata, bdata, report_all, report_ver)
+    elif kind == 'text':
+        return [ChangeRecord(path, filename, adata.decode('utf-8'), bdata.decode('utf-8'), True)]
+
+    alines = adata.decode('utf-8').splitlines()
+    blines = bdata.decode('utf-8').splitlines()
+    if kind == 'list':
+        filechanges = sorted(compare_lists(alines, blines))
+    else:
+        filechanges = compare_file_lists(alines, blines, compare_ownership=(kind != 'sysroot'))
+    if not filechanges:
+        return []
+    chg = ChangeRecord(path, filename, None, None, True)
+    chg.filechanges = filechanges
+    return [chg]
+
+
 def process_changes(repopath, revision1, revision2='HEAD', report_all=False, report_ver=False,
-                    sigs=False, sigsdiff=False, exclude_path=None):
+                    sigs=False, sigsdiff=False, exclude_path=None, jobs=1):
     repo = git.Repo(repopath)
     assert repo.bare == False
-    commit = repo.commit(revision1)
-    diff = commit.diff(revision2)
+    # Resolve the revisions first so that invalid ones are reported the
+    # same way as by GitPython
+    revision1 = repo.commit(revision1).hexsha
+    revision2 = repo.commit(revision2).hexsha
+    diff = diff_trees(repopath, revision1, revision2)
+    nullsha = '0' * 40
+
+    # Files whose contents have changed, including renamed files which
+    # have been modified, as listed by GitPython's iter_change_type('M')
+    modified = [(apath, asha, bsha) for (changetype, apath, bpath, asha, bsha) in diff
+                if asha != nullsha and bsha != nullsha and asha != bsha]
 
     changes = []
 
     if sigs or sigsdiff:
-        for d in diff.iter_change_type('M'):
-            if d.a_blob.path == 'siglist.txt':
-                changes.append(compare_siglists(d.a_blob, d.b_blob, taskdiff=sigsdiff))
+        modified = [m for m in modified if m[0] == 'siglist.txt']
+        blobs = read_blobs(repopath, [sha for m in modified for sha in m[1:]])
+        for (apath, asha, bsha) in modified:
+            changes.append(compare_siglists(blobs[asha], blobs[bsha], taskdiff=sigsdiff))
         return changes
 
-    for d in diff.iter_change_type('M'):
-        path = os.path.dirname(d.a_blob.path)
-        if path.startswith('packages/'):
-            filename = os.path.basename(d.a_blob.path)
-            if filename == 'latest':
-                changes.extend(compare_dict_blobs(path, d.a_blob, d.b_blob, report_all, report_ver))
-            elif filename.startswith('latest.'):
-                chg = ChangeRecord(path, filename, d.a_blob.data_stream.read().decode('utf-8'), d.b_blob.data_stream.read().decode('utf-8'), True)
-                changes.append(chg)
-            elif filename == 'sysroot':
-                alines = d.a_blob.data_stream.read().decode('utf-8').splitlines()
-                blines = d.b_blob.data_stream.read().decode('utf-8').splitlines()
-                filechanges = compare_file_lists(alines,blines, compare_ownership=False)
-                if filechanges:
-                    chg = ChangeRecord(path, filename, None, None, True)
-                    chg.filechanges = filechanges
-                    changes.append(chg)
-
-        elif path.startswith('images/'):
-            filename = os.path.basename(d.a_blob.path)
-            if filename in img_monitor_files:
-                if filename == 'files-in-image.txt':
-                    alines = d.a_blob.data_stream.read().decode('utf-8').splitlines()
-                    blines = d.b_blob.data_stream.read().decode('utf-8').splitlines()
-                    filechanges = compare_file_lists(alines,blines)
-                    if filechanges:
-                        chg = ChangeRecord(path, filename, None, None, True)
-                        chg.filechanges = filechanges
-                        changes.append(chg)
-                elif filename == 'installed-package-names.txt':
-                    alines = d.a_blob.data_stream.read().decode('utf-8').splitlines()
-                    blines = d.b_blob.data_stream.read().decode('utf-8').splitlines()
-                    filechanges = compare_lists(alines,blines)
-                    if filechanges:
-                        chg = ChangeRecord(path, filename, None, None, True)
-                        chg.filechanges = sorted(filechanges)
-                        changes.append(chg)
-                else:
-                    chg = ChangeRecord(path, filename, d.a_blob.data_stream.read().decode('utf-8'), d.b_blob.data_stream.read().decode('utf-8'), True)
-                    changes.append(chg)
-            elif filename == 'image-info.txt':
-                changes.extend(compare_dict_blobs(path, d.a_blob, d.b_blob, report_all, report_ver))
-            elif '/image-files/' in path:
-                chg = ChangeRecord(path, filename, d.a_blob.data_stream.read().decode('utf-8'), d.b_blob.data_stream.read().decode('utf-8'), True)
-                changes.append(chg)
-
-        elif path.startswith('sdk/'):
-            filename = os.path.basename(d.a_blob.path)
-            if filename in img_monitor_files:
-                if filename == 'files-in-sdk.txt':
-                    alines = d.a_blob.data_stream.read().decode('utf-8').splitlines()
-                    blines = d.b_blob.data_stream.read().decode('utf-8').splitlines()
-                    filechanges = compare_file_lists(alines,blines)
-                    if filechanges:
-                        chg = ChangeRecord(path, filename, None, None, True)
-                        chg.filechanges = filechanges
-                        changes.append(chg)
-                elif filename == 'installed-package-names.txt':
-                    alines = d.a_blob.data_stream.read().decode('utf-8').splitlines()
-                    blines = d.b_blob.data_stream.read().decode('utf-8').splitlines()
-                    filechanges = compare_lists(alines,blines)
-                    if filechanges:
-                        chg = ChangeRecord(path, filename, None, None, True)
-                        chg.filechanges = sorted(filechanges)
-                        changes.append(chg)
-                else:
-                    chg = ChangeRecord(path, filename, d.a_blob.data_stream.read().decode('utf-8'), d.b_blob.data_stream.read().decode('utf-8'), True)
-                    changes.append(chg)
-            elif filename == 'sdk-info.txt':
-                changes.extend(compare_dict_blobs(path, d.a_blob, d.b_blob, report_all, report_ver))
+    compared = []
+    for (apath, asha, bsha) in modified:
+        path = os.path.dirname(apath)
+        filename = os.path.basename(apath)
+        kind = changed_file_kind(path, filename)
+        if kind:
+            compared.append((kind, path, filename, asha, bsha))
 
     # Look for added preinst/postinst/prerm/postrm
     # (without reporting newly added recipes)
     addedpkgs = []
-    addedchanges = []
-    for d in diff.iter_change_type('A'):
-        path = os.path.dirname(d.b_blob.path)
+    added = []
+    for (changetype, apath, bpath, asha, bsha) in diff:
+        if changetype != 'A':
+            continue
+        path = os.path.dirname(bpath)
         if path.startswith('packages/'):
-            filename = os.path.basename(d.b_blob.path)
+            filename = os.path.basename(bpath)
             if filename == 'latest':
                 addedpkgs.append(path)
             elif filename.startswith('latest.'):
-                chg = ChangeRecord(path, filename[7:], '', d.b_blob.data_stream.read().decode('utf-8'), True)
-                addedchanges.append(chg)
-    for chg in addedchanges:
+                added.append((path, filename, bsha))
+
+    # Look for cleared preinst/postinst/prerm/postrm
+    deleted = []
+    for (changetype, apath, bpath, asha, bsha) in diff:
+        if changetype != 'D':
+            continue
+        path = os.path.dirname(apath)
+        if path.startswith('packages/'):
+            filename = os.path.basename(apath)
+            if filename != 'latest' and filename.startswith('latest.'):
+                deleted.append((path, filename, asha))
+
+    blobs = read_blobs(repopath, [sha for c in compared for sha in c[3:]] +
+                                 [a[2] for a in added] + [d[2] for d in deleted])
+
+    items = [(kind, path, filename, blobs[asha], blobs[bsha]) for (kind, path, filename, asha, bsha) in compared]
+    if jobs > 1 and len(items) > 1:
+        # The results come back in the same order as the items, so the
+        # output doesn't depend on the number of jobs
+        with oe.utils.MultiprocessPool(compare_changed_file, jobs, extraargs=(report_all, report_ver)) as pool:
+            for filechanges in pool.imap(items):
+                changes.extend(filechanges)
+    else:
+        for item in items:
+            changes.extend(compare_changed_file(*item, report_all, report_ver))
+
+    for (path, filename, sha) in added:
         found = False
         for pkg in addedpkgs:
-            if chg.path.startswith(pkg):
+            if path.startswith(pkg):
                 found = True
                 break
         if not found:
-            changes.append(chg)
+            changes.append(ChangeRecord(path, filename[7:], '', blobs[sha].decode('utf-8'), True))
 
-    # Look for cleared preinst/postinst/prerm/postrm
-    for d in diff.iter_change_type('D'):
-        path = os.path.dirname(d.a_blob.path)
-        if path.startswith('packages/'):
-            filename = os.path.basename(d.a_blob.path)
-            if filename != 'latest' and filename.startswith('latest.'):
-                chg = ChangeRecord(path, filename[7:], d.a_blob.data_stream.read().decode('utf-8'), '', True)
-                changes.append(chg)
+    for (path, filename, sha) in deleted:
+        changes.append(ChangeRecord(path, filename[7:], blobs[sha].decode('utf-8'), '', True))
 
     # filter out unwanted paths
     if exclude_path:
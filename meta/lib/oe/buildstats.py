@@ -7,9 +7,14 @@
 # Because it is a real Python module, it can hold persistent state,
 # like open log files and the time of the last sampling.
 
+import os
+import select
+import signal
+import struct
 import time
 import re
 import bb.event
+import bb.utils
 from collections import deque
 
 class SystemStats:
@@ -251,4 +256,288 @@ class SystemStats:
                      b'\n')
             self.last_disk_monitor = now
             retval = True
-        return retval
\ No newline at end of file
+        return retval
+
+class TaskSampler:
+    """
+    Samples the resources used by the process tree of a task while it runs.
+
+    A forked process appends a line to the samples file every interval
+    seconds, with the time, the number of processes in the tree and their
+    total RSS in kB, CPU time in seconds and bytes read and written by the
+    block layer, followed by the pressure stall times in microseconds since
+    the task started. The column names are on the first line.
+
+    The pressure is read from the cgroup v2 of the task if it has pressure
+    files, otherwise from /proc/pressure. Unless the task has a cgroup of its
+    own this includes the stalls of everything else running at the same
+    time, but it still shows which tasks were slowed down by the host.
+    """
+    pressure_columns = (('cpu', 'some'), ('io', 'some'), ('io', 'full'),
+                        ('memory', 'some'), ('memory', 'full'))
+
+    def __init__(self, filename, interval):
+        self.filename = filename
+        self.interval = interval
+        self.pid = None
+        self.sampler_pid = None
+        self.wfd = None
+
+    @staticmethod
+    def _pressure_files(pid):
+        """
+        Get the pressure files of the cgroup of pid, or the ones of the host
+        """
+        try:
+            cgroup = None
+            with open("/proc/%d/cgroup" % pid) as f:
+                for line in f:
+                    if line.startswith("0::"):
+                        cgroup = line[3:].strip()
+            mount = None
+            with open("/proc/self/mounts") as f:
+                for line in f:
+                    fields = line.split()
+                    if fields[2] == "cgroup2":
+                        mount = fields[1]
+            if cgroup and mount:
+                files = dict((resource, os.path.join(mount, cgroup.lstrip("/"), "%s.pressure" % resource))
+                             for resource in ("cpu", "io", "memory"))
+                if all(os.access(f, os.R_OK) for f in files.values()):
+                    return files
+        except OSError:
+            pass
+        return dict((resource, "/proc/pressure/%s" % resource) for resource in ("cpu", "io", "memory"))
+
+    def _read_pressure(self):
+        totals = {}
+        for resource, filename in self.pressure_files.items():
+            try:
+                with open(filename) as f:
+                    for line in f:
+                        tokens = line.split()
+                        totals[(resource, tokens[0])] = int(tokens[-1].split("=")[1])
+            except (OSError, IndexError, ValueError):
+                pass
+        return totals
+
+    def _children(self, pid):
+        children = []
+        try:
+            for tid in os.listdir("/proc/%d/task" % pid):
+                with open("/proc/%d/task/%s/children" % (pid, tid)) as f:
+                    children.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+        return children
+
+    def _children_from_ppids(self):
+        # Without CONFIG_PROC_CHILDREN the parent of every process is needed
+        children = {}
+        for name in os.listdir("/proc"):
+            if name.isdigit():
+                try:
+                    with open("/proc/%s/stat" % name) as f:
+                        ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+                except (OSError, IndexError, ValueError):
+                    continue
+                children.setdefault(ppid, []).append(int(name))
+        return children
+
+    def _process_tree(self):
+        if self.have_children:
+            get_children = self._children
+        else:
+            get_children = self._children_from_ppids().get
+        pids = [self.pid]
+        for pid in pids:
+            pids.extend(child for child in get_children(pid) or [] if child != self.sampler_pid)
+        return pids
+
+    def _sample_tree(self):
+        nprocs = rss = ticks = read_bytes = write_bytes = 0
+        for pid in self._process_tree():
+            try:
+                with open("/proc/%d/stat" % pid) as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+            except OSError:
+                continue
+            nprocs += 1
+            # utime, stime, cutime and cstime, and rss in pages
+            ticks += sum(int(field) for field in fields[11:15])
+            rss += int(fields[21])
+            try:
+                with open("/proc/%d/io" % pid) as f:
+                    for line in f:
+                        if line.startswith("read_bytes:"):
+                            read_bytes += int(line.split()[1])
+                        elif line.startswith("write_bytes:"):
+                            write_bytes += int(line.split()[1])
+            except OSError:
+                pass
+        return nprocs, rss * self.page_kb, ticks / self.clock_ticks, read_bytes, write_bytes
+
+    def _run(self, rfd, fd):
+        start_pressure = self._read_pressure()
+        columns = ["time", "procs", "rss_kb", "cpu_s", "read_bytes", "write_bytes"]
+        columns.extend("%s_%s_us" % column for column in self.pressure_columns if column in start_pressure)
+        os.write(fd, ("# %s\n" % " ".join(columns)).encode("ascii"))
+        stop = False
+        while not stop:
+            now = time.time()
+            nprocs, rss, cpu, read_bytes, write_bytes = self._sample_tree()
+            pressure = self._read_pressure()
+            line = "%.2f %d %d %.2f %d %d" % (now, nprocs, rss, cpu, read_bytes, write_bytes)
+            for column in self.pressure_columns:
+                if column in start_pressure:
+                    line += " %d" % (pressure.get(column, 0) - start_pressure[column])
+            os.write(fd, (line + "\n").encode("ascii"))
+
+            # stop() makes the pipe readable, then a last sample is taken.
+            # Stop straight away if the task process has gone.
+            stop = bool(select.select([rfd], [], [], self.interval)[0])
+            if os.getppid() != self.pid:
+                break
+
+    def start(self):
+        self.pid = os.getpid()
+        self.pressure_files = self._pressure_files(self.pid)
+        self.have_children = os.path.exists("/proc/%d/task/%d/children" % (self.pid, self.pid))
+        self.clock_ticks = os.sysconf("SC_CLK_TCK")
+        self.page_kb = os.sysconf("SC_PAGE_SIZE") // 1024
+
+        rfd, self.wfd = os.pipe()
+        fd = os.open(self.filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, 0o644)
+        pid = os.fork()
+        if pid == 0:
+            try:
+                # Don't run the signal handlers of the task and don't keep
+                # its files and pipes open
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                lowfd = 3
+                for keepfd in sorted((rfd, fd)):
+                    os.closerange(lowfd, keepfd)
+                    lowfd = keepfd + 1
+                os.closerange(lowfd, os.sysconf("SC_OPEN_MAX"))
+                self.sampler_pid = os.getpid()
+                self._run(rfd, fd)
+            finally:
+                os._exit(0)
+        self.sampler_pid = pid
+        os.close(rfd)
+        os.close(fd)
+
+    def stop(self):
+        """
+        Stop sampling. Returns the peak RSS of the process tree in kB and a
+        dict of the pressure stall time of each pressure column over the
+        whole task, or None and an empty dict if nothing was sampled.
+        """
+        try:
+            os.write(self.wfd, b"x")
+        except OSError:
+            pass
+        os.close(self.wfd)
+        try:
+            os.waitpid(self.sampler_pid, 0)
+        except ChildProcessError:
+            # Something in the task has already waited for it
+            pass
+
+        columns = []
+        samples = []
+        try:
+            with open(self.filename) as f:
+                for line in f:
+                    if line.startswith("#"):
+                        columns = line[1:].split()
+                    elif line.strip():
+                        samples.append([float(value) for value in line.split()])
+        except (OSError, ValueError):
+            pass
+        if not samples or "rss_kb" not in columns:
+            return None, {}
+        peak_rss = max(sample[columns.index("rss_kb")] for sample in samples)
+        pressure = dict((column, int(samples[-1][i])) for i, column in enumerate(columns)
+                        if column.endswith("_us"))
+        return int(peak_rss), pressure
+
+
+# Besides the text file of each task, buildstats.bbclass appends a fixed
+# size record to TASK_RECORDS in the build's buildstats directory when a task
+# starts and when it ends, so that tools like buildstats-diff can load a
+# whole build without parsing thousands of files. The recipe and task names
+# are appended to TASK_NAMES and each record holds their offset and length
+# in it. TASK_RECORDS starts with a header holding the magic, the version,
+# the size of the header and a description of the fields of the records as
+# space separated name:struct-code pairs. All fields are 8 bytes long, so
+# each of them can be read as a strided column of the memory mapped file,
+# see scripts/lib/buildstats.py.
+TASK_RECORDS = "task_records"
+TASK_NAMES = "task_records.names"
+TASK_RECORDS_MAGIC = b"OEBSTASK"
+TASK_RECORDS_VERSION = 1
+
+TASK_STARTED = 0
+TASK_PASSED = 1
+TASK_FAILED = 2
+
+RUSAGE_FIELDS = ("ru_utime", "ru_stime", "ru_maxrss", "ru_minflt", "ru_majflt",
+                 "ru_inblock", "ru_oublock", "ru_nvcsw", "ru_nivcsw")
+IO_FIELDS = ("rchar", "wchar", "syscr", "syscw", "read_bytes", "write_bytes",
+             "cancelled_write_bytes")
+
+TASK_RECORD_FIELDS = (
+    [("name_offset", "q"), ("name_length", "q"), ("status", "q"),
+     ("start_time", "d"), ("end_time", "d"),
+     ("utime", "q"), ("stime", "q"), ("cutime", "q"), ("cstime", "q")] +
+    [("io_" + f, "q") for f in IO_FIELDS] +
+    [("rusage_" + f, "d" if f in ("ru_utime", "ru_stime") else "q") for f in RUSAGE_FIELDS] +
+    [("child_rusage_" + f, "d" if f in ("ru_utime", "ru_stime") else "q") for f in RUSAGE_FIELDS])
+
+TASK_RECORD = struct.Struct("<" + "".join(code for _, code in TASK_RECORD_FIELDS))
+
+
+def task_records_header():
+    fields = (" ".join("%s:%s" % field for field in TASK_RECORD_FIELDS) + "\n").encode("ascii")
+    # Pad the header so that the records are aligned
+    fields += b"\0" * (-len(fields) % 8)
+    return TASK_RECORDS_MAGIC + struct.pack("<II", TASK_RECORDS_VERSION, 16 + len(fields)) + fields
+
+
+def write_task_record(bsdir, pf, task, status, start_time, end_time=0, cpu=None,
+                      iostats=None, resources=None, childres=None):
+    """
+    Append the record of a task to the task records of the buildstats
+    directory bsdir. cpu, iostats, resources and childres are what
+    get_process_cputime() in buildstats.bbclass returns.
+    """
+    values = dict.fromkeys((name for name, _ in TASK_RECORD_FIELDS), 0)
+    values["status"] = status
+    values["start_time"] = start_time or 0
+    values["end_time"] = end_time or 0
+    for key, value in (cpu or {}).items():
+        values[key] = int(value)
+    for key, value in (iostats or {}).items():
+        if "io_" + key in values:
+            values["io_" + key] = int(value)
+    for prefix, usage in (("rusage_", resources), ("child_rusage_", childres)):
+        if usage is not None:
+            for key in RUSAGE_FIELDS:
+                values[prefix + key] = getattr(usage, key)
+
+    name = ("%s %s\n" % (pf, task)).encode("utf-8")
+    lock = bb.utils.lockfile(os.path.join(bsdir, TASK_RECORDS + ".lock"))
+    try:
+        with open(os.path.join(bsdir, TASK_NAMES), "ab") as f:
+            values["name_offset"] = f.seek(0, os.SEEK_END)
+            values["name_length"] = len(name) - 1
+            f.write(name)
+        with open(os.path.join(bsdir, TASK_RECORDS), "ab") as f:
+            record = TASK_RECORD.pack(*(values[name] for name, _ in TASK_RECORD_FIELDS))
+            if f.seek(0, os.SEEK_END) == 0:
+                record = task_records_header() + record
+            f.write(record)
+    finally:
+        bb.utils.unlockfile(lock)
@@ -10,6 +10,9 @@
 
 import os
 import errno
+import fnmatch
+import glob
+import itertools
 import stat as statmod
 
 class CachedPath(object):
@@ -17,14 +20,41 @@ class CachedPath(object):
         self.statcache = {}
         self.lstatcache = {}
         self.normpathcache = {}
+        self.readlinkcache = {}
+        self.listdircache = {}
+        # File types (S_IFMT of the lstat result) from the directory entries
+        # read by walk(), so the common checks don't need to stat
+        self.typecache = {}
+        # Resolved paths, keyed by (path, root, assume_dir)
+        self.realpathcache = {}
         return
 
     def updatecache(self, x):
         x = self.normpath(x)
+        oldst = self.lstatcache.get(x)
         if x in self.statcache:
             del self.statcache[x]
         if x in self.lstatcache:
             del self.lstatcache[x]
+        if x in self.readlinkcache:
+            del self.readlinkcache[x]
+        if x in self.listdircache:
+            del self.listdircache[x]
+        if x in self.typecache:
+            del self.typecache[x]
+        parent = self.normpath(os.path.dirname(x))
+        if parent in self.listdircache:
+            del self.listdircache[parent]
+        if not self.realpathcache:
+            return
+        # A regular file which is still a regular file can't change how any
+        # path resolves. Anything else may have changed the resolution of
+        # the paths below or pointing through it, so start again.
+        if oldst and statmod.S_ISREG(oldst.st_mode):
+            newst = self.calllstat(x)
+            if newst and statmod.S_ISREG(newst.st_mode):
+                return
+        self.realpathcache = {}
 
     def normpath(self, path):
         if path in self.normpathcache:
@@ -51,7 +81,7 @@ class CachedPath(object):
     def callstat(self, path):
         path = self.normpath(path)
         self.calllstat(path)
-        return self.statcache[path]
+        return self._callstat(path)
 
     def calllstat(self, path):
         path = self.normpath(path)
@@ -71,10 +101,27 @@ class CachedPath(object):
             self.statcache[path] = False
             return False
 
+    def filetype(self, path):
+        """Return the file type bits of the lstat result of path, or 0 if it
+        doesn't exist"""
+        path = self.normpath(path)
+        lst = self.lstatcache.get(path)
+        if lst is None:
+            t = self.typecache.get(path)
+            if t is not None:
+                return t
+            lst = self.calllstat(path)
+        if not lst:
+            return 0
+        return statmod.S_IFMT(lst.st_mode)
+
     # This follows symbolic links, so both islink() and isdir() can be true
     # for the same path ono systems that support symlinks
     def isfile(self, path):
         """Test whether a path is a regular file"""
+        t = self.filetype(path)
+        if t != statmod.S_IFLNK:
+            return t == statmod.S_IFREG
         st = self.callstat(path)
         if not st:
             return False
@@ -85,6 +132,9 @@ class CachedPath(object):
     # can be true for the same path on systems that support symlinks
     def isdir(self, s):
         """Return true if the pathname refers to an existing directory."""
+        t = self.filetype(s)
+        if t != statmod.S_IFLNK:
+            return t == statmod.S_IFDIR
         st = self.callstat(s)
         if not st:
             return False
@@ -92,24 +142,22 @@ class CachedPath(object):
 
     def islink(self, path):
         """Test whether a path is a symbolic link"""
-        st = self.calllstat(path)
-        if not st:
-            return False
-        return statmod.S_ISLNK(st.st_mode)
+        return self.filetype(path) == statmod.S_IFLNK
 
     # Does a path exist?
     # This is false for dangling symbolic links on systems that support them.
     def exists(self, path):
         """Test whether a path exists.  Returns False for broken symbolic links"""
+        t = self.filetype(path)
+        if t != statmod.S_IFLNK:
+            return t != 0
         if self.callstat(path):
             return True
         return False
 
     def lexists(self, path):
         """Test whether a path exists.  Returns True for broken symbolic links"""
-        if self.calllstat(path):
-            return True
-        return False
+        return self.filetype(path) != 0
 
     # WARNING - this is not currently a drop in replacement since they return False
     # rather than raise exceptions.
@@ -121,8 +169,38 @@ class CachedPath(object):
     def lstat(self, path):
         return self.calllstat(path)
 
-    def walk(self, top, topdown=True, onerror=None, followlinks=False):
+    def readlink(self, path):
+        path = self.normpath(path)
+        if path in self.readlinkcache:
+            return self.readlinkcache[path]
+        target = os.readlink(path)
+        self.readlinkcache[path] = target
+        return target
+
+    # WARNING - this is not currently a drop in replacement since it returns
+    # False rather than raise exceptions.
+    def listdir(self, path):
+        path = self.normpath(path)
+        if path in self.listdircache:
+            return self.listdircache[path]
+        names = False
+        if self.isdir(path):
+            try:
+                names = os.listdir(path)
+            except os.error:
+                pass
+        self.listdircache[path] = names
+        return names
+
+    def walk(self, top, topdown=True, onerror=None, followlinks=False, stats=False):
         # Matches os.walk, not os.path.walk()
+        #
+        # The file types of the directory entries are taken from the
+        # d_type the kernel returns with them and added to the cache, so
+        # only symbolic links need to be stat'd. With stats set, (root,
+        # dirs, files, stats) is yielded where stats maps the names in dirs
+        # and files to their lstat results (or False if they vanished),
+        # which are added to the cache as well.
 
         # We may not have read permission for top, in which case we can't
         # get a list of the files the directory contains.  os.path.walk
@@ -130,28 +208,135 @@ class CachedPath(object):
         # minor reason when (say) a thousand readable directories are still
         # left to visit.  That logic is copied here.
         try:
-            names = os.listdir(top)
+            with os.scandir(top) as it:
+                entries = list(it)
         except os.error as err:
             if onerror is not None:
                 onerror(err)
             return
 
+        self.listdircache[self.normpath(top)] = [entry.name for entry in entries]
+
         dirs, nondirs = [], []
-        for name in names:
-            if self.isdir(os.path.join(top, name)):
-                dirs.append(name)
+        links = {}
+        entrystats = {}
+        for entry in entries:
+            path = self.normpath(entry.path)
+            try:
+                links[entry.name] = entry.is_symlink()
+                if links[entry.name]:
+                    t = statmod.S_IFLNK
+                elif entry.is_dir(follow_symlinks=False):
+                    t = statmod.S_IFDIR
+                elif entry.is_file(follow_symlinks=False):
+                    t = statmod.S_IFREG
+                else:
+                    t = None
+                # Follows symbolic links like os.walk()
+                isdir = entry.is_dir()
+            except os.error:
+                links[entry.name] = False
+                t = None
+                isdir = False
+            if t is not None:
+                self.typecache[path] = t
+
+            if stats:
+                lst = self.lstatcache.get(path)
+                if lst is None:
+                    try:
+                        lst = entry.stat(follow_symlinks=False)
+                        self.lstatcache[path] = lst
+                        if not statmod.S_ISLNK(lst.st_mode):
+                            self.statcache[path] = lst
+                    except os.error:
+                        lst = False
+                        self.lstatcache[path] = False
+                        self.statcache[path] = False
+                entrystats[entry.name] = lst
+
+            if isdir:
+                dirs.append(entry.name)
             else:
-                nondirs.append(name)
+                nondirs.append(entry.name)
 
         if topdown:
-            yield top, dirs, nondirs
+            if stats:
+                yield top, dirs, nondirs, entrystats
+            else:
+                yield top, dirs, nondirs
         for name in dirs:
             new_path = os.path.join(top, name)
-            if followlinks or not self.islink(new_path):
-                for x in self.walk(new_path, topdown, onerror, followlinks):
+            islink = links.get(name)
+            if islink is None:
+                # Added to dirs by the caller
+                islink = self.islink(new_path)
+            if followlinks or not islink:
+                for x in self.walk(new_path, topdown, onerror, followlinks, stats):
                     yield x
         if not topdown:
-            yield top, dirs, nondirs
+            if stats:
+                yield top, dirs, nondirs, entrystats
+            else:
+                yield top, dirs, nondirs
+
+    ## glob() related functions, these follow the glob module
+    def glob(self, pathname):
+        """Equivalent to glob.glob(pathname, recursive=True) but using the
+        cached directory listings and stat results"""
+        # glob.glob() drops the empty match of a leading '**'
+        return [p for p in self.__iglob(pathname, False) if p]
+
+    def __iglob(self, pathname, dironly):
+        dirname, basename = os.path.split(pathname)
+        if not glob.has_magic(pathname):
+            if basename:
+                if self.lexists(pathname):
+                    yield pathname
+            else:
+                # Patterns ending with a slash should match only directories
+                if dirname and self.isdir(dirname):
+                    yield pathname
+            return
+        if not dirname:
+            yield from self.__glob_in_dir(dirname, basename, dironly)
+            return
+        if dirname != pathname and glob.has_magic(dirname):
+            dirs = self.__iglob(dirname, True)
+        else:
+            dirs = [dirname]
+        for dirname in dirs:
+            for name in self.__glob_in_dir(dirname, basename, dironly):
+                yield os.path.join(dirname, name)
+
+    def __glob_in_dir(self, dirname, pattern, dironly):
+        if not glob.has_magic(pattern):
+            if pattern:
+                if self.lexists(os.path.join(dirname, pattern)):
+                    return [pattern]
+            elif self.isdir(dirname):
+                return [pattern]
+            return []
+        if pattern == '**':
+            return itertools.chain([''], self.__rlistdir(dirname, dironly))
+        names = self.__listdir(dirname, dironly)
+        if pattern[0] != '.':
+            names = [x for x in names if x[0] != '.']
+        return fnmatch.filter(names, pattern)
+
+    def __rlistdir(self, dirname, dironly):
+        for x in self.__listdir(dirname, dironly):
+            if x[0] != '.':
+                yield x
+                path = os.path.join(dirname, x) if dirname else x
+                for y in self.__rlistdir(path, dironly):
+                    yield os.path.join(x, y)
+
+    def __listdir(self, dirname, dironly):
+        names = self.listdir(dirname or os.curdir) or []
+        if dironly:
+            names = [x for x in names if self.isdir(os.path.join(dirname, x))]
+        return names
 
     ## realpath() related functions
     def __is_path_below(self, file, root):
@@ -181,14 +366,53 @@ class CachedPath(object):
 
         return start
 
+    def __realpath_prefix(self, file, root, loop_cnt, assume_dir):
+        """Calculates real path of 'file' below 'root' resolving every
+        component of it, like __realpath_rel(root, file). The resolved
+        parent directories are cached so files in the same directory
+        only resolve the last component."""
+        key = (file, root, assume_dir, True)
+        if key in self.realpathcache:
+            return self.realpathcache[key]
+
+        parent, name = os.path.split(file)
+        if file == root[:-1]:
+            return self.__realpath(root, root, loop_cnt, assume_dir)
+        elif len(parent) < len(root):
+            (start, have_dir) = self.__realpath(root, root, loop_cnt, assume_dir)
+        else:
+            (start, have_dir) = self.__realpath_prefix(parent, root, loop_cnt, assume_dir)
+
+        if not have_dir and not assume_dir:
+            raise OSError(errno.ENOENT, "no such directory %s" % start)
+
+        ret = self.__realpath(os.path.join(start, name), root, loop_cnt, assume_dir)
+        assert(self.__is_path_below(ret[0], root))
+        self.realpathcache[key] = ret
+        return ret
+
     def __realpath(self, file, root, loop_cnt, assume_dir):
-        while self.islink(file) and len(file) >= len(root):
+        # The resolution only depends on the path so cache it, this means
+        # each parent directory and symlink target is only resolved once.
+        # Failures are not cached and loop_cnt is only a recursion limit so
+        # a cached result is only returned for paths which resolved.
+        key = (file, root, assume_dir)
+        if key in self.realpathcache:
+            return self.realpathcache[key]
+        ret = self.__realpath_uncached(file, root, loop_cnt, assume_dir)
+        self.realpathcache[key] = ret
+        return ret
+
+    def __realpath_uncached(self, file, root, loop_cnt, assume_dir):
+        # root itself is never followed (it has a trailing '/' so
+        # os.path.islink() is False for it but our normpath() drops that)
+        while file != root and self.islink(file) and len(file) >= len(root):
             if loop_cnt == 0:
                 raise OSError(errno.ELOOP, file)
 
             loop_cnt -= 1
-            target = os.path.normpath(os.readlink(file))
-    
+            target = os.path.normpath(self.readlink(file))
+
             if not os.path.isabs(target):
                 tdir = os.path.dirname(file)
                 assert(self.__is_path_below(tdir, root))
@@ -224,7 +448,7 @@ class CachedPath(object):
 
         try:
             if use_physdir:
-                file = self.__realpath_rel(root, file[(len(root) - 1):], root, loop_cnt, assume_dir)
+                file = self.__realpath_prefix(file, root, loop_cnt, assume_dir)[0]
             else:
                 file = self.__realpath(file, root, loop_cnt, assume_dir)[0]
         except OSError as e:
@@ -12,12 +12,13 @@ import shlex
 import re
 import glob
 import stat
-import mmap
 import subprocess
 import shutil
 
 import bb.parse
 import oe.cachedpath
+import oe.packagedata
+import oe.qa
 
 def runstrip(file, elftype, strip, extra_strip_sections=''):
     # Function to strip a single file, called from split_and_strip_files below
@@ -28,6 +29,7 @@ def runstrip(file, elftype, strip, extra_strip_sections=''):
     # 4 - executable
     # 8 - shared library
     # 16 - kernel module
+    # 32 - signed kernel module
 
     newmode = None
     if not os.access(file, os.W_OK) or os.access(file, os.R_OK):
@@ -40,7 +42,7 @@ def runstrip(file, elftype, strip, extra_strip_sections=''):
     # kernel module: use --strip-debug and --preserve-dates (required for
     # module signing to remain valid after stripping)
     if elftype & 16:
-        if is_kernel_module_signed(file):
+        if elftype & 32:
             bb.debug(1, "Skip strip on signed module %s" % file)
             skip_strip = True
         else:
@@ -65,18 +67,6 @@ def runstrip(file, elftype, strip, extra_strip_sections=''):
     if newmode:
         os.chmod(file, origmode)
 
-# Detect .ko module by searching for "vermagic=" string
-def is_kernel_module(path):
-    with open(path) as f:
-        return mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ).find(b"vermagic=") >= 0
-
-# Detect if .ko module is signed
-def is_kernel_module_signed(path):
-    with open(path, "rb") as f:
-        f.seek(-28, 2)
-        module_tail = f.read()
-        return "Module signature appended" in "".join(chr(c) for c in bytearray(module_tail))
-
 # Return type (bits):
 # 0 - not elf
 # 1 - ELF
@@ -84,23 +74,49 @@ def is_kernel_module_signed(path):
 # 4 - executable
 # 8 - shared library
 # 16 - kernel module
+# 32 - signed kernel module
 def is_elf(path):
     exec_type = 0
-    result = subprocess.check_output(["file", "-b", path], stderr=subprocess.STDOUT).decode("utf-8")
-
-    if "ELF" in result:
-        exec_type |= 1
-        if "not stripped" not in result:
-            exec_type |= 2
-        if "executable" in result:
-            exec_type |= 4
-        if "shared" in result:
-            exec_type |= 8
-        if "relocatable" in result:
-            if path.endswith(".ko") and path.find("/lib/modules/") != -1 and is_kernel_module(path):
-                exec_type |= 16
+    try:
+        with oe.qa.ELFFile(path) as elf:
+            elf.open()
+            exec_type |= 1
+            if elf.isStripped():
+                exec_type |= 2
+            elftype = elf.elfType()
+            # Match the classification of file(1), which reports position
+            # independent executables as "pie executable"
+            if elftype == oe.qa.ELFFile.ET_EXEC or (elftype == oe.qa.ELFFile.ET_DYN and elf.isPIE()):
+                exec_type |= 4
+            elif elftype == oe.qa.ELFFile.ET_DYN:
+                exec_type |= 8
+            elif elftype == oe.qa.ELFFile.ET_REL:
+                if path.endswith(".ko") and path.find("/lib/modules/") != -1 and elf.data.find(b"vermagic=") >= 0:
+                    exec_type |= 16
+                    if b"Module signature appended" in elf.data[-28:]:
+                        exec_type |= 32
+    except oe.qa.NotELFFileError:
+        pass
     return (path, exec_type)
 
+def is_elf_cached(files, pool, elfcache):
+    """
+    Return the is_elf() results for files, only running it through pool for
+    the files which don't have a result in the ELF metadata cache.
+    """
+    results = []
+    uncached = []
+    for file in files:
+        elftype = elfcache.get(file, "elftype")
+        if elftype is None:
+            uncached.append(file)
+        else:
+            results.append((file, elftype))
+    for (file, elftype) in pool.map(uncached):
+        elfcache.update(file, elftype=elftype)
+        results.append((file, elftype))
+    return results
+
 def is_static_lib(path):
     if path.endswith('.a') and not os.path.islink(path):
         with open(path, 'rb') as fh:
@@ -226,59 +242,68 @@ def filedeprunner(pkg, pkgfiles, rpmdeps, pkgdest):
     dep_re = re.compile(r'\s+(\S)\s+(.*)')
     r = re.compile(r'[<>=]+\s+\S*')
 
-    def process_deps(pipe, pkg, pkgdest, provides, requires):
-        file = None
-        for line in pipe.split("\n"):
-
-            m = file_re.match(line)
-            if m:
-                file = m.group(1)
-                file = file.replace(pkgdest + "/" + pkg, "")
-                file = file_translate(file)
-                continue
-
-            m = dep_re.match(line)
-            if not m or not file:
-                continue
-
-            type, dep = m.groups()
-
-            if type == 'R':
-                i = requires
-            elif type == 'P':
-                i = provides
-            else:
-               continue
-
-            if dep.startswith("python("):
-                continue
-
-            # Ignore all perl(VMS::...) and perl(Mac::...) dependencies. These
-            # are typically used conditionally from the Perl code, but are
-            # generated as unconditional dependencies.
-            if dep.startswith('perl(VMS::') or dep.startswith('perl(Mac::'):
-                continue
-
-            # Ignore perl dependencies on .pl files.
-            if dep.startswith('perl(') and dep.endswith('.pl)'):
-                continue
+    file = None
 
-            # Remove perl versions and perl module versions since they typically
-            # do not make sense when used as package versions.
-            if dep.startswith('perl') and r.search(dep):
-                dep = dep.split()[0]
+    # Process a line of rpmdeps output, returns False if it isn't recognised
+    def process_deps(line, pkg, pkgdest, provides, requires):
+        nonlocal file
 
-            # Put parentheses around any version specifications.
-            dep = r.sub(r'(\g<0>)',dep)
+        m = file_re.match(line)
+        if m:
+            file = m.group(1)
+            file = file.replace(pkgdest + "/" + pkg, "")
+            return True
 
-            if file not in i:
-                i[file] = []
-            i[file].append(dep)
+        m = dep_re.match(line)
+        if not m or not file:
+            return False
 
-        return provides, requires
+        type, dep = m.groups()
 
-    output = subprocess.check_output(shlex.split(rpmdeps) + pkgfiles, stderr=subprocess.STDOUT).decode("utf-8")
-    provides, requires = process_deps(output, pkg, pkgdest, provides, requires)
+        if type == 'R':
+            i = requires
+        elif type == 'P':
+            i = provides
+        else:
+            return True
+
+        if dep.startswith("python("):
+            return True
+
+        # Ignore all perl(VMS::...) and perl(Mac::...) dependencies. These
+        # are typically used conditionally from the Perl code, but are
+        # generated as unconditional dependencies.
+        if dep.startswith('perl(VMS::') or dep.startswith('perl(Mac::'):
+            return True
+
+        # Ignore perl dependencies on .pl files.
+        if dep.startswith('perl(') and dep.endswith('.pl)'):
+            return True
+
+        # Remove perl versions and perl module versions since they typically
+        # do not make sense when used as package versions.
+        if dep.startswith('perl') and r.search(dep):
+            dep = dep.split()[0]
+
+        # Put parentheses around any version specifications.
+        dep = r.sub(r'(\g<0>)',dep)
+
+        if file not in i:
+            i[file] = []
+        i[file].append(dep)
+        return True
+
+    # Parse the output as it is produced rather than buffering all of it,
+    # keeping anything unexpected for the error report
+    cmd = shlex.split(rpmdeps) + pkgfiles
+    other = []
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT) as proc:
+        for line in proc.stdout:
+            line = line.decode("utf-8").rstrip("\n")
+            if not process_deps(line, pkg, pkgdest, provides, requires):
+                other.append(line)
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, output="\n".join(other).encode("utf-8"))
 
     return (pkg, provides, requires)
 
@@ -418,8 +443,12 @@ def fixup_perms(d):
                 return "%d" % id
 
     # Fix the permission, owner and group of path
-    def fix_perms(path, mode, uid, gid, dir):
-        if mode and not os.path.islink(path):
+    def fix_perms(path, mode, uid, gid, dir, st=None):
+        if st is not None:
+            islink = st and stat.S_ISLNK(st.st_mode)
+        else:
+            islink = os.path.islink(path)
+        if mode and not islink:
             #bb.note("Fixup Perms: chmod 0%o %s" % (mode, dir))
             os.chmod(path, mode)
         # -1 is a special value that means don't change the uid/gid
@@ -542,25 +571,28 @@ def fixup_perms(d):
         fix_perms(origin, fs_perms_table[dir].mode, fs_perms_table[dir].uid, fs_perms_table[dir].gid, dir)
 
         if fs_perms_table[dir].walk == 'true':
-            for root, dirs, files in os.walk(origin):
+            for root, dirs, files, stats in cpath.walk(origin, stats=True):
                 for dr in dirs:
                     each_dir = os.path.join(root, dr)
-                    fix_perms(each_dir, fs_perms_table[dir].mode, fs_perms_table[dir].uid, fs_perms_table[dir].gid, dir)
+                    fix_perms(each_dir, fs_perms_table[dir].mode, fs_perms_table[dir].uid, fs_perms_table[dir].gid, dir, stats[dr])
                 for f in files:
                     each_file = os.path.join(root, f)
-                    fix_perms(each_file, fs_perms_table[dir].fmode, fs_perms_table[dir].fuid, fs_perms_table[dir].fgid, dir)
+                    fix_perms(each_file, fs_perms_table[dir].fmode, fs_perms_table[dir].fuid, fs_perms_table[dir].fgid, dir, stats[f])
 
 # Get a list of files from file vars by searching files under current working directory
-# The list contains symlinks, directories and normal files.
-def files_from_filevars(filevars):
-    cpath = oe.cachedpath.CachedPath()
+# The list contains symlinks, directories and normal files. The globs are
+# expanded against the directory listings cached in cpath, so passing the
+# same CachedPath for several packages only reads each directory once.
+def files_from_filevars(filevars, cpath=None):
+    if cpath is None:
+        cpath = oe.cachedpath.CachedPath()
     files = []
     for f in filevars:
         if os.path.isabs(f):
             f = '.' + f
         if not f.startswith("./"):
             f = './' + f
-        globbed = glob.glob(f, recursive=True)
+        globbed = cpath.glob(f)
         if globbed:
             if [ f ] != globbed:
                 files += globbed
@@ -586,7 +618,7 @@ def files_from_filevars(filevars):
 
         if not cpath.islink(f):
             if cpath.isdir(f):
-                newfiles = [ os.path.join(f,x) for x in os.listdir(f) ]
+                newfiles = [ os.path.join(f,x) for x in cpath.listdir(f) or [] ]
                 if newfiles:
                     files += newfiles
 
@@ -798,11 +830,14 @@ def source_info(file, d, fatal=True):
 
     return list(debugsources)
 
-def splitdebuginfo(file, dvar, dv, d):
+def splitdebuginfo(file, elftype, dvar, dv, d):
     # Function to split a single file into two components, one is the stripped
     # target system binary, the other contains any debugging information. The
     # two files are linked to reference each other.
     #
+    # The elftype is the bit pattern from is_elf, signed kernel modules
+    # are left alone.
+    #
     # return a mapping of files:debugsources
 
     src = file[len(dvar):]
@@ -810,10 +845,9 @@ def splitdebuginfo(file, dvar, dv, d):
     debugfile = dvar + dest
     sources = []
 
-    if file.endswith(".ko") and file.find("/lib/modules/") != -1:
-        if oe.package.is_kernel_module_signed(file):
-            bb.debug(1, "Skip strip on signed module %s" % file)
-            return (file, sources)
+    if elftype & 32:
+        bb.debug(1, "Skip strip on signed module %s" % file)
+        return (file, sources)
 
     # Split the file...
     bb.utils.mkdirhier(os.path.dirname(debugfile))
@@ -885,6 +919,32 @@ def splitstaticdebuginfo(file, dvar, dv, d):
 
     return (file, sources)
 
+def split_and_strip_file(file, elftype, steps, dvar, dv, d):
+    # Carry a single file through the steps of process_split_and_strip_files,
+    # in order:
+    #   split - split out the debug info (splitdebuginfo)
+    #   splitstatic - copy a static library for debugging (splitstaticdebuginfo)
+    #   sources - only collect the debug source information
+    #   strip - strip the file (runstrip)
+    #   minidebuginfo - inject minidebuginfo into the stripped file
+    #
+    # return a mapping of file:debugsources, debugsources is None if the
+    # steps didn't collect them
+
+    sources = None
+    for step in steps:
+        if step == "split":
+            sources = splitdebuginfo(file, elftype, dvar, dv, d)[1]
+        elif step == "splitstatic":
+            sources = splitstaticdebuginfo(file, dvar, dv, d)[1]
+        elif step == "sources":
+            sources = source_info(file, d)
+        elif step == "strip":
+            runstrip(file, elftype, d.getVar("STRIP"))
+        elif step == "minidebuginfo":
+            inject_minidebuginfo(file, dvar, dv, d)
+    return (file, sources)
+
 def inject_minidebuginfo(file, dvar, dv, d):
     # Extract just the symbols from debuginfo into minidebuginfo,
     # compress it with xz and inject it back into the binary in a .gnu_debugdata section.
@@ -1135,6 +1195,7 @@ def read_debugsources_info(d):
 
 def process_split_and_strip_files(d):
     cpath = oe.cachedpath.CachedPath()
+    elfcache = oe.qa.elf_cache(d)
 
     dvar = d.getVar('PKGD')
     pn = d.getVar('PN')
@@ -1205,7 +1266,8 @@ def process_split_and_strip_files(d):
                     file_reference = "%d_%d" % (s.st_dev, s.st_ino)
                     checkelf[file] = (file, file_reference)
 
-        results = oe.utils.multiprocess_launch(oe.package.is_elf, checkelflinks.values(), d)
+        elfpool = oe.utils.multiprocess_pool(oe.package.is_elf, d)
+        results = is_elf_cached(checkelflinks.values(), elfpool, elfcache)
         results_map = {}
         for (ltarget, elf_file) in results:
             results_map[ltarget] = elf_file
@@ -1217,7 +1279,8 @@ def process_split_and_strip_files(d):
                 #bb.note("Sym: %s (%d)" % (ltarget, results_map[ltarget]))
                 symlinks[file] = target
 
-        results = oe.utils.multiprocess_launch(oe.package.is_elf, checkelf.keys(), d)
+        results = is_elf_cached(checkelf.keys(), elfpool, elfcache)
+        elfpool.close()
 
         # Sort results by file path. This ensures that the files are always
         # processed in the same order, which is important to make sure builds
@@ -1285,17 +1348,47 @@ def process_split_and_strip_files(d):
         return f
 
     #
-    # First lets process debug splitting
+    # Work out what needs doing to each file. Each file is then carried
+    # through debug splitting, stripping and minidebuginfo injection by
+    # one worker, largest files first so they don't hold up the end.
     #
-    if (d.getVar('INHIBIT_PACKAGE_DEBUG_SPLIT') != '1'):
-        results = oe.utils.multiprocess_launch(splitdebuginfo, list(elffiles), d, extraargs=(dvar, dv, d))
-
-        if dv["srcdir"] and not hostos.startswith("mingw"):
-            if (d.getVar('PACKAGE_DEBUG_STATIC_SPLIT') == '1'):
-                results.extend(oe.utils.multiprocess_launch(splitstaticdebuginfo, staticlibs, d, extraargs=(dvar, dv, d)))
-            else:
-                results.extend((file, source_info(file, d)) for file in staticlibs)
+    split = d.getVar('INHIBIT_PACKAGE_DEBUG_SPLIT') != '1'
+    strip = d.getVar('INHIBIT_PACKAGE_STRIP') != '1'
+    minidebuginfo = bb.utils.contains('DISTRO_FEATURES', 'minidebuginfo', True, False, d)
+
+    elfsteps = []
+    if split:
+        elfsteps.append("split")
+    if strip:
+        elfsteps.append("strip")
+    if minidebuginfo:
+        elfsteps.append("minidebuginfo")
+
+    staticsteps = []
+    if split and dv["srcdir"] and not hostos.startswith("mingw"):
+        if (d.getVar('PACKAGE_DEBUG_STATIC_SPLIT') == '1'):
+            staticsteps.append("splitstatic")
+        else:
+            staticsteps.append("sources")
+    if strip and (d.getVar('PACKAGE_STRIP_STATIC') == '1' or d.getVar('PACKAGE_DEBUG_STATIC_SPLIT') == '1'):
+        staticsteps.append("strip")
+
+    work = []
+    if elfsteps:
+        work.extend((file, int(elffiles[file]), tuple(elfsteps)) for file in elffiles)
+    if staticsteps:
+        work.extend((file, 16, tuple(staticsteps)) for file in staticlibs)
+    work.sort(key=lambda w: (-os.stat(w[0]).st_size, w[0]))
+
+    for (file, _, _) in work:
+        elfcache.invalidate(file)
+    results = oe.utils.multiprocess_launch(split_and_strip_file, work, d, extraargs=(dvar, dv, d), chunksize=1)
+    results = sorted((file, sources) for (file, sources) in results if sources is not None)
 
+    #
+    # Now the debug splitting bookkeeping
+    #
+    if split:
         d.setVar("PKGDEBUGSOURCES", {strip_pkgd_prefix(f): sorted(s) for f, s in results})
 
         sources = set()
@@ -1369,30 +1462,7 @@ def process_split_and_strip_files(d):
     # End of debug splitting
     #
 
-    #
-    # Now lets go back over things and strip them
-    #
-    if (d.getVar('INHIBIT_PACKAGE_STRIP') != '1'):
-        strip = d.getVar("STRIP")
-        sfiles = []
-        for file in elffiles:
-            elf_file = int(elffiles[file])
-            #bb.note("Strip %s" % file)
-            sfiles.append((file, elf_file, strip))
-        if (d.getVar('PACKAGE_STRIP_STATIC') == '1' or d.getVar('PACKAGE_DEBUG_STATIC_SPLIT') == '1'):
-            for f in staticlibs:
-                sfiles.append((f, 16, strip))
-
-        oe.utils.multiprocess_launch(oe.package.runstrip, sfiles, d)
-
-    # Build "minidebuginfo" and reinject it back into the stripped binaries
-    if bb.utils.contains('DISTRO_FEATURES', 'minidebuginfo', True, False, d):
-        oe.utils.multiprocess_launch(inject_minidebuginfo, list(elffiles), d,
-                                     extraargs=(dvar, dv, d))
-
-    #
-    # End of strip
-    #
+    elfcache.save()
     os.chdir(oldcwd)
 
 
@@ -1442,18 +1512,23 @@ def populate_packages(d):
     d.setVar('PACKAGES', ' '.join(packages))
     pkgdest = d.getVar('PKGDEST')
 
-    seen = []
+    # Which package each path under PKGD went to
+    owners = {}
 
     # os.mkdir masks the permissions with umask so we have to unset it first
     oldumask = os.umask(0)
 
+    # Walk relative to dvar (the current directory) so the file types
+    # cached by the walk are found by the lookups of the FILES entries below
+    installed = []
     debug = []
-    for root, dirs, files in cpath.walk(dvar):
-        dir = root[len(dvar):]
+    for root, dirs, files in cpath.walk("."):
+        dir = root[1:]
         if not dir:
             dir = os.sep
         for f in (files + dirs):
             path = "." + os.path.join(dir, f)
+            installed.append(path)
             if "/.debug/" in path or "/.debug-static/" in path or path.endswith("/.debug"):
                 debug.append(path)
 
@@ -1468,7 +1543,7 @@ def populate_packages(d):
             filesvar.replace("//", "/")
 
         origfiles = filesvar.split()
-        files, symlink_paths = oe.package.files_from_filevars(origfiles)
+        files, symlink_paths = oe.package.files_from_filevars(origfiles, cpath)
 
         if autodebug and pkg.endswith("-dbg"):
             files.extend(debug)
@@ -1476,9 +1551,9 @@ def populate_packages(d):
         for file in files:
             if (not cpath.islink(file)) and (not cpath.exists(file)):
                 continue
-            if file in seen:
+            if file in owners:
                 continue
-            seen.append(file)
+            owners[file] = pkg
 
             def mkdir(src, dest, p):
                 src = os.path.join(src, p)
@@ -1487,8 +1562,8 @@ def populate_packages(d):
                 os.mkdir(dest)
                 os.chmod(dest, fstat.st_mode)
                 os.chown(dest, fstat.st_uid, fstat.st_gid)
-                if p not in seen:
-                    seen.append(p)
+                if p not in owners:
+                    owners[p] = pkg
                 cpath.updatecache(dest)
 
             def mkdir_recurse(src, dest, paths):
@@ -1538,15 +1613,8 @@ def populate_packages(d):
             package_list.append(pkg)
     d.setVar('PACKAGES', ' '.join(package_list))
 
-    unshipped = []
-    for root, dirs, files in cpath.walk(dvar):
-        dir = root[len(dvar):]
-        if not dir:
-            dir = os.sep
-        for f in (files + dirs):
-            path = os.path.join(dir, f)
-            if ('.' + path) not in seen:
-                unshipped.append(path)
+    # PKGD hasn't changed since it was walked above
+    unshipped = [path[1:] for path in installed if path not in owners]
 
     if unshipped != []:
         msg = pn + ": Files/directories were installed but not shipped in any package:"
@@ -1602,15 +1670,53 @@ def process_fixsymlinks(pkgfiles, d):
                 rdepends[p] = []
         d.setVar('RDEPENDS:' + pkg, bb.utils.join_deps(rdepends, commasep=False))
 
+def filedeps_batches(filesizes, nproc, maxfiles=1000, maxargs=128 * 1024):
+    """
+    Split the files of each package into batches for rpmdeps, given a dict
+    of package to a list of (file, size) tuples.
+
+    rpmdeps' run time mostly depends on the amount of data it has to scan,
+    so batches are sized to spread the total size of all files over a few
+    batches per CPU. Batches are also limited in the number of files and
+    the length of the command line. Returns a list of (pkg, files) tuples.
+    """
+    total = sum(size for files in filesizes.values() for (_, size) in files)
+    target = max(total // (nproc * 4), 1024 * 1024)
+
+    batches = []
+    for pkg in filesizes:
+        batch = []
+        batchsize = 0
+        batchargs = 0
+        for (file, size) in filesizes[pkg]:
+            if batch and (batchsize + size > target or len(batch) >= maxfiles or batchargs + len(file) + 1 > maxargs):
+                batches.append((pkg, batch))
+                batch = []
+                batchsize = 0
+                batchargs = 0
+            batch.append(file)
+            batchsize += size
+            batchargs += len(file) + 1
+        if batch:
+            batches.append((pkg, batch))
+    return batches
+
+def read_filedeps(d, pkg):
+    """
+    Returns the per file run-time dependencies of pkg from
+    PKGDESTWORK/filedeps/<pkg>.json, see oe.packagedata.read_filedeps_file()
+    """
+    return oe.packagedata.read_filedeps_file(d.expand("${PKGDESTWORK}/filedeps/%s.json" % pkg))
+
+def save_filedeps(d, pkg, filedeps):
+    oe.packagedata.write_filedeps_file(d.expand("${PKGDESTWORK}/filedeps/%s.json" % pkg), filedeps)
+
 def process_filedeps(pkgfiles, d):
     """
     Collect perfile run-time dependency metadata
     Output:
-     FILERPROVIDESFLIST:pkg - list of all files w/ deps
-     FILERPROVIDES:filepath:pkg - per file dep
-
-      FILERDEPENDSFLIST:pkg - list of all files w/ deps
-      FILERDEPENDS:filepath:pkg - per file dep
+     PKGDESTWORK/filedeps/<pkg>.json - the provides and requires of each
+     file with dependencies, see read_filedeps()
     """
     if d.getVar('SKIP_FILEDEPS') == '1':
         return
@@ -1619,45 +1725,45 @@ def process_filedeps(pkgfiles, d):
     packages = d.getVar('PACKAGES')
     rpmdeps = d.getVar('RPMDEPS')
 
-    def chunks(files, n):
-        return [files[i:i+n] for i in range(0, len(files), n)]
-
-    pkglist = []
+    filesizes = {}
     for pkg in packages.split():
         if d.getVar('SKIP_FILEDEPS:' + pkg) == '1':
             continue
         if pkg.endswith('-dbg') or pkg.endswith('-doc') or pkg.find('-locale-') != -1 or pkg.find('-localedata-') != -1 or pkg.find('-gconv-') != -1 or pkg.find('-charmap-') != -1 or pkg.startswith('kernel-module-') or pkg.endswith('-src'):
             continue
-        for files in chunks(pkgfiles[pkg], 100):
-            pkglist.append((pkg, files, rpmdeps, pkgdest))
+        filesizes[pkg] = []
+        for file in pkgfiles[pkg]:
+            try:
+                size = os.lstat(file).st_size
+            except OSError:
+                size = 0
+            filesizes[pkg].append((file, size))
 
-    processed = oe.utils.multiprocess_launch(oe.package.filedeprunner, pkglist, d)
+    pkglist = []
+    for (pkg, files) in filedeps_batches(filesizes, oe.utils.get_bb_number_threads(d)):
+        pkglist.append((pkg, files, rpmdeps, pkgdest))
 
     provides_files = {}
     requires_files = {}
 
-    for result in processed:
+    for result in oe.utils.multiprocess_launch(oe.package.filedeprunner, pkglist, d):
         (pkg, provides, requires) = result
 
-        if pkg not in provides_files:
-            provides_files[pkg] = []
-        if pkg not in requires_files:
-            requires_files[pkg] = []
+        for file in provides:
+            provides_files.setdefault(pkg, {}).setdefault(file, []).extend(provides[file])
+        for file in requires:
+            requires_files.setdefault(pkg, {}).setdefault(file, []).extend(requires[file])
 
-        for file in sorted(provides):
-            provides_files[pkg].append(file)
-            key = "FILERPROVIDES:" + file + ":" + pkg
-            d.appendVar(key, " " + " ".join(provides[file]))
-
-        for file in sorted(requires):
-            requires_files[pkg].append(file)
-            key = "FILERDEPENDS:" + file + ":" + pkg
-            d.appendVar(key, " " + " ".join(requires[file]))
+    for pkg in filesizes:
+        if not filesizes[pkg]:
+            continue
 
-    for pkg in requires_files:
-        d.setVar("FILERDEPENDSFLIST:" + pkg, " ".join(sorted(requires_files[pkg])))
-    for pkg in provides_files:
-        d.setVar("FILERPROVIDESFLIST:" + pkg, " ".join(sorted(provides_files[pkg])))
+        # Keep any file dependencies already added by other functions
+        filedeps = read_filedeps(d, pkg)
+        for key, files in (("provides", provides_files.get(pkg, {})), ("requires", requires_files.get(pkg, {}))):
+            for file in files:
+                filedeps[key].setdefault(file, []).extend(files[file])
+        save_filedeps(d, pkg, filedeps)
 
 def process_shlibs(pkgfiles, d):
     cpath = oe.cachedpath.CachedPath()
@@ -1697,30 +1803,30 @@ def process_shlibs(pkgfiles, d):
 
     shlibswork_dir = d.getVar('SHLIBSWORKDIR')
 
-    def linux_so(file, pkg, pkgver, d):
+    def linux_so(file, dynamic, pkg, pkgver, d):
         needs_ldconfig = False
         needed = set()
         sonames = set()
         ldir = os.path.dirname(file).replace(pkgdest + "/" + pkg, '')
-        cmd = d.getVar('OBJDUMP') + " -p " + shlex.quote(file) + " 2>/dev/null"
-        fd = os.popen(cmd)
-        lines = fd.readlines()
-        fd.close()
+        if dynamic is None:
+            try:
+                with oe.qa.ELFFile(file) as elf:
+                    elf.open()
+                    dynamic = elf.dynamic()
+            except oe.qa.NotELFFileError:
+                dynamic = []
         rpath = tuple()
-        for l in lines:
-            m = re.match(r"\s+RPATH\s+([^\s]*)", l)
-            if m:
-                rpaths = m.group(1).replace("$ORIGIN", ldir).split(":")
+        for (tag, val) in dynamic:
+            if tag == oe.qa.ELFFile.DT_RPATH:
+                rpaths = val.replace("$ORIGIN", ldir).split(":")
                 rpath = tuple(map(os.path.normpath, rpaths))
-        for l in lines:
-            m = re.match(r"\s+NEEDED\s+([^\s]*)", l)
-            if m:
-                dep = m.group(1)
+        for (tag, val) in dynamic:
+            if tag == oe.qa.ELFFile.DT_NEEDED:
+                dep = val
                 if dep not in needed:
                     needed.add((dep, file, rpath))
-            m = re.match(r"\s+SONAME\s+([^\s]*)", l)
-            if m:
-                this_soname = m.group(1)
+            elif tag == oe.qa.ELFFile.DT_SONAME:
+                this_soname = val
                 prov = (this_soname, ldir, pkgver)
                 if not prov in sonames:
                     # if library is private (only used by package) then do not build shlib for it
@@ -1728,7 +1834,7 @@ def process_shlibs(pkgfiles, d):
                         sonames.add(prov)
                 if libdir_re.match(os.path.dirname(file)):
                     needs_ldconfig = True
-        return (needs_ldconfig, needed, sonames)
+        return (needs_ldconfig, needed, sonames, file, dynamic)
 
     def darwin_so(file, needed, sonames, pkgver):
         if not os.path.exists(file):
@@ -1804,6 +1910,7 @@ def process_shlibs(pkgfiles, d):
     needed = {}
 
     shlib_provider = oe.package.read_shlib_providers(d)
+    elfcache = oe.qa.elf_cache(d)
 
     for pkg in shlib_pkgs:
         private_libs = d.getVar('PRIVATE_LIBS:' + pkg) or d.getVar('PRIVATE_LIBS') or ""
@@ -1829,7 +1936,7 @@ def process_shlibs(pkgfiles, d):
                 elif hostos.startswith("mingw"):
                     mingw_dll(file, needed, sonames, pkgver)
                 elif os.access(file, os.X_OK) or lib_re.match(file):
-                    linuxlist.append(file)
+                    linuxlist.append((file, elfcache.get(file, "dynamic")))
 
         if linuxlist:
             results = oe.utils.multiprocess_launch(linux_so, linuxlist, d, extraargs=(pkg, pkgver, d))
@@ -1838,6 +1945,7 @@ def process_shlibs(pkgfiles, d):
                 needed[pkg] |= r[1]
                 sonames |= r[2]
                 needs_ldconfig = needs_ldconfig or ldconfig
+                elfcache.update(r[3], dynamic=r[4])
 
         shlibs_file = os.path.join(shlibswork_dir, pkg + ".list")
         if len(sonames):
@@ -1861,6 +1969,8 @@ def process_shlibs(pkgfiles, d):
             d.setVar('pkg_postinst:%s' % pkg, postinst)
         bb.debug(1, 'LIBNAMES: pkg %s sonames %s' % (pkg, sonames))
 
+    elfcache.save()
+
     assumed_libs = d.getVar('ASSUME_SHLIBS')
     if assumed_libs:
         libdir = d.getVar("libdir")
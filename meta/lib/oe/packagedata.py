@@ -41,8 +41,25 @@ def get_subpkgedata_fn(pkg, d):
 def has_subpkgdata(pkg, d):
     return os.access(get_subpkgedata_fn(pkg, d), os.R_OK)
 
+# The open oe.pkgdataindex.PkgdataIndex by (pid, PKGDATA_DIR), SQLite
+# connections can't be shared with forked processes
+_indexes = {}
+
+def get_index(d):
+    """
+    Returns the oe.pkgdataindex.PkgdataIndex of PKGDATA_DIR. The index
+    checks the pkgdata files for changes on every lookup, so it stays
+    current for as long as the process keeps it open
+    """
+    import oe.pkgdataindex
+
+    key = (os.getpid(), d.getVar("PKGDATA_DIR"))
+    if key not in _indexes:
+        _indexes[key] = oe.pkgdataindex.open_index(key[1])
+    return _indexes[key]
+
 def read_subpkgdata(pkg, d):
-    return read_pkgdatafile(get_subpkgedata_fn(pkg, d))
+    return get_index(d).read_subpkgdata(pkg)
 
 def has_pkgdata(pn, d):
     fn = d.expand('${PKGDATA_DIR}/%s' % pn)
@@ -57,7 +74,7 @@ def read_pkgdata(pn, d):
 #
 def read_subpkgdata_dict(pkg, d):
     ret = {}
-    subd = read_pkgdatafile(get_subpkgedata_fn(pkg, d))
+    subd = read_subpkgdata(pkg, d)
     for var in subd:
         newvar = var.replace(":" + pkg, "")
         if newvar == var and var + ":" + pkg in subd:
@@ -78,29 +95,42 @@ def read_subpkgdata_extended(pkg, d):
     except FileNotFoundError:
         return None
 
+def read_filedeps_file(fn):
+    """
+    Read the per file run-time dependencies of a package saved with
+    write_filedeps_file(). Returns a dictionary with "provides" and
+    "requires" keys, each mapping the paths of the files in the package
+    to their lists of dependencies.
+    """
+    try:
+        with open(fn, "r") as f:
+            filedeps = json.load(f)
+    except FileNotFoundError:
+        filedeps = {}
+    filedeps.setdefault("provides", {})
+    filedeps.setdefault("requires", {})
+    return filedeps
+
+def write_filedeps_file(fn, filedeps):
+    if not filedeps["provides"] and not filedeps["requires"]:
+        bb.utils.remove(fn)
+        return
+    bb.utils.mkdirhier(os.path.dirname(fn))
+    with open(fn, "w") as f:
+        json.dump(filedeps, f, sort_keys=True, separators=(",", ":"))
+
+def read_subpkgdata_filedeps(pkg, d):
+    return read_filedeps_file(d.expand("${PKGDATA_DIR}/filedeps/%s.json" % pkg))
+
 def _pkgmap(d):
     """Return a dictionary mapping package to recipe name."""
 
     pkgdatadir = d.getVar("PKGDATA_DIR")
-
-    pkgmap = {}
-    try:
-        files = os.listdir(pkgdatadir)
-    except OSError:
+    if not os.path.isdir(pkgdatadir):
         bb.warn("No files in %s?" % pkgdatadir)
-        files = []
-
-    for pn in [f for f in files if not os.path.isdir(os.path.join(pkgdatadir, f))]:
-        try:
-            pkgdata = read_pkgdatafile(os.path.join(pkgdatadir, pn))
-        except OSError:
-            continue
-
-        packages = pkgdata.get("PACKAGES") or ""
-        for pkg in packages.split():
-            pkgmap[pkg] = pn
+        return {}
 
-    return pkgmap
+    return get_index(d).pkgmap()
 
 def pkgmap(d):
     """Return a dictionary mapping package to recipe name.
@@ -116,15 +146,10 @@ def pkgmap(d):
 def recipename(pkg, d):
     """Return the recipe name for the given binary package name."""
 
-    return pkgmap(d).get(pkg)
+    return get_index(d).recipe(pkg)
 
 def foreach_runtime_provider_pkgdata(d, rdep, include_rdep=False):
-    pkgdata_dir = d.getVar("PKGDATA_DIR")
-    possibles = set()
-    try:
-        possibles |= set(os.listdir("%s/runtime-rprovides/%s/" % (pkgdata_dir, rdep)))
-    except OSError:
-        pass
+    possibles = set(get_index(d).rproviders(rdep))
 
     if include_rdep:
         possibles.add(rdep)
@@ -249,6 +274,8 @@ fi
                 with open(subdata_file, 'w') as fd:
                     fd.write("PKG:%s: %s" % (ml_pkg, pkg))
 
+    import oe.package
+
     packages = d.getVar('PACKAGES')
     pkgdest = d.getVar('PKGDEST')
     pkgdatadir = d.getVar('PKGDESTWORK')
@@ -314,16 +341,20 @@ fi
             for var in (d.getVar('PKGDATA_VARS') or "").split():
                 val = write_if_exists(sf, pkg, var)
 
-            write_if_exists(sf, pkg, 'FILERPROVIDESFLIST')
-            for dfile in sorted((d.getVar('FILERPROVIDESFLIST:' + pkg) or "").split()):
-                write_if_exists(sf, pkg, 'FILERPROVIDES:' + dfile)
-
-            write_if_exists(sf, pkg, 'FILERDEPENDSFLIST')
-            for dfile in sorted((d.getVar('FILERDEPENDSFLIST:' + pkg) or "").split()):
-                write_if_exists(sf, pkg, 'FILERDEPENDS:' + dfile)
-
             sf.write('%s:%s: %d\n' % ('PKGSIZE', pkg, total_size))
 
+        # The per file dependencies are kept in filedeps/<pkg>.json, add any
+        # which were set with the FILERPROVIDES:file:pkg and
+        # FILERDEPENDS:file:pkg variables
+        filedeps_file = pkgdatadir + "/filedeps/%s.json" % pkg
+        filedeps = read_filedeps_file(filedeps_file)
+        for key, var in (("provides", "FILERPROVIDES"), ("requires", "FILERDEPENDS")):
+            for dfile in (d.getVar("%sFLIST:%s" % (var, pkg)) or "").split():
+                deps = filedeps[key].setdefault(oe.package.file_reverse_translate(dfile), [])
+                for dep, versions in bb.utils.explode_dep_versions2(d.getVar("%s:%s:%s" % (var, dfile, pkg)) or "").items():
+                    deps.extend(["%s (%s)" % (dep, v) for v in versions] or [dep])
+        write_filedeps_file(filedeps_file, filedeps)
+
         subdata_extended_file = pkgdatadir + "/extended/%s.json.zstd" % pkg
         num_threads = int(d.getVar("BB_NUMBER_THREADS"))
         with bb.compress.zstd.open(subdata_extended_file, "wt", encoding="utf-8", num_threads=num_threads) as f:
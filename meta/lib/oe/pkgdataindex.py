@@ -0,0 +1,319 @@
+#
+# Copyright OpenEmbedded Contributors
+#
+# SPDX-License-Identifier: GPL-2.0-only
+#
+
+"""
+An index of the pkgdata files in PKGDATA_DIR, kept in a SQLite database in
+PKGDATA_DIR/.index so that packages can be looked up by name, runtime
+provider or file path without reading the pkgdata of every recipe.
+
+The index is refreshed from the pkgdata files whenever it is opened and
+before every lookup: the recipes whose PKGDATA_DIR/<pn> file or runtime
+files of their packages have changed since they were indexed are read again
+and the ones which have been removed are dropped. The files are only checked
+when PKGDATA_DIR or PKGDATA_DIR/runtime has changed, which is the case
+whenever pkgdata is installed or removed. This keeps it current whether the
+pkgdata was written by do_packagedata, installed from sstate or cleaned,
+also for long lived processes, and the pkgdata files remain the reference.
+The index is only locked for writing when something has changed.
+"""
+
+import contextlib
+import json
+import os
+import sqlite3
+import stat
+import time
+
+import bb
+import bb.utils
+import oe.packagedata
+
+INDEX_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE recipes (pn TEXT PRIMARY KEY, key TEXT NOT NULL);
+CREATE TABLE packages (pkg TEXT PRIMARY KEY, pn TEXT NOT NULL, key TEXT, data TEXT);
+CREATE INDEX packages_pn ON packages (pn);
+CREATE TABLE names (name TEXT NOT NULL, pkg TEXT NOT NULL, pn TEXT NOT NULL);
+CREATE INDEX names_name ON names (name);
+CREATE INDEX names_pn ON names (pn);
+CREATE TABLE rprovides (rprovide TEXT NOT NULL, pkg TEXT NOT NULL, pn TEXT NOT NULL);
+CREATE INDEX rprovides_rprovide ON rprovides (rprovide);
+CREATE INDEX rprovides_pn ON rprovides (pn);
+CREATE TABLE files (path TEXT NOT NULL, pkg TEXT NOT NULL, pn TEXT NOT NULL);
+CREATE INDEX files_path ON files (path);
+CREATE INDEX files_pn ON files (pn);
+"""
+
+TABLES = ("recipes", "packages", "names", "rprovides", "files")
+
+
+def file_key(path):
+    """
+    Returns a string identifying the current contents of a regular file, or
+    None if it isn't one
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return "%d:%d:%d:%d:%d" % (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+
+
+def recipe_key(pnkey, packages):
+    """
+    Returns a string identifying the pkgdata of a recipe, from the key of
+    its PKGDATA_DIR/<pn> file and (pkg, runtime key, packaged) tuples for
+    its packages
+    """
+    return " ".join([pnkey] + ["%s=%s%s" % (pkg, key or "", packaged and "+" or "")
+                               for (pkg, key, packaged) in packages])
+
+
+class PkgdataIndex(object):
+    def __init__(self, pkgdata_dir, path=None):
+        self.pkgdata_dir = pkgdata_dir
+        # The stamp of the pkgdata directories when the index was last known
+        # to be current
+        self.stamp = None
+        if path is None:
+            path = os.path.join(pkgdata_dir, ".index", "pkgdata.db")
+            bb.utils.mkdirhier(os.path.dirname(path))
+        self.db = sqlite3.connect(path, timeout=300, isolation_level=None)
+        # Switching to WAL needs a write lock, so only do it the first time
+        if path != ":memory:" and self.db.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+            self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+
+        if self._version() != INDEX_VERSION:
+            with self._transaction():
+                if self._version() != INDEX_VERSION:
+                    for table in TABLES:
+                        self.db.execute("DROP TABLE IF EXISTS %s" % table)
+                    for statement in SCHEMA.strip().split(";\n"):
+                        self.db.execute(statement)
+                    self.db.execute("PRAGMA user_version=%d" % INDEX_VERSION)
+
+        self.refresh()
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excinfo):
+        self.close()
+
+    def _version(self):
+        return self.db.execute("PRAGMA user_version").fetchone()[0]
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # Only one process at a time updates the index
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+    def _stamp(self):
+        """
+        Returns the keys of PKGDATA_DIR and PKGDATA_DIR/runtime, which change
+        whenever pkgdata is installed or removed, or None if they can't be
+        relied on yet
+        """
+        stamp = []
+        for path in (self.pkgdata_dir, os.path.join(self.pkgdata_dir, "runtime")):
+            try:
+                st = os.stat(path)
+            except OSError:
+                stamp.append(None)
+                continue
+            # Another change within the timestamp granularity of the
+            # filesystem wouldn't change the mtime again
+            if time.time() - st.st_mtime < 1:
+                return None
+            stamp.append((st.st_dev, st.st_ino, st.st_mtime_ns, st.st_ctime_ns))
+        return tuple(stamp)
+
+    def _runtime_key(self, pkg):
+        fn = os.path.join(self.pkgdata_dir, "runtime", pkg)
+        return (pkg, file_key(fn), os.path.exists(fn + ".packaged"))
+
+    def _recipe_keys(self):
+        """
+        Returns the keys of the PKGDATA_DIR/<pn> files and the runtime files
+        of the packages they had when they were indexed
+        """
+        pnkeys = {}
+        try:
+            names = os.listdir(self.pkgdata_dir)
+        except OSError:
+            names = []
+        for pn in names:
+            key = file_key(os.path.join(self.pkgdata_dir, pn))
+            if key:
+                pnkeys[pn] = key
+
+        packages = {}
+        for pn, pkg in self.db.execute("SELECT pn, pkg FROM packages"):
+            packages.setdefault(pn, []).append(pkg)
+
+        keys = {}
+        for pn, pnkey in pnkeys.items():
+            keys[pn] = recipe_key(pnkey, [self._runtime_key(pkg) for pkg in sorted(packages.get(pn, []))])
+        return keys, pnkeys
+
+    def _changes(self, keys):
+        indexed = dict(self.db.execute("SELECT pn, key FROM recipes"))
+        removed = indexed.keys() - keys.keys()
+        changed = [pn for pn, key in keys.items() if indexed.get(pn) != key]
+        return removed, changed
+
+    def refresh(self):
+        """
+        Index the recipes whose pkgdata has changed since they were last
+        indexed and drop the ones which have been removed
+        """
+        stamp = self._stamp()
+        if stamp is not None and stamp == self.stamp:
+            return
+
+        keys, pnkeys = self._recipe_keys()
+        removed, changed = self._changes(keys)
+        if removed or changed:
+            # Read the pkgdata before taking the write lock so that other
+            # processes only wait while the rows are written
+            packages = dict((pn, self._read_recipe(pn)) for pn in changed)
+            with self._transaction():
+                # Another process may have done the work in the meantime
+                removed, changed = self._changes(keys)
+                for pn in removed:
+                    self._remove_recipe(pn)
+                for pn in changed:
+                    self._remove_recipe(pn)
+                    if pn not in packages:
+                        packages[pn] = self._read_recipe(pn)
+                    key = recipe_key(pnkeys[pn], [(pkg, key, packaged) for (pkg, key, _, packaged) in packages[pn]])
+                    self._add_recipe(pn, key, packages[pn])
+        self.stamp = stamp
+
+    def _remove_recipe(self, pn):
+        for table in TABLES:
+            self.db.execute("DELETE FROM %s WHERE pn = ?" % table, (pn,))
+
+    def _read_recipe(self, pn):
+        """
+        Returns a (pkg, key, data, packaged) tuple for each package of the
+        recipe, data is None if it doesn't have runtime pkgdata
+        """
+        pkgdata = oe.packagedata.read_pkgdatafile(os.path.join(self.pkgdata_dir, pn))
+        packages = []
+        for pkg in sorted(set((pkgdata.get("PACKAGES") or "").split())):
+            (_, key, packaged) = self._runtime_key(pkg)
+            fn = os.path.join(self.pkgdata_dir, "runtime", pkg)
+            data = oe.packagedata.read_pkgdatafile(fn) if key else None
+            packages.append((pkg, key, data, packaged))
+        return packages
+
+    def _add_recipe(self, pn, key, packages):
+        self.db.execute("INSERT INTO recipes VALUES (?, ?)", (pn, key))
+        for (pkg, key, data, packaged) in packages:
+            self._add_package(pn, pkg, key, data, packaged)
+
+    def _add_package(self, pn, pkg, key, data, packaged):
+        self.db.execute("INSERT OR REPLACE INTO packages VALUES (?, ?, ?, ?)",
+                        (pkg, pn, key, json.dumps(data) if data is not None else None))
+        if data is None:
+            return
+
+        # The same links as emit_pkgdata() creates in runtime-reverse and
+        # runtime-rprovides
+        if packaged:
+            name = data.get("PKG:%s" % pkg) or pkg
+            self.db.execute("INSERT INTO names VALUES (?, ?, ?)", (name, pkg, pn))
+
+        rprovides = data.get("RPROVIDES:%s" % pkg) or data.get("RPROVIDES")
+        if rprovides:
+            self.db.executemany("INSERT INTO rprovides VALUES (?, ?, ?)",
+                                ((p, pkg, pn) for p in bb.utils.explode_deps(rprovides)))
+
+        files = data.get("FILES_INFO:%s" % pkg)
+        if files:
+            self.db.executemany("INSERT INTO files VALUES (?, ?, ?)",
+                                ((path, pkg, pn) for path in json.loads(files)))
+
+    def read_subpkgdata(self, pkg):
+        """
+        Returns the same as oe.packagedata.read_pkgdatafile() for the runtime
+        pkgdata file of pkg. The file is only read if it has changed since
+        it was indexed.
+        """
+        fn = os.path.join(self.pkgdata_dir, "runtime", pkg)
+        key = file_key(fn)
+        if key is None:
+            return {}
+        row = self.db.execute("SELECT key, data FROM packages WHERE pkg = ?", (pkg,)).fetchone()
+        if row and row[0] == key:
+            return json.loads(row[1])
+        return oe.packagedata.read_pkgdatafile(fn)
+
+    def recipe(self, pkg):
+        """
+        Returns the name of the recipe which created pkg, or None
+        """
+        self.refresh()
+        row = self.db.execute("SELECT pn FROM packages WHERE pkg = ?", (pkg,)).fetchone()
+        return row[0] if row else None
+
+    def pkgmap(self):
+        """
+        Returns a dictionary mapping each package to its recipe name
+        """
+        self.refresh()
+        return dict(self.db.execute("SELECT pkg, pn FROM packages"))
+
+    def reverse(self, name):
+        """
+        Returns the sorted packages which are packaged with the runtime
+        package name, the equivalent of PKGDATA_DIR/runtime-reverse/<name>
+        """
+        self.refresh()
+        return sorted(r[0] for r in self.db.execute("SELECT pkg FROM names WHERE name = ?", (name,)))
+
+    def rproviders(self, rprovide):
+        """
+        Returns the sorted packages which have rprovide in their RPROVIDES,
+        the equivalent of listing PKGDATA_DIR/runtime-rprovides/<rprovide>
+        """
+        self.refresh()
+        return sorted(set(r[0] for r in self.db.execute("SELECT pkg FROM rprovides WHERE rprovide = ?", (rprovide,))))
+
+    def file_owners(self, path):
+        """
+        Returns the sorted packages which contain path, as listed in their
+        FILES_INFO
+        """
+        self.refresh()
+        return sorted(set(r[0] for r in self.db.execute("SELECT pkg FROM files WHERE path = ?", (path,))))
+
+
+def open_index(pkgdata_dir):
+    """
+    Open the index of pkgdata_dir. If it can't be stored there, for example
+    because the directory is read only, a temporary index in memory is used.
+    """
+    if os.path.isdir(pkgdata_dir):
+        try:
+            return PkgdataIndex(pkgdata_dir)
+        except (OSError, sqlite3.Error) as e:
+            bb.debug(1, "Unable to use the pkgdata index in %s: %s" % (pkgdata_dir, e))
+    return PkgdataIndex(pkgdata_dir, ":memory:")
@@ -19,6 +19,7 @@ class ELFFile:
     EI_OSABI      = 7
     EI_ABIVERSION = 8
 
+    E_TYPE       = 0x10
     E_MACHINE    = 0x12
 
     # possible values for EI_CLASS
@@ -34,17 +35,40 @@ class ELFFile:
     EI_DATA_LSB  = 1
     EI_DATA_MSB  = 2
 
-    PT_INTERP = 3
+    # possible values for e_type
+    ET_REL  = 1
+    ET_EXEC = 2
+    ET_DYN  = 3
+
+    PT_LOAD    = 1
+    PT_DYNAMIC = 2
+    PT_INTERP  = 3
+
+    SHT_SYMTAB  = 2
+    SHT_STRTAB  = 3
+    SHT_DYNAMIC = 6
+
+    DT_NULL    = 0
+    DT_NEEDED  = 1
+    DT_STRTAB  = 5
+    DT_SONAME  = 14
+    DT_RPATH   = 15
+    DT_RUNPATH = 29
+    DT_FLAGS_1 = 0x6ffffffb
+
+    DF_1_PIE = 0x08000000
 
     def my_assert(self, expectation, result):
         if not expectation == result:
             #print "'%x','%x' %s" % (ord(expectation), ord(result), self.name)
             raise NotELFFileError("%s is not an ELF" % self.name)
 
-    def __init__(self, name):
+    def __init__(self, name, cache=None):
         self.name = name
         self.objdump_output = {}
         self.data = None
+        self._dynamic = None
+        self.cache = cache
 
     # Context Manager functions to close the mmap explicitly
     def __enter__(self):
@@ -56,8 +80,30 @@ class ELFFile:
     def close(self):
         if self.data:
             self.data.close()
+            self.data = None
+
+    # The mmap can't be pickled, so it isn't carried over when an ELFFile
+    # is passed to a worker process. The file can be reopened there. The
+    # cache stays with the parent which records the results.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["data"] = None
+        state["cache"] = None
+        return state
 
     def open(self):
+        if self.cache and self.cache.get(self.name, "notelf"):
+            raise NotELFFileError("%s is not an ELF" % self.name)
+        try:
+            self._open()
+        except NotELFFileError:
+            if self.cache:
+                self.cache.update(self.name, notelf=True)
+            raise
+        if self.cache:
+            self.cache.update(self.name, elfclass=self.bits, machine=self.machine())
+
+    def _open(self):
         with open(self.name, "rb") as f:
             try:
                 self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
@@ -117,15 +163,27 @@ class ELFFile:
         Return True if there is a .interp segment (therefore dynamically
         linked), otherwise False (statically linked).
         """
-        offset = self.getWord(self.bits == 32 and 0x1C or 0x20)
-        size = self.getShort(self.bits == 32 and 0x2A or 0x36)
-        count = self.getShort(self.bits == 32 and 0x2C or 0x38)
+        return self.interpreter() is not None
 
-        for i in range(0, count):
-            p_type = self.getWord(offset + i * size)
-            if p_type == ELFFile.PT_INTERP:
-                return True
-        return False
+    def elfType(self):
+        """
+        Return the e_type field (ET_REL, ET_EXEC, ET_DYN, ...)
+        """
+        return self.getShort(ELFFile.E_TYPE)
+
+    def isStripped(self):
+        """
+        Return True if there is no symbol table section, which is how
+        file(1) decides whether to report a file as stripped.
+        """
+        return not any(sh[1] == ELFFile.SHT_SYMTAB for sh in self.section_headers())
+
+    def isPIE(self):
+        """
+        Return True if the object is a position independent executable
+        (DF_1_PIE is set in DT_FLAGS_1)
+        """
+        return any(tag == ELFFile.DT_FLAGS_1 and val & ELFFile.DF_1_PIE for (tag, val) in self.dynamic())
 
     def machine(self):
         """
@@ -134,8 +192,172 @@ class ELFFile:
         """
         return self.getShort(ELFFile.E_MACHINE)
 
+    def _unpack(self, fmt, offset):
+        try:
+            return struct.unpack_from(self.getStructEndian() + fmt, self.data, offset)
+        except struct.error:
+            raise NotELFFileError("%s is truncated or corrupt" % self.name)
+
+    def _string(self, offset):
+        end = self.data.find(b"\0", offset)
+        if end < 0:
+            end = len(self.data)
+        return self.data[offset:end].decode("utf-8", errors="surrogateescape")
+
+    def program_headers(self):
+        """
+        Return a list of the program headers as (p_type, p_offset, p_vaddr,
+        p_filesz) tuples.
+        """
+        if self.bits == 32:
+            (phoff,) = self._unpack("I", 0x1C)
+            (phentsize, phnum) = self._unpack("HH", 0x2A)
+        else:
+            (phoff,) = self._unpack("Q", 0x20)
+            (phentsize, phnum) = self._unpack("HH", 0x36)
+
+        headers = []
+        for i in range(0, phnum):
+            offset = phoff + i * phentsize
+            if self.bits == 32:
+                (p_type, p_offset, p_vaddr, _, p_filesz) = self._unpack("IIIII", offset)
+            else:
+                (p_type, _, p_offset, p_vaddr, _, p_filesz) = self._unpack("IIQQQQ", offset)
+            headers.append((p_type, p_offset, p_vaddr, p_filesz))
+        return headers
+
+    def section_headers(self):
+        """
+        Return a list of the section headers as (name, sh_type, sh_offset,
+        sh_size, sh_link) tuples.
+        """
+        if self.bits == 32:
+            (shoff,) = self._unpack("I", 0x20)
+            (shentsize, shnum, shstrndx) = self._unpack("HHH", 0x2E)
+        else:
+            (shoff,) = self._unpack("Q", 0x28)
+            (shentsize, shnum, shstrndx) = self._unpack("HHH", 0x3A)
+        if not shoff:
+            return []
+
+        raw = []
+        for i in range(0, shnum):
+            offset = shoff + i * shentsize
+            if self.bits == 32:
+                (sh_name, sh_type, _, _, sh_offset, sh_size, sh_link) = self._unpack("IIIIIII", offset)
+            else:
+                (sh_name, sh_type, _, _, sh_offset, sh_size, sh_link) = self._unpack("IIQQQQI", offset)
+            raw.append((sh_name, sh_type, sh_offset, sh_size, sh_link))
+
+        strtab = None
+        if shstrndx < len(raw):
+            strtab = raw[shstrndx][2]
+        return [(strtab is not None and self._string(strtab + r[0]) or "",) + r[1:] for r in raw]
+
+    def _vaddr_to_offset(self, vaddr):
+        for (p_type, p_offset, p_vaddr, p_filesz) in self.program_headers():
+            if p_type == ELFFile.PT_LOAD and p_vaddr <= vaddr < p_vaddr + p_filesz:
+                return vaddr - p_vaddr + p_offset
+        return None
+
+    def dynamic(self):
+        """
+        Return the entries of the dynamic section as a list of (d_tag,
+        d_val) tuples, with the values of string entries (NEEDED, SONAME,
+        RPATH, RUNPATH) already looked up in the dynamic string table.
+        Returns an empty list for files without a dynamic section.
+        """
+        if self._dynamic is not None:
+            return self._dynamic
+        if self.cache:
+            cached = self.cache.get(self.name, "dynamic")
+            if cached is not None:
+                self._dynamic = [tuple(e) for e in cached]
+                return self._dynamic
+
+        # Prefer the section table as objdump does, and fall back to the
+        # PT_DYNAMIC segment for files which have had their sections removed
+        dynoff = dynsize = stroff = None
+        sections = self.section_headers()
+        for (_, sh_type, sh_offset, sh_size, sh_link) in sections:
+            if sh_type == ELFFile.SHT_DYNAMIC and sh_link < len(sections):
+                dynoff, dynsize = sh_offset, sh_size
+                stroff = sections[sh_link][2]
+                break
+        else:
+            for (p_type, p_offset, _, p_filesz) in self.program_headers():
+                if p_type == ELFFile.PT_DYNAMIC:
+                    dynoff, dynsize = p_offset, p_filesz
+                    break
+
+        entries = []
+        if dynoff is not None:
+            fmt, entsize = self.bits == 32 and ("iI", 8) or ("qQ", 16)
+            end = min(dynoff + dynsize, len(self.data))
+            for offset in range(dynoff, end - entsize + 1, entsize):
+                (tag, val) = self._unpack(fmt, offset)
+                if tag == ELFFile.DT_NULL:
+                    break
+                if tag == ELFFile.DT_STRTAB and stroff is None:
+                    stroff = self._vaddr_to_offset(val)
+                entries.append((tag, val))
+
+        strtags = (ELFFile.DT_NEEDED, ELFFile.DT_SONAME, ELFFile.DT_RPATH, ELFFile.DT_RUNPATH)
+        self._dynamic = []
+        for (tag, val) in entries:
+            if tag in strtags:
+                if stroff is None:
+                    continue
+                val = self._string(stroff + val)
+            self._dynamic.append((tag, val))
+        if self.cache:
+            self.cache.update(self.name, dynamic=self._dynamic)
+        return self._dynamic
+
+    def _dynamic_strings(self, tag):
+        return [val for (t, val) in self.dynamic() if t == tag]
+
+    def needed(self):
+        """
+        Return the list of DT_NEEDED libraries, in order.
+        """
+        return self._dynamic_strings(ELFFile.DT_NEEDED)
+
+    def soname(self):
+        """
+        Return the DT_SONAME of the object, or None if it doesn't have one.
+        """
+        sonames = self._dynamic_strings(ELFFile.DT_SONAME)
+        return sonames and sonames[-1] or None
+
+    def rpath(self):
+        """
+        Return the DT_RPATH of the object, or None if it doesn't have one.
+        """
+        rpaths = self._dynamic_strings(ELFFile.DT_RPATH)
+        return rpaths and rpaths[-1] or None
+
+    def runpath(self):
+        """
+        Return the DT_RUNPATH of the object, or None if it doesn't have one.
+        """
+        runpaths = self._dynamic_strings(ELFFile.DT_RUNPATH)
+        return runpaths and runpaths[-1] or None
+
+    def interpreter(self):
+        """
+        Return the program interpreter from the PT_INTERP segment, or None
+        if the file doesn't request one.
+        """
+        for (p_type, p_offset, _, p_filesz) in self.program_headers():
+            if p_type == ELFFile.PT_INTERP:
+                return self._string(p_offset) if p_filesz else ""
+        return None
+
     def set_objdump(self, cmd, output):
         self.objdump_output[cmd] = output
+        if self.cache:
+            self.cache.update_objdump(self.name, cmd, output)
 
     def run_objdump(self, cmd, d):
         import bb.process
@@ -143,6 +365,11 @@ class ELFFile:
 
         if cmd in self.objdump_output:
             return self.objdump_output[cmd]
+        if self.cache:
+            output = self.cache.get_objdump(self.name, cmd)
+            if output is not None:
+                self.objdump_output[cmd] = output
+                return output
 
         objdump = d.getVar('OBJDUMP')
 
@@ -152,12 +379,135 @@ class ELFFile:
 
         try:
             bb.note("%s %s %s" % (objdump, cmd, self.name))
-            self.objdump_output[cmd] = bb.process.run([objdump, cmd, self.name], env=env, shell=False)[0]
+            self.set_objdump(cmd, bb.process.run([objdump, cmd, self.name], env=env, shell=False)[0])
             return self.objdump_output[cmd]
         except Exception as e:
             bb.note("%s %s %s failed: %s" % (objdump, cmd, self.name, e))
             return ""
 
+class ELFCache:
+    """
+    Cache of metadata about the ELF files of a recipe, shared between the
+    tasks which inspect them (do_package, do_package_qa).
+
+    Entries are keyed by (st_dev, st_ino, st_size, st_mtime_ns, st_ctime_ns)
+    so hardlinked copies of a file share an entry and any modification of
+    the file, such as it being stripped, means the old entry no longer
+    applies. The ctime guards against a recreated file reusing the inode of
+    an old one with the same size and a preserved mtime. Each entry
+    is a dict which may contain:
+
+        notelf: True if the file isn't an ELF file
+        elftype: the bitmask returned by oe.package.is_elf()
+        elfclass: 32 or 64
+        machine: the ELF e_machine value
+        dynamic: list of (tag, value) entries from the dynamic section
+        objdump: dict of objdump command to output
+
+    The cache is stored as zlib compressed JSON and only entries for files
+    which still exist unmodified are written back.
+    """
+    VERSION = 3
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = {}
+        self.paths = {}
+        self.updated = set()
+        self.load()
+
+    @staticmethod
+    def key(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+
+    def _read(self):
+        import json, zlib
+        try:
+            with open(self.filename, "rb") as f:
+                data = json.loads(zlib.decompress(f.read()))
+        except (OSError, ValueError, zlib.error):
+            return {}
+        if data.get("version") != ELFCache.VERSION:
+            return {}
+        return {tuple(e[0:5]): (e[5], e[6]) for e in data["entries"]}
+
+    def load(self):
+        for key, (path, entry) in self._read().items():
+            self.entries[key] = entry
+            self.paths[key] = path
+
+    def get(self, path, field=None):
+        key = ELFCache.key(path)
+        entry = self.entries.get(key)
+        if entry is None or field is None:
+            return entry
+        return entry.get(field)
+
+    def update(self, path, **fields):
+        key = ELFCache.key(path)
+        if key is None:
+            return
+        entry = self.entries.setdefault(key, {})
+        if all(field in entry and entry[field] == value for field, value in fields.items()):
+            return
+        entry.update(fields)
+        self.paths[key] = path
+        self.updated.add(key)
+
+    def get_objdump(self, path, cmd):
+        return (self.get(path, "objdump") or {}).get(cmd)
+
+    def update_objdump(self, path, cmd, output):
+        objdump = dict(self.get(path, "objdump") or {})
+        objdump[cmd] = output
+        self.update(path, objdump=objdump)
+
+    def invalidate(self, path):
+        """
+        Drop the entry for a file which is about to be modified.
+        """
+        key = ELFCache.key(path)
+        self.entries.pop(key, None)
+        self.paths.pop(key, None)
+        self.updated.discard(key)
+
+    def save(self):
+        import bb.utils
+        import json, zlib
+
+        if not self.updated:
+            return
+
+        bb.utils.mkdirhier(os.path.dirname(self.filename))
+        lock = bb.utils.lockfile(self.filename + ".lock")
+        try:
+            # Merge with anything another task has written in the meantime
+            entries = self._read()
+            for key in self.updated:
+                entries[key] = (self.paths[key], self.entries[key])
+            data = []
+            for key in sorted(entries):
+                path, entry = entries[key]
+                if ELFCache.key(path) == key:
+                    data.append(list(key) + [path, entry])
+            tmp = self.filename + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(zlib.compress(json.dumps({"version": ELFCache.VERSION, "entries": data}, separators=(",", ":")).encode("utf-8")))
+            os.rename(tmp, self.filename)
+        finally:
+            bb.utils.unlockfile(lock)
+        self.updated = set()
+
+def elf_cache(d):
+    """
+    Return the ELF metadata cache of the current recipe
+    """
+    return ELFCache(d.expand("${WORKDIR}/elf-metadata.cache"))
+
 def elf_machine_to_string(machine):
     """
     Return the name of a given ELF e_machine field or the hex value as a string
@@ -10,6 +10,11 @@ import oe.spdx30
 import bb
 import re
 import hashlib
+import io
+import json
+import mmap
+import pickle
+import tempfile
 import uuid
 import os
 import oe.spdx_common
@@ -192,11 +197,49 @@ def to_list(l):
     return l
 
 
+def dedup_value_key(v):
+    """
+    Returns a hashable key for a property value. Two values get the same key
+    if they will compare equal once the object set is linked, which merges
+    objects and references with the same ID
+    """
+    if isinstance(v, (oe.spdx30.ListProxy, list)):
+        return tuple(dedup_value_key(i) for i in v)
+
+    if isinstance(v, oe.spdx30.SHACLObject):
+        # Blank node IDs are only unique within a document
+        if v._id and not v._id.startswith("_:"):
+            return v._id
+        return v
+
+    return v
+
+
+def license_expression_key(o):
+    return (
+        o.simplelicensing_licenseExpression,
+        o.simplelicensing_licenseListVersion,
+    )
+
+
+def creation_info_key(o):
+    return tuple((k, dedup_value_key(o[k])) for k in o if k != "@id")
+
+
+# The object types which are de-duplicated in SBoMs, and the key which
+# identifies duplicates
+SBOM_DEDUP_KEYS = [
+    (oe.spdx30.simplelicensing_LicenseExpression, license_expression_key),
+    (oe.spdx30.CreationInfo, creation_info_key),
+]
+
+
 class Dedup(object):
     def __init__(self, objset):
         self.unique = set()
         self.dedup = {}
         self.objset = objset
+        self.by_key = {}
 
     def find_duplicates(self, cmp, typ, **kwargs):
         for o in self.objset.foreach_filter(typ, **kwargs):
@@ -207,10 +250,102 @@ class Dedup(object):
             else:
                 self.unique.add(o)
 
+    def __add_by_key(self, key, typ, objects):
+        index = self.by_key.setdefault((typ, key), {})
+        for o in objects:
+            if o in self.dedup:
+                continue
+
+            u = index.setdefault(key(o), o)
+            if u is o:
+                self.unique.add(o)
+            else:
+                self.dedup[o] = u
+
+    def find_duplicates_by_key(self, key, typ, **kwargs):
+        """
+        Like find_duplicates(), but objects are duplicates if key() returns
+        the same (hashable) value for them, which only takes linear time
+        """
+        self.__add_by_key(key, typ, self.objset.foreach_filter(typ, **kwargs))
+
+    def merge(self, other, keys=SBOM_DEDUP_KEYS):
+        """
+        Find the blank nodes in the object set other which are duplicates of
+        ones already seen using the (typ, key) pairs in keys, and replace the
+        references to them in other with the ones already seen. The
+        duplicates are removed from other.objects
+
+        Objects with an IRI can still be referenced by it from elsewhere, so
+        they are only de-duplicated once everything is linked
+        """
+        dedup = set(self.dedup)
+        for typ, key in keys:
+            self.__add_by_key(
+                key,
+                typ,
+                (o for o in other.foreach_type(typ) if not o._id or o._id.startswith("_:")),
+            )
+
+        new = {k: v for k, v in self.dedup.items() if k not in dedup}
+        if new:
+            self.replace(other.objects)
+            other.objects -= set(new)
+
+    def replace(self, objects):
+        """
+        Replace all references to duplicates in objects and their children
+        """
+        visited = set()
+
+        def visit(o, path):
+            if isinstance(o, oe.spdx30.SHACLObject):
+                if o in visited:
+                    return False
+                visited.add(o)
+
+                for k in o:
+                    v = o[k]
+                    if isinstance(v, oe.spdx30.SHACLObject):
+                        o[k] = self.get(v)
+
+            elif isinstance(o, oe.spdx30.ListProxy):
+                for idx, v in enumerate(o):
+                    if isinstance(v, oe.spdx30.SHACLObject):
+                        o[idx] = self.get(v)
+
+            return True
+
+        for o in objects:
+            o.walk(visit)
+
     def get(self, o):
         return self.dedup.get(o, o)
 
 
+# The (type, exact) keys the objects of each class are indexed by
+_type_keys = {}
+
+
+def type_keys(cls):
+    """
+    Returns the (type, exact) keys objects of the class are indexed by in
+    ObjectSet.obj_by_type, with the full and compact type of each registered
+    class it is derived from. These are computed once for each class
+    """
+    keys = _type_keys.get(cls)
+    if keys is None:
+        keys = {}
+        for typ in oe.spdx30.SHACLObject.CLASSES.values():
+            if issubclass(cls, typ):
+                keys[(typ._TYPE, cls is typ)] = True
+                if typ._COMPACT_TYPE:
+                    keys[(typ._COMPACT_TYPE, cls is typ)] = True
+        keys = tuple(keys)
+        _type_keys[cls] = keys
+    return keys
+
+
 class ObjectSet(oe.spdx30.SHACLObjectSet):
     def __init__(self, d):
         super().__init__()
@@ -240,13 +375,56 @@ class ObjectSet(oe.spdx30.SHACLObjectSet):
 
                 self.by_sha256_hash.setdefault(v.hashValue, set()).add(obj)
 
-        super().add_index(obj)
+        # The same as SHACLObjectSet.add_index(), but with the types of each
+        # class looked up once instead of checking every registered class
+        # for every object
+        if not isinstance(obj, oe.spdx30.SHACLObject):
+            raise TypeError("Object is not of type SHACLObject")
+
+        entries = ((False, obj), (True, obj))
+        for key, exact in type_keys(obj.__class__):
+            self.obj_by_type.setdefault(key, set()).add(entries[exact])
+
+        # This covers custom extensions
+        for key in (obj.get_type(), obj.get_compact_type()):
+            if key:
+                self.obj_by_type.setdefault(key, set()).add(entries[True])
+
+        if obj._id:
+            self.missing_ids.discard(obj._id)
+            self.obj_by_id.setdefault(obj._id, obj)
+
         if isinstance(obj, oe.spdx30.SpdxDocument):
             self.doc = obj
             alias_ext = get_alias(obj)
             if alias_ext is not None and alias_ext.alias:
                 self.alias_prefix = OE_ALIAS_PREFIX + hash_id(alias_ext.alias) + "/"
 
+    def is_indexed(self, obj):
+        """
+        Returns True if the object has been added to the index
+        """
+        return (True, obj) in self.obj_by_type.get(obj.get_type(), ())
+
+    def update_index(self, objects):
+        """
+        Indexes the objects and all of their children that are not indexed
+        yet, without walking the rest of the object set again like
+        create_index(). Children that are already indexed are assumed to have
+        all of their own children indexed too
+        """
+        stack = []
+        for o in objects:
+            if not self.is_indexed(o):
+                self.add_index(o)
+            stack.append(o)
+
+            while stack:
+                for c in stack.pop().iter_objects():
+                    if not self.is_indexed(c):
+                        self.add_index(c)
+                        stack.append(c)
+
     def __filter_obj(self, obj, attr_filter):
         return all(getattr(obj, k) == v for k, v in attr_filter.items())
 
@@ -620,13 +798,16 @@ class ObjectSet(oe.spdx30.SHACLObjectSet):
 
         return lic
 
-    def scan_declared_licenses(self, spdx_file, filepath, license_data):
+    def scan_declared_licenses(self, spdx_file, filepath, license_data, extracted=None):
         for e in spdx_file.extension:
             if isinstance(e, OELicenseScannedExtension):
                 return
 
+        if extracted is None:
+            extracted = oe.spdx_common.extract_licenses(filepath)
+
         file_licenses = set()
-        for extracted_lic in oe.spdx_common.extract_licenses(filepath):
+        for extracted_lic in extracted:
             lic = self.new_license_expression(extracted_lic, license_data)
             self.set_element_alias(lic)
             file_licenses.add(lic)
@@ -640,8 +821,9 @@ class ObjectSet(oe.spdx30.SHACLObjectSet):
 
     def new_file(self, _id, name, path, *, purposes=[], hashfile=True):
         if hashfile:
-            sha256_hash = bb.utils.sha256_file(path)
-            sha512_hash = bb.utils.sha512_file(path)
+            digests = oe.spdx_common.hash_file(path)
+            sha256_hash = digests["sha256"]
+            sha512_hash = digests["sha512"]
 
             for f in self.by_sha256_hash.get(sha256_hash, []):
                 if not isinstance(f, oe.spdx30.software_File):
@@ -869,6 +1051,11 @@ class ObjectSet(oe.spdx30.SHACLObjectSet):
         missing_spdxids = set()
         imports = {e.externalSpdxId: e for e in self.doc.import_}
 
+        # Drop the duplicates from each merged document as it comes in so
+        # they don't pile up
+        dedup = Dedup(self)
+        dedup.merge(self)
+
         def merge_doc(other):
             nonlocal imports
 
@@ -876,6 +1063,7 @@ class ObjectSet(oe.spdx30.SHACLObjectSet):
                 if not e.externalSpdxId in imports:
                     imports[e.externalSpdxId] = e
 
+            dedup.merge(other)
             self.objects |= other.objects
 
         for o in add_objectsets:
@@ -884,6 +1072,7 @@ class ObjectSet(oe.spdx30.SHACLObjectSet):
         needed_spdxids = self.link()
         provided_spdxids = set(self.obj_by_id.keys())
 
+        index = SpdxIdIndex(self.d)
         while True:
             import_spdxids = set(imports.keys())
             searching_spdxids = (
@@ -892,26 +1081,31 @@ class ObjectSet(oe.spdx30.SHACLObjectSet):
             if not searching_spdxids:
                 break
 
-            spdxid = searching_spdxids.pop()
             bb.debug(
                 1,
-                f"Searching for {spdxid}. Remaining: {len(searching_spdxids)}, Total: {len(provided_spdxids)}, Missing: {len(missing_spdxids)}, Imports: {len(import_spdxids)}",
+                f"Searching for {len(searching_spdxids)} SPDX IDs. Total: {len(provided_spdxids)}, Missing: {len(missing_spdxids)}, Imports: {len(import_spdxids)}",
             )
-            dep_objset, dep_path = find_by_spdxid(self.d, spdxid)
+            for dep_objset, dep_path, spdxids in index.find_by_spdxids(
+                searching_spdxids
+            ):
+                if dep_objset is None:
+                    # Some might have been provided by the other documents
+                    missing_spdxids |= spdxids - provided_spdxids
+                    continue
 
-            if dep_objset:
                 dep_provided = set(dep_objset.obj_by_id.keys())
-                if spdxid not in dep_provided:
+                for spdxid in sorted(spdxids - dep_provided):
                     bb.fatal(f"{spdxid} not found in {dep_path}")
                 provided_spdxids |= dep_provided
                 needed_spdxids |= dep_objset.missing_ids
                 merge_doc(dep_objset)
-            else:
-                missing_spdxids.add(spdxid)
+                self.update_index(dep_objset.objects)
 
         self.doc.import_ = sorted(imports.values(), key=lambda e: e.externalSpdxId)
         bb.debug(1, "Linking...")
-        self.link()
+        # The index is kept up to date as documents are merged, so it doesn't
+        # need to be created again
+        self._link()
 
         # Manually go through all of the simplelicensing_customIdToUri DictionaryEntry
         # items and resolve any aliases to actual objects.
@@ -933,29 +1127,8 @@ class ObjectSet(oe.spdx30.SHACLObjectSet):
 
         yield d
 
-        visited = set()
-
-        def visit(o, path):
-            if isinstance(o, oe.spdx30.SHACLObject):
-                if o in visited:
-                    return False
-                visited.add(o)
-
-                for k in o:
-                    v = o[k]
-                    if isinstance(v, oe.spdx30.SHACLObject):
-                        o[k] = d.get(v)
-
-            elif isinstance(o, oe.spdx30.ListProxy):
-                for idx, v in enumerate(o):
-                    if isinstance(v, oe.spdx30.SHACLObject):
-                        o[idx] = d.get(v)
-
-            return True
-
         if d.dedup:
-            for o in self.objects:
-                o.walk(visit)
+            d.replace(self.objects)
 
             for k, v in d.dedup.items():
                 bb.debug(
@@ -967,8 +1140,346 @@ class ObjectSet(oe.spdx30.SHACLObjectSet):
             self.create_index()
 
 
+class JSONLDStreamReader(object):
+    """
+    Incrementally parses a JSON-LD document, yielding (key, value) for each
+    top level property of the document, and ("@graph", node) for each node
+    of the @graph list, so that only one node is held as JSON data at a time
+    """
+
+    WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+    def __init__(self, f, chunksize=1024 * 1024):
+        self.f = io.TextIOWrapper(f, encoding="utf-8")
+        self.chunksize = chunksize
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.keys = set()
+
+    def __fill(self, size):
+        data = self.f.read(size)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos :] + data
+        self.pos = 0
+        return True
+
+    def __peek(self):
+        while True:
+            self.pos = self.WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.__fill(self.chunksize):
+                raise ValueError("Unexpected end of JSON-LD document")
+
+    def __expect(self, chars):
+        c = self.__peek()
+        if c not in chars:
+            raise ValueError(
+                f"Expected one of {chars!r} in JSON-LD document, got {c!r}"
+            )
+        self.pos += 1
+        return c
+
+    def __value(self):
+        self.__peek()
+        size = self.chunksize
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number might continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+
+            # Read more, growing the reads so that large values don't get
+            # parsed over and over
+            self.__fill(size)
+            size *= 2
+
+    def __iter__(self):
+        self.__expect("{")
+        if self.__peek() == "}":
+            return
+
+        while True:
+            key = self.__value()
+            self.__expect(":")
+            self.keys.add(key)
+            if key == "@graph" and self.__peek() == "[":
+                self.pos += 1
+                if self.__peek() == "]":
+                    self.pos += 1
+                else:
+                    while True:
+                        yield key, self.__value()
+                        if self.__expect(",]") == "]":
+                            break
+            else:
+                yield key, self.__value()
+
+            if self.__expect(",}") == "}":
+                return
+
+
+class StreamingJSONLDDeserializer(object):
+    """
+    Deserializes a JSON-LD document one graph node at a time, rather than
+    loading all of the JSON data into memory first like
+    oe.spdx30.JSONLDDeserializer
+    """
+
+    def read(self, f, objectset):
+        objectset.create_index()
+        state = oe.spdx30.DecodeState(objectset)
+        have_context = False
+        pending = []
+        toplevel = {}
+        reader = JSONLDStreamReader(f)
+
+        def decode(node):
+            o = oe.spdx30.SHACLExtensibleObject.decode(
+                oe.spdx30.JSONLDDecoder(node), state
+            )
+            objectset.objects.add(o)
+
+        for key, value in reader:
+            if key == "@context":
+                oe.spdx30.decode_context(oe.spdx30.JSONLDDecoder(value), objectset)
+                have_context = True
+                for node in pending:
+                    decode(node)
+                pending = []
+            elif key == "@graph":
+                # Nodes can't be decoded until the context is known
+                if have_context:
+                    decode(value)
+                else:
+                    pending.append(value)
+            else:
+                toplevel[key] = value
+
+        # Documents without a @graph are a single object
+        if "@graph" not in reader.keys:
+            pending = [toplevel]
+        for node in pending:
+            decode(node)
+
+        objectset._link()
+
+
+# Bump this when the layout of the document cache changes
+DOCUMENT_CACHE_VERSION = 2
+
+_document_cache_layouts = {}
+_document_cache_signature = None
+
+
+def _document_cache_layout(cls):
+    """
+    Returns the (name, list item property) pairs of the properties stored for
+    objects of the given class in the document cache
+    """
+    layout = _document_cache_layouts.get(cls)
+    if layout is None:
+        layout = tuple(
+            (
+                p.pyname,
+                p.prop.prop if isinstance(p.prop, oe.spdx30.ListProp) else None,
+            )
+            for p in cls._OBJ_PY_PROPS.values()
+        )
+        _document_cache_layouts[cls] = layout
+    return layout
+
+
+def _restore_cached_object(cls, values, extra):
+    # The values were validated when the document was first read, so they can
+    # be set directly
+    obj = cls.__new__(cls)
+    for (name, listprop), v in zip(_document_cache_layout(cls), values):
+        if listprop is not None:
+            v = oe.spdx30.ListProxy(listprop, v)
+        object.__setattr__(obj, name, v)
+    for name, v in extra.items():
+        object.__setattr__(obj, name, v)
+    return obj
+
+
+class DocumentCachePickler(pickle.Pickler):
+    """
+    Pickler that stores SHACL objects as a compact tuple of their property
+    values rather than going through their validating attribute setters
+    """
+
+    def reducer_override(self, obj):
+        if not isinstance(obj, oe.spdx30.SHACLObject):
+            return NotImplemented
+
+        values = []
+        for name, listprop in _document_cache_layout(obj.__class__):
+            v = object.__getattribute__(obj, name)
+            if listprop is not None:
+                v = v._data
+            values.append(v)
+
+        extra = {"_metadata": obj._metadata}
+        if isinstance(obj, oe.spdx30.SHACLExtensibleObject):
+            extra["_extensible"] = obj._extensible
+
+        return (_restore_cached_object, (obj.__class__, tuple(values), extra))
+
+
+def document_cache_path(d, path):
+    """
+    Returns the path of the cached copy of the document at path, or None if
+    the cache is disabled. There is one cache entry for each document, which
+    is replaced when the document or the object model changes, so the cache
+    doesn't grow as documents are rebuilt
+    """
+    cachedir = d.getVar("SPDX_DOCUMENT_CACHE")
+    if not cachedir:
+        return None
+
+    key = hash_id(os.path.realpath(path))
+    return Path(cachedir) / key[:2] / key
+
+
+def document_cache_header(st):
+    """
+    Returns the header identifying the document with the stat result st
+    and the object model a cache entry was written for
+    """
+    global _document_cache_signature
+    if _document_cache_signature is None:
+        # Cached documents can only be used with the same object model
+        h = hashlib.sha256(str(DOCUMENT_CACHE_VERSION).encode("utf-8"))
+        for cls in sorted(
+            set(oe.spdx30.SHACLObject.CLASSES.values()),
+            key=lambda c: (c.__module__, c.__qualname__),
+        ):
+            h.update(f"{cls.__module__}.{cls.__qualname__}".encode("utf-8"))
+            for name, listprop in _document_cache_layout(cls):
+                h.update(f" {name}:{listprop is not None}".encode("utf-8"))
+        _document_cache_signature = h.hexdigest()
+
+    return (
+        _document_cache_signature,
+        st.st_dev,
+        st.st_ino,
+        st.st_size,
+        st.st_mtime_ns,
+        st.st_ctime_ns,
+    )
+
+
+def write_document_cache(objset, cache_path, header):
+    """
+    Writes a pre-parsed copy of the object set, including its indexes, to
+    cache_path, replacing any older copy
+    """
+    # Keep the creation order of the objects so that sorting objects with
+    # otherwise identical keys gives the same output as the JSON document
+    everything = sorted(objset.foreach(), key=lambda o: o._birth_index)
+    if objset.doc not in everything:
+        everything.append(objset.doc)
+
+    state = (
+        everything,
+        objset.objects,
+        objset.doc,
+        objset.obj_by_id,
+        objset.obj_by_type,
+        objset.by_sha256_hash,
+        objset.missing_ids,
+        objset.context,
+        objset.alias_prefix,
+    )
+
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=cache_path.parent, prefix=cache_path.name + ".", delete=False
+    ) as f:
+        try:
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            DocumentCachePickler(f, protocol=pickle.HIGHEST_PROTOCOL).dump(state)
+            f.close()
+            os.replace(f.name, cache_path)
+        except:
+            os.unlink(f.name)
+            raise
+
+
+def read_document_cache(d, cache_path, header):
+    """
+    Reads a pre-parsed object set written by write_document_cache(). Returns
+    None if the document isn't cached or the cached copy has a different
+    header
+    """
+    try:
+        with cache_path.open("rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                if pickle.load(m) != header:
+                    return None
+                state = pickle.load(m)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        bb.debug(1, f"Unable to read cached SPDX document {cache_path}: {e}")
+        return None
+
+    (
+        everything,
+        objects,
+        doc,
+        obj_by_id,
+        obj_by_type,
+        by_sha256_hash,
+        missing_ids,
+        context,
+        alias_prefix,
+    ) = state
+
+    # Renumber the objects as if they had been created now
+    base = oe.spdx30.SHACLObject._next_birth_index
+    for idx, o in enumerate(everything):
+        object.__setattr__(o, "_birth_index", base + idx)
+    oe.spdx30.SHACLObject._next_birth_index = base + len(everything)
+
+    objset = ObjectSet(d)
+    objset.objects = objects
+    objset.doc = doc
+    objset.obj_by_id = obj_by_id
+    objset.obj_by_type = obj_by_type
+    objset.by_sha256_hash = by_sha256_hash
+    objset.missing_ids = missing_ids
+    objset.context = context
+    objset.alias_prefix = alias_prefix
+    return objset
+
+
 def load_jsonld(d, path, required=False):
-    deserializer = oe.spdx30.JSONLDDeserializer()
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        if required:
+            bb.fatal("No SPDX document named %s found" % path)
+        return None
+
+    cache_path = document_cache_path(d, path)
+    if cache_path is not None:
+        header = document_cache_header(st)
+        objset = read_document_cache(d, cache_path, header)
+        if objset is not None:
+            return objset
+
+    deserializer = StreamingJSONLDDeserializer()
     objset = ObjectSet(d)
     try:
         with path.open("rb") as f:
@@ -986,6 +1497,13 @@ def load_jsonld(d, path, required=False):
         return None
 
     objset.objects.remove(objset.doc)
+
+    if cache_path is not None:
+        try:
+            write_document_cache(objset, cache_path, header)
+        except OSError as e:
+            bb.debug(1, f"Unable to cache SPDX document {path}: {e}")
+
     return objset
 
 
@@ -1121,11 +1639,72 @@ def load_obj_in_jsonld(d, arch, subdir, fn_name, obj_type, **attr_filter):
     return spdx_obj, objset
 
 
-def find_by_spdxid(d, spdxid, *, required=False):
+def spdxid_doc_hash(spdxid):
+    """
+    Returns the hash under which the document providing spdxid is linked in
+    by-spdxid-hash
+    """
     if spdxid.startswith(OE_ALIAS_PREFIX):
-        h = spdxid[len(OE_ALIAS_PREFIX) :].split("/", 1)[0]
-        return find_jsonld(d, *jsonld_hash_path(h), required=required)
-    return find_jsonld(d, *jsonld_hash_path(hash_id(spdxid)), required=required)
+        return spdxid[len(OE_ALIAS_PREFIX) :].split("/", 1)[0]
+    return hash_id(spdxid)
+
+
+def find_by_spdxid(d, spdxid, *, required=False):
+    return find_jsonld(d, *jsonld_hash_path(spdxid_doc_hash(spdxid)), required=required)
+
+
+class SpdxIdIndex(object):
+    """
+    Index of the by-spdxid-hash links of all the package architectures, built
+    from one directory listing per link directory rather than probing every
+    architecture for every document
+    """
+
+    def __init__(self, d):
+        self.d = d
+        self.archs = d.getVar("SPDX_MULTILIB_SSTATE_ARCHS").split()
+        self.archs.reverse()
+        self.links = {}
+
+    def find(self, h):
+        """
+        Returns the path of the document linked as h, or None if there isn't one
+        """
+        subdir, name = jsonld_hash_path(h)
+        for arch in self.archs:
+            path = jsonld_arch_path(self.d, arch, subdir, name)
+            if path.parent not in self.links:
+                try:
+                    self.links[path.parent] = set(os.listdir(path.parent))
+                except OSError:
+                    self.links[path.parent] = set()
+            if path.name in self.links[path.parent]:
+                return path
+        return None
+
+    def find_by_spdxids(self, spdxids):
+        """
+        Loads the documents providing spdxids, each only once. Yields
+        (objset, path, spdxids) for each document, where objset and path are
+        None for the ids no document could be found for
+        """
+        by_hash = {}
+        for spdxid in spdxids:
+            by_hash.setdefault(spdxid_doc_hash(spdxid), set()).add(spdxid)
+
+        missing = set()
+        for h, ids in sorted(by_hash.items()):
+            path = self.find(h)
+            objset = None
+            if path is not None:
+                objset = load_jsonld(self.d, path)
+            if objset is None:
+                missing |= ids
+                continue
+            yield objset, path, ids
+
+        if missing:
+            yield None, None, missing
 
 
 def create_sbom(d, name, root_elements, add_objectsets=[]):
@@ -1154,28 +1733,9 @@ def create_sbom(d, name, root_elements, add_objectsets=[]):
     # SBoM should be the only root element of the document
     objset.doc.rootElement = [sbom]
 
-    def cmp_license_expression(a, b):
-        return (
-            a.simplelicensing_licenseExpression == b.simplelicensing_licenseExpression
-            and a.simplelicensing_licenseListVersion
-            == b.simplelicensing_licenseListVersion
-        )
-
-    def cmp_creation_info(a, b):
-        data_a = {k: a[k] for k in a}
-        data_b = {k: b[k] for k in b}
-        data_a["@id"] = ""
-        data_b["@id"] = ""
-        return data_a == data_b
-
+    # De-duplicate licenses and creation info
     with objset.deduplicate() as dedup:
-        # De-duplicate licenses
-        dedup.find_duplicates(
-            cmp_license_expression,
-            oe.spdx30.simplelicensing_LicenseExpression,
-        )
-
-        # Deduplicate creation info
-        dedup.find_duplicates(cmp_creation_info, oe.spdx30.CreationInfo)
+        for typ, key in SBOM_DEDUP_KEYS:
+            dedup.find_duplicates_by_key(key, typ)
 
     return objset, sbom
@@ -5,6 +5,7 @@
 #
 
 import json
+import oe.cachedpath
 import oe.cve_check
 import oe.license
 import oe.packagedata
@@ -16,6 +17,7 @@ import oe.spdx_common
 import oe.spdx_license
 import os
 import re
+import stat
 import urllib.parse
 
 from contextlib import contextmanager
@@ -122,6 +124,7 @@ def add_package_files(
         for pattern in (d.getVar("SPDX_FILE_EXCLUDE_PATTERNS") or "").split()
     ]
     excluded_files = set()
+    found_files = []
 
     for subdir, dirs, files in os.walk(topdir, onerror=walk_error):
         dirs[:] = [directory for directory in dirs if directory not in ignore_dirs]
@@ -136,7 +139,11 @@ def add_package_files(
         files.sort()
         for file in files:
             filepath = Path(subdir) / file
-            if filepath.is_symlink() or not filepath.is_file():
+            # Only regular files, not symlinks, with a single lstat()
+            try:
+                if not stat.S_ISREG(os.lstat(filepath).st_mode):
+                    continue
+            except FileNotFoundError:
                 continue
 
             filename = str(filepath.relative_to(topdir))
@@ -154,35 +161,49 @@ def add_package_files(
             ):
                 continue
 
-            spdx_file = objset.new_file(
-                get_spdxid(file_counter),
-                filename,
-                filepath,
-                purposes=file_purposes,
-            )
-            spdx_files.add(spdx_file)
+            found_files.append((filepath, filename, file_purposes))
+
+    # The files are hashed and scanned for licenses in a pool of threads,
+    # while the elements and archive members are created here in the order
+    # of found_files so the output is reproducible. new_file() finds the
+    # digests in the cache.
+    scan_items = [
+        (
+            filepath,
+            license_data is not None
+            and oe.spdx30.software_SoftwarePurpose.source in file_purposes,
+        )
+        for filepath, _, file_purposes in found_files
+    ]
+    scanned = oe.spdx_common.scan_files(d, scan_items)
+
+    for (filepath, filename, file_purposes), (_, licenses) in zip(found_files, scanned):
+        spdx_file = objset.new_file(
+            get_spdxid(file_counter),
+            filename,
+            filepath,
+            purposes=file_purposes,
+        )
+        spdx_files.add(spdx_file)
 
-            if (
-                oe.spdx30.software_SoftwarePurpose.source in file_purposes
-                and license_data is not None
-            ):
-                objset.scan_declared_licenses(spdx_file, filepath, license_data)
+        if licenses is not None:
+            objset.scan_declared_licenses(spdx_file, filepath, license_data, licenses)
 
-            if archive is not None:
-                with filepath.open("rb") as f:
-                    info = archive.gettarinfo(fileobj=f)
-                    info.name = filename
-                    info.uid = 0
-                    info.gid = 0
-                    info.uname = "root"
-                    info.gname = "root"
+        if archive is not None:
+            with filepath.open("rb") as f:
+                info = archive.gettarinfo(fileobj=f)
+                info.name = filename
+                info.uid = 0
+                info.gid = 0
+                info.uname = "root"
+                info.gname = "root"
 
-                    if source_date_epoch is not None and info.mtime > source_date_epoch:
-                        info.mtime = source_date_epoch
+                if source_date_epoch is not None and info.mtime > source_date_epoch:
+                    info.mtime = source_date_epoch
 
-                    archive.addfile(info, f)
+                archive.addfile(info, f)
 
-            file_counter += 1
+        file_counter += 1
 
     bb.debug(1, "Added %d files to %s" % (len(spdx_files), objset.doc._id))
 
@@ -190,22 +211,22 @@ def add_package_files(
 
 
 def get_package_sources_from_debug(
-    d, package, package_files, sources, source_hash_cache, excluded_files=None
+    d, package, package_files, sources, source_hash_cache, excluded_files=None, cpath=None
 ):
     if excluded_files is None:
         excluded_files = set()
 
-    def file_path_match(file_path, pkg_file):
-        if file_path.lstrip("/") == pkg_file.name.lstrip("/"):
-            return True
+    if cpath is None:
+        cpath = oe.cachedpath.CachedPath()
 
+    # All the names and aliases of the package files, so each debug file is a
+    # single lookup rather than a scan of the package files
+    package_paths = set()
+    for pkg_file in package_files:
+        package_paths.add(pkg_file.name.lstrip("/"))
         for e in pkg_file.extension:
             if isinstance(e, oe.sbom30.OEFileNameAliasExtension):
-                for a in e.aliases:
-                    if file_path.lstrip("/") == a.lstrip("/"):
-                        return True
-
-        return False
+                package_paths.update(a.lstrip("/") for a in e.aliases)
 
     debug_search_paths = [
         Path(d.getVar("SPDXWORK")),
@@ -215,6 +236,17 @@ def get_package_sources_from_debug(
         Path(d.getVar("STAGING_KERNEL_DIR")),
     ]
 
+    # Directory listings of the search paths, so sources missing from a
+    # search path don't each need a stat() of their own
+    dir_index = {}
+
+    def is_source_file(path):
+        parent, name = os.path.split(path)
+        if parent not in dir_index:
+            dir_index[parent] = set(cpath.listdir(parent) or [])
+        # We can only hash files below, skip directories, links, etc.
+        return name in dir_index[parent] and cpath.isfile(path)
+
     pkg_data = oe.packagedata.read_subpkgdata_extended(package, d)
 
     dep_source_files = set()
@@ -225,7 +257,7 @@ def get_package_sources_from_debug(
         if not "debugsrc" in file_data:
             continue
 
-        if not any(file_path_match(file_path, pkg_file) for pkg_file in package_files):
+        if not file_path.lstrip("/") in package_paths:
             if file_path.lstrip("/") in excluded_files:
                 bb.debug(
                     1,
@@ -250,12 +282,11 @@ def get_package_sources_from_debug(
                     if file_sha256 is None:
                         continue
                 else:
-                    # We can only hash files below, skip directories, links, etc.
-                    if not debugsrc_path.is_file():
+                    if not is_source_file(str(debugsrc_path)):
                         source_hash_cache[debugsrc_path] = None
                         continue
 
-                    file_sha256 = bb.utils.sha256_file(debugsrc_path)
+                    file_sha256 = oe.spdx_common.hash_file(debugsrc_path, ("sha256",))["sha256"]
                     source_hash_cache[debugsrc_path] = file_sha256
 
                 if file_sha256 in sources:
@@ -864,6 +895,7 @@ def create_spdx(d):
 
     debug_sources = set()
     source_hash_cache = {}
+    source_cpath = oe.cachedpath.CachedPath()
 
     # Write out the package SPDX data now. It is not complete as we cannot
     # write the runtime data, so write it to a staging area and a later task
@@ -1040,6 +1072,7 @@ def create_spdx(d):
                     dep_sources,
                     source_hash_cache,
                     excluded_files=excluded_files,
+                    cpath=source_cpath,
                 )
 
             oe.sbom30.write_recipe_jsonld_doc(
@@ -1371,7 +1404,7 @@ def create_rootfs_spdx(d):
                 continue
 
             relpath = str(fpath.relative_to(image_rootfs))
-            h = bb.utils.sha256_file(fpath)
+            h = oe.spdx_common.hash_file(fpath, ("sha256",))["sha256"]
 
             found = False
             if h in files_by_hash:
@@ -1449,6 +1482,7 @@ def create_image_spdx(d):
                 )
                 artifacts.extend(a)
             else:
+                digests = oe.spdx_common.hash_file(image_path)
                 a = objset.add_root(
                     oe.spdx30.software_File(
                         _id=objset.new_spdxid("image", image_filename),
@@ -1457,11 +1491,11 @@ def create_image_spdx(d):
                         verifiedUsing=[
                             oe.spdx30.Hash(
                                 algorithm=oe.spdx30.HashAlgorithm.sha256,
-                                hashValue=bb.utils.sha256_file(image_path),
+                                hashValue=digests["sha256"],
                             ),
                             oe.spdx30.Hash(
                                 algorithm=oe.spdx30.HashAlgorithm.sha512,
-                                hashValue=bb.utils.sha512_file(image_path),
+                                hashValue=digests["sha512"],
                             ),
                         ],
                     )
@@ -6,8 +6,12 @@
 
 import bb
 import collections
+import concurrent.futures
+import hashlib
 import json
 import oe.packagedata
+import oe.utils
+import os
 import re
 import shutil
 
@@ -37,6 +41,74 @@ def extract_licenses(filename):
     return []
 
 
+HASH_ALGORITHMS = ("sha256", "sha512")
+
+# Digests by (st_dev, st_ino, st_size, st_mtime_ns), lives as long as the task
+_file_hashes = {}
+
+
+def hash_file(path, algorithms=HASH_ALGORITHMS):
+    """
+    Returns a dictionary of the hex digests of a file for each of the
+    algorithms. All the missing digests are computed in one pass over the
+    file and cached, so each file is only read once however many times and
+    with whatever algorithms it is hashed
+    """
+    st = os.stat(path)
+    key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+    digests = _file_hashes.setdefault(key, {})
+
+    missing = [a for a in algorithms if a not in digests]
+    if missing:
+        hashes = [hashlib.new(a) for a in missing]
+        buf = bytearray(1024 * 1024)
+        view = memoryview(buf)
+        with open(path, "rb") as f:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                for h in hashes:
+                    h.update(view[:n])
+        for a, h in zip(missing, hashes):
+            digests[a] = h.hexdigest()
+
+    return {a: digests[a] for a in algorithms}
+
+
+def scan_threads(d):
+    return int(d.getVar("SPDX_HASH_THREADS") or oe.utils.cpu_count(at_most=8))
+
+
+def scan_file(path, algorithms=HASH_ALGORITHMS, licenses=False):
+    """
+    Returns the digests of a file from hash_file() and, if licenses is set,
+    the SPDX License identifiers found in it (otherwise None)
+    """
+    return hash_file(path, algorithms), extract_licenses(path) if licenses else None
+
+
+def scan_files(d, items, algorithms=HASH_ALGORITHMS):
+    """
+    Generator calling scan_file() for each (path, licenses) item in a pool of
+    threads. The results are returned in the order of items as soon as they
+    are ready, so the caller can process the first files while the later
+    ones are still being scanned
+    """
+    threads = scan_threads(d)
+    if threads <= 1 or len(items) <= 1:
+        for path, licenses in items:
+            yield scan_file(path, algorithms, licenses)
+        return
+
+    # hashlib drops the GIL while hashing, and so does reading the files
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+    try:
+        yield from executor.map(lambda item: scan_file(item[0], algorithms, item[1]), items)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
 def is_work_shared_spdx(d):
     return "/work-shared/" in d.getVar("S")
 
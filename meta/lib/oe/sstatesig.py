@@ -536,12 +536,96 @@ def find_sstate_manifest(taskdata, taskdata2, taskname, d, multilibcache):
             % (taskdata, taskname, variant, d2.expand(", ".join(pkgarchs)),"\n    ".join(searched_manifests)))
     return None, d2
 
+class OuthashFileCache(object):
+    """
+    Cache of file content SHA256 digests used by OEOuthashBasic so that
+    files shared between the outputs of several tasks of a recipe (or
+    hardlinked within one output) are only read once.
+
+    Entries are keyed by (st_dev, st_ino, st_size, st_mtime_ns, st_ctime_ns)
+    so any change to a file, including to its metadata, means its entry no
+    longer applies. When saving, entries for files which no longer exist
+    unmodified are dropped.
+    """
+    VERSION = 1
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = self._read()
+        self.used = {}
+
+    @staticmethod
+    def key(s):
+        return (s.st_dev, s.st_ino, s.st_size, s.st_mtime_ns, s.st_ctime_ns)
+
+    def _read(self):
+        import json, zlib
+        try:
+            with open(self.filename, "rb") as f:
+                data = json.loads(zlib.decompress(f.read()))
+        except (OSError, ValueError, zlib.error):
+            return {}
+        if data.get("version") != OuthashFileCache.VERSION:
+            return {}
+        return {tuple(e[0:5]): (e[5], e[6]) for e in data["entries"]}
+
+    def get(self, s, path):
+        key = OuthashFileCache.key(s)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.used[key] = (path, entry[1])
+        return entry[1]
+
+    def add(self, s, path, digest):
+        key = OuthashFileCache.key(s)
+        self.entries[key] = self.used[key] = (path, digest)
+
+    def save(self):
+        import json, zlib
+
+        if not self.used:
+            return
+
+        bb.utils.mkdirhier(os.path.dirname(self.filename))
+        lock = bb.utils.lockfile(self.filename + ".lock")
+        try:
+            # Merge with anything another task has written in the meantime
+            entries = self._read()
+            data = []
+            for key, (path, digest) in entries.items():
+                if key in self.used:
+                    continue
+                try:
+                    if OuthashFileCache.key(os.lstat(path)) != key:
+                        continue
+                except OSError:
+                    continue
+                data.append(list(key) + [path, digest])
+            for key, (path, digest) in self.used.items():
+                data.append(list(key) + [path, digest])
+            data.sort()
+
+            tmp = self.filename + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(zlib.compress(json.dumps({"version": OuthashFileCache.VERSION, "entries": data}, separators=(",", ":")).encode("utf-8")))
+            os.rename(tmp, self.filename)
+        finally:
+            bb.utils.unlockfile(lock)
+        self.used = {}
+
 def OEOuthashBasic(path, sigfile, task, d):
     """
     Basic output hash function
 
     Calculates the output hash of a task by hashing all output file metadata,
     and file contents.
+
+    File contents are hashed by SSTATE_HASHEQUIV_THREADS threads (hashlib
+    releases the GIL) while the per entry records are still added to the
+    hash in the same order, so the result doesn't depend on the number of
+    threads. If SSTATE_HASHEQUIV_CACHE is set, the digests of unfiltered
+    files are cached there and reused while the files are unmodified.
     """
     import hashlib
     import stat
@@ -549,6 +633,8 @@ def OEOuthashBasic(path, sigfile, task, d):
     import grp
     import re
     import fnmatch
+    import collections
+    import concurrent.futures
 
     def update_hash(s):
         s = s.encode('utf-8')
@@ -571,6 +657,10 @@ def OEOuthashBasic(path, sigfile, task, d):
         source_date_epoch = float(d.getVar("SOURCE_DATE_EPOCH"))
     hash_version = d.getVar('HASHEQUIV_HASH_VERSION')
     extra_sigdata = d.getVar("HASHEQUIV_EXTRA_SIGDATA")
+    threads = int(d.getVar("SSTATE_HASHEQUIV_THREADS") or oe.utils.cpu_count(at_most=8))
+    filecache = None
+    if d.getVar("SSTATE_HASHEQUIV_CACHE"):
+        filecache = OuthashFileCache(d.getVar("SSTATE_HASHEQUIV_CACHE"))
 
     filemaps = {}
     for m in (d.getVar('SSTATE_HASHEQUIV_FILEMAP') or '').split():
@@ -580,10 +670,183 @@ def OEOuthashBasic(path, sigfile, task, d):
         filemaps.setdefault(entry[1], [])
         filemaps[entry[1]].append(entry[2])
 
+    # Precompile the filemap globs and replacements
+    compiled_filemaps = []
+    for entry in filemaps:
+        replacements = []
+        for r in filemaps[entry]:
+            if r.startswith("regex-"):
+                replacements.append(re.compile(bytes(r[6:], encoding='utf8')))
+            else:
+                replacements.append(bytes(r, encoding='utf8'))
+        compiled_filemaps.append((re.compile(fnmatch.translate(entry)).match, replacements))
+
+    users = {}
+    groups = {}
+
+    def filtered_sha256(path, basepath, replacements):
+        # Need to ignore paths in crossscripts and postinst-useradd files.
+        with open(path, 'rb') as f:
+            chunk = f.read()
+        chunk = chunk.replace(bytes(basepath, encoding='utf8'), b'')
+        for r in replacements:
+            if isinstance(r, bytes):
+                chunk = chunk.replace(r, b'')
+            else:
+                chunk = r.sub(b'', chunk)
+        return hashlib.sha256(chunk).hexdigest()
+
+    def process(path, s):
+        """
+        Returns the record for path as a (prefix, digest, suffix) tuple
+        where digest is None or the hash function and arguments to call
+        """
+        record = []
+        mode = s.st_mode
+
+        if stat.S_ISDIR(mode):
+            record.append('d')
+        elif stat.S_ISCHR(mode):
+            record.append('c')
+        elif stat.S_ISBLK(mode):
+            record.append('b')
+        elif stat.S_ISSOCK(mode):
+            record.append('s')
+        elif stat.S_ISLNK(mode):
+            record.append('l')
+        elif stat.S_ISFIFO(mode):
+            record.append('p')
+        else:
+            record.append('-')
+
+        def add_perm(mask, on, off='-'):
+            if mask & mode:
+                record.append(on)
+            else:
+                record.append(off)
+
+        add_perm(stat.S_IRUSR, 'r')
+        add_perm(stat.S_IWUSR, 'w')
+        if stat.S_ISUID & mode:
+            add_perm(stat.S_IXUSR, 's', 'S')
+        else:
+            add_perm(stat.S_IXUSR, 'x')
+
+        if include_owners:
+            # Group/other permissions are only relevant in pseudo context
+            add_perm(stat.S_IRGRP, 'r')
+            add_perm(stat.S_IWGRP, 'w')
+            if stat.S_ISGID & mode:
+                add_perm(stat.S_IXGRP, 's', 'S')
+            else:
+                add_perm(stat.S_IXGRP, 'x')
+
+            add_perm(stat.S_IROTH, 'r')
+            add_perm(stat.S_IWOTH, 'w')
+            if stat.S_ISVTX & mode:
+                record.append('t')
+            else:
+                add_perm(stat.S_IXOTH, 'x')
+
+            try:
+                if s.st_uid not in users:
+                    users[s.st_uid] = pwd.getpwuid(s.st_uid).pw_name
+                if s.st_gid not in groups:
+                    groups[s.st_gid] = grp.getgrgid(s.st_gid).gr_name
+                record.append(" %10s" % users[s.st_uid])
+                record.append(" %10s" % groups[s.st_gid])
+            except KeyError as e:
+                msg = ("KeyError: %s\nPath %s is owned by uid %d, gid %d, which doesn't match "
+                    "any user/group on target. This may be due to host contamination." %
+                    (e, os.path.abspath(path), s.st_uid, s.st_gid))
+                raise Exception(msg).with_traceback(e.__traceback__)
+
+        if include_timestamps:
+            # Need to clamp to SOURCE_DATE_EPOCH
+            if s.st_mtime > source_date_epoch:
+                record.append(" %10d" % source_date_epoch)
+            else:
+                record.append(" %10d" % s.st_mtime)
+
+        record.append(" ")
+        if stat.S_ISBLK(mode) or stat.S_ISCHR(mode):
+            record.append("%9s" % ("%d.%d" % (os.major(s.st_rdev), os.minor(s.st_rdev))))
+        else:
+            record.append(" " * 9)
+
+        replacements = None
+        for (match, r) in compiled_filemaps:
+            if match(path):
+                if replacements is None:
+                    replacements = []
+                replacements.extend(r)
+
+        record.append(" ")
+        if stat.S_ISREG(mode) and replacements is None:
+            record.append("%10d" % s.st_size)
+        else:
+            record.append(" " * 10)
+
+        record.append(" ")
+        digest = None
+        if stat.S_ISREG(mode):
+            # Hash file contents
+            if replacements is not None:
+                digest = (filtered_sha256, path, basepath, replacements)
+            else:
+                # Plain file that we're not filtering, use the fastpath in bb.utils
+                digest = (bb.utils.sha256_file, path)
+        else:
+            # SHA256 has a 64 character hex digest
+            record.append(" " * 64)
+        prefix = "".join(record)
+
+        suffix = " %s" % path
+        if stat.S_ISLNK(mode):
+            suffix += " -> %s" % os.readlink(path)
+        suffix += "\n"
+
+        return (prefix, digest, suffix)
+
+    pending = collections.deque()
+
+    def add_record(path, s):
+        (prefix, digest, suffix) = process(path, s)
+        cachefile = None
+        if digest is not None and filecache and digest[0] is bb.utils.sha256_file:
+            cachefile = (s, os.path.join(basepath, path))
+            cached = filecache.get(*cachefile)
+            if cached:
+                digest = cached
+                cachefile = None
+        if digest is not None and not isinstance(digest, str):
+            # Small files are quicker to hash inline than to hand over
+            if executor and s.st_size >= 65536:
+                digest = executor.submit(*digest)
+            else:
+                digest = digest[0](*digest[1:])
+        pending.append((prefix, digest, suffix, cachefile))
+        flush(threads * 64)
+
+    def flush(limit=0):
+        while len(pending) > limit:
+            (prefix, digest, suffix, cachefile) = pending.popleft()
+            if digest is None:
+                digest = ""
+            elif not isinstance(digest, str):
+                digest = digest.result()
+            if cachefile:
+                filecache.add(*cachefile, digest)
+            update_hash(prefix + digest + suffix)
+
+    executor = None
     try:
         os.chdir(path)
         basepath = os.path.normpath(path)
 
+        if threads > 1:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+
         update_hash("OEOuthashBasic\n")
         if hash_version:
             update_hash(hash_version + "\n")
@@ -603,131 +866,27 @@ def OEOuthashBasic(path, sigfile, task, d):
             dirs.sort()
             files.sort()
 
-            def process(path):
-                s = os.lstat(path)
-
-                if stat.S_ISDIR(s.st_mode):
-                    update_hash('d')
-                elif stat.S_ISCHR(s.st_mode):
-                    update_hash('c')
-                elif stat.S_ISBLK(s.st_mode):
-                    update_hash('b')
-                elif stat.S_ISSOCK(s.st_mode):
-                    update_hash('s')
-                elif stat.S_ISLNK(s.st_mode):
-                    update_hash('l')
-                elif stat.S_ISFIFO(s.st_mode):
-                    update_hash('p')
-                else:
-                    update_hash('-')
-
-                def add_perm(mask, on, off='-'):
-                    if mask & s.st_mode:
-                        update_hash(on)
-                    else:
-                        update_hash(off)
-
-                add_perm(stat.S_IRUSR, 'r')
-                add_perm(stat.S_IWUSR, 'w')
-                if stat.S_ISUID & s.st_mode:
-                    add_perm(stat.S_IXUSR, 's', 'S')
-                else:
-                    add_perm(stat.S_IXUSR, 'x')
-
-                if include_owners:
-                    # Group/other permissions are only relevant in pseudo context
-                    add_perm(stat.S_IRGRP, 'r')
-                    add_perm(stat.S_IWGRP, 'w')
-                    if stat.S_ISGID & s.st_mode:
-                        add_perm(stat.S_IXGRP, 's', 'S')
-                    else:
-                        add_perm(stat.S_IXGRP, 'x')
-
-                    add_perm(stat.S_IROTH, 'r')
-                    add_perm(stat.S_IWOTH, 'w')
-                    if stat.S_ISVTX & s.st_mode:
-                        update_hash('t')
-                    else:
-                        add_perm(stat.S_IXOTH, 'x')
-
-                    try:
-                        update_hash(" %10s" % pwd.getpwuid(s.st_uid).pw_name)
-                        update_hash(" %10s" % grp.getgrgid(s.st_gid).gr_name)
-                    except KeyError as e:
-                        msg = ("KeyError: %s\nPath %s is owned by uid %d, gid %d, which doesn't match "
-                            "any user/group on target. This may be due to host contamination." %
-                            (e, os.path.abspath(path), s.st_uid, s.st_gid))
-                        raise Exception(msg).with_traceback(e.__traceback__)
-
-                if include_timestamps:
-                    # Need to clamp to SOURCE_DATE_EPOCH
-                    if s.st_mtime > source_date_epoch:
-                        update_hash(" %10d" % source_date_epoch)
-                    else:
-                        update_hash(" %10d" % s.st_mtime)
-
-                update_hash(" ")
-                if stat.S_ISBLK(s.st_mode) or stat.S_ISCHR(s.st_mode):
-                    update_hash("%9s" % ("%d.%d" % (os.major(s.st_rdev), os.minor(s.st_rdev))))
-                else:
-                    update_hash(" " * 9)
-
-                filterfile = False
-                for entry in filemaps:
-                    if fnmatch.fnmatch(path, entry):
-                        filterfile = True
-
-                update_hash(" ")
-                if stat.S_ISREG(s.st_mode) and not filterfile:
-                    update_hash("%10d" % s.st_size)
-                else:
-                    update_hash(" " * 10)
-
-                update_hash(" ")
-                if stat.S_ISREG(s.st_mode):
-                    # Hash file contents
-                    if filterfile:
-                        fh = hashlib.sha256()
-                        # Need to ignore paths in crossscripts and postinst-useradd files.
-                        with open(path, 'rb') as d:
-                            chunk = d.read()
-                            chunk = chunk.replace(bytes(basepath, encoding='utf8'), b'')
-                            for entry in filemaps:
-                                if not fnmatch.fnmatch(path, entry):
-                                    continue
-                                for r in filemaps[entry]:
-                                    if r.startswith("regex-"):
-                                        chunk = re.sub(bytes(r[6:], encoding='utf8'), b'', chunk)
-                                    else:
-                                        chunk = chunk.replace(bytes(r, encoding='utf8'), b'')
-                            fh.update(chunk)
-                        update_hash(fh.hexdigest())
-                    else:
-                        # Plain file that we're not filtering, use the fastpath in bb.utils
-                        update_hash(bb.utils.sha256_file(path))
-                else:
-                    # SHA256 has a 64 character hex digest
-                    update_hash(" " * 64)
-
-                update_hash(" %s" % path)
-
-                if stat.S_ISLNK(s.st_mode):
-                    update_hash(" -> %s" % os.readlink(path))
-
-                update_hash("\n")
-
             # Process this directory and all its child files
             if include_root or root != ".":
-                process(root)
+                add_record(root, os.lstat(root))
             for f in files:
                 if f == 'fixmepath':
                     continue
-                process(os.path.join(root, f))
+                p = os.path.join(root, f)
+                add_record(p, os.lstat(p))
 
             for dir in dirs:
-                if os.path.islink(os.path.join(root, dir)):
-                    process(os.path.join(root, dir))
+                p = os.path.join(root, dir)
+                s = os.lstat(p)
+                if stat.S_ISLNK(s.st_mode):
+                    add_record(p, s)
+
+        flush()
+        if filecache:
+            filecache.save()
     finally:
+        if executor:
+            executor.shutdown(wait=True, cancel_futures=True)
         os.chdir(prev_dir)
 
     return h.hexdigest()
@@ -277,94 +277,144 @@ def execute_pre_post_process(d, cmds):
 def get_bb_number_threads(d):
     return int(d.getVar("BB_NUMBER_THREADS") or os.cpu_count() or 1)
 
-def multiprocess_launch(target, items, d, extraargs=None):
+def multiprocess_launch(target, items, d, extraargs=None, chunksize=None):
     max_process = get_bb_number_threads(d)
-    return multiprocess_launch_mp(target, items, max_process, extraargs)
-
-# For each item in items, call the function 'target' with item as the first
-# argument, extraargs as the other arguments and handle any exceptions in the
-# parent thread
-def multiprocess_launch_mp(target, items, max_process, extraargs=None):
-
-    class ProcessLaunch(multiprocessing.Process):
-        def __init__(self, *args, **kwargs):
-            multiprocessing.Process.__init__(self, *args, **kwargs)
-            self._pconn, self._cconn = multiprocessing.Pipe()
-            self._exception = None
-            self._result = None
+    return multiprocess_launch_mp(target, items, max_process, extraargs, chunksize)
+
+# Worker side state for MultiprocessPool. The target and the extra arguments
+# are handed to each worker once when it is forked rather than being pickled
+# alongside every item, so closures and datastores can be used freely.
+_pool_target = None
+_pool_extraargs = None
+
+def _pool_init(target, extraargs):
+    global _pool_target, _pool_extraargs
+    _pool_target = target
+    _pool_extraargs = extraargs
+
+def _pool_run_chunk(chunk):
+    import pickle
+    ret = []
+    for args in chunk:
+        if _pool_extraargs is not None:
+            args = args + _pool_extraargs
+        try:
+            ret.append((None, _pool_target(*args)))
+        except Exception as e:
+            tb = traceback.format_exc()
+            try:
+                pickle.dumps(e)
+            except Exception:
+                e = Exception(str(e))
+            ret.append((e, tb))
+    return ret
 
-        def run(self):
+class MultiprocessPool(object):
+    """
+    A pool of forked worker processes which call 'target' for each item with
+    the item as the first argument(s) and extraargs as the remaining ones.
+
+    The workers persist for the lifetime of the pool so several batches of
+    items can be pushed through the same processes. Items are sent to the
+    workers in chunks and results are streamed back in the same order as
+    the items. Exceptions raised by the target are collected and reported
+    through bb.fatal once all in flight work has finished.
+    """
+    def __init__(self, target, max_process, extraargs=None, chunksize=None):
+        import concurrent.futures
+        self.max_process = max(1, int(max_process))
+        self.chunksize = chunksize
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_process,
+                                                               mp_context=multiprocessing.get_context("fork"),
+                                                               initializer=_pool_init,
+                                                               initargs=(target, extraargs))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excinfo):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def _chunks(self, items):
+        items = [args if type(args) is tuple else (args,) for args in items]
+        chunksize = self.chunksize
+        if not chunksize:
+            # Same heuristic as multiprocessing.Pool.map()
+            chunksize, extra = divmod(len(items), self.max_process * 4)
+            if extra or not chunksize:
+                chunksize += 1
+        for i in range(0, len(items), chunksize):
+            yield items[i:i + chunksize]
+
+    def imap(self, items):
+        """
+        Generator returning the (non-empty) results of calling the target on
+        each item, in the order of items. No further work is queued once an
+        error has been seen.
+        """
+        import collections
+
+        chunks = self._chunks(items)
+        pending = collections.deque()
+        errors = []
+
+        def fill():
+            while not errors and len(pending) < self.max_process * 2:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    return
+                pending.append(self.executor.submit(_pool_run_chunk, chunk))
+
+        fill()
+        while pending:
+            future = pending.popleft()
             try:
-                ret = self._target(*self._args, **self._kwargs)
-                self._cconn.send((None, ret))
+                chunkresults = future.result()
             except Exception as e:
-                tb = traceback.format_exc()
-                self._cconn.send((e, tb))
-
-        def update(self):
-            if self._pconn.poll():
-                (e, tb) = self._pconn.recv()
+                # The worker died or the results could not be transferred
+                errors.append((e, traceback.format_exc()))
+                chunkresults = []
+            for (e, ret) in chunkresults:
                 if e is not None:
-                    self._exception = (e, tb)
+                    errors.append((e, ret))
+                elif ret:
+                    yield ret
+            fill()
+
+        if errors:
+            msg = ""
+            for (e, tb) in errors:
+                if isinstance(e, subprocess.CalledProcessError) and e.output:
+                    msg = msg + str(e) + "\n"
+                    msg = msg + "Subprocess output:"
+                    msg = msg + e.output.decode("utf-8", errors="ignore")
                 else:
-                    self._result = tb
-
-        @property
-        def exception(self):
-            self.update()
-            return self._exception
-
-        @property
-        def result(self):
-            self.update()
-            return self._result
-
-    launched = []
-    errors = []
-    results = []
-    items = list(items)
-    while (items and not errors) or launched:
-        if not errors and items and len(launched) < max_process:
-            args = items.pop()
-            if not type(args) is tuple:
-                args = (args,)
-            if extraargs is not None:
-                args = args + extraargs
-            p = ProcessLaunch(target=target, args=args)
-            p.start()
-            launched.append(p)
-        for q in launched:
-            # Have to manually call update() to avoid deadlocks. The pipe can be full and
-            # transfer stalled until we try and read the results object but the subprocess won't exit
-            # as it still has data to write (https://bugs.python.org/issue8426)
-            q.update()
-            # The finished processes are joined when calling is_alive()
-            if not q.is_alive():
-                if q.exception:
-                    errors.append(q.exception)
-                if q.result:
-                    results.append(q.result)
-                launched.remove(q)
-    # Paranoia doesn't hurt
-    for p in launched:
-        p.join()
-    if errors:
-        msg = ""
-        for (e, tb) in errors:
-            if isinstance(e, subprocess.CalledProcessError) and e.output:
-                msg = msg + str(e) + "\n"
-                msg = msg + "Subprocess output:"
-                msg = msg + e.output.decode("utf-8", errors="ignore")
-            else:
-                msg = msg + str(e) + ": " + str(tb) + "\n"
-        bb.fatal("Fatal errors occurred in subprocesses:\n%s" % msg)
-    return results
+                    msg = msg + str(e) + ": " + str(tb) + "\n"
+            bb.fatal("Fatal errors occurred in subprocesses:\n%s" % msg)
+
+    def map(self, items):
+        return list(self.imap(items))
+
+def multiprocess_pool(target, d, extraargs=None, chunksize=None):
+    return MultiprocessPool(target, get_bb_number_threads(d), extraargs, chunksize)
+
+# For each item in items, call the function 'target' with item as the first
+# argument, extraargs as the other arguments and handle any exceptions in the
+# parent thread
+def multiprocess_launch_mp(target, items, max_process, extraargs=None, chunksize=None):
+    with MultiprocessPool(target, max_process, extraargs, chunksize) as pool:
+        return pool.map(items)
 
 def squashspaces(string):
     import re
     return re.sub(r"\s+", " ", string).strip()
 
 def rprovides_map(pkgdata_dir, pkg_dict):
+    import oe.packagedata
+
     # Map file -> pkg provider
     rprov_map = {}
 
@@ -372,17 +422,26 @@ def rprovides_map(pkgdata_dir, pkg_dict):
         path_to_pkgfile = os.path.join(pkgdata_dir, 'runtime-reverse', pkg)
         if not os.path.isfile(path_to_pkgfile):
             continue
+        provides = []
         with open(path_to_pkgfile) as f:
             for line in f:
-                if line.startswith('RPROVIDES') or line.startswith('FILERPROVIDES'):
+                if line.startswith('RPROVIDES'):
                     # List all components provided by pkg.
                     # Exclude version strings, i.e. those starting with (
-                    provides = [x for x in line.split()[1:] if not x.startswith('(')]
-                    for prov in provides:
-                        if prov in rprov_map:
-                            rprov_map[prov].append(pkg)
-                        else:
-                            rprov_map[prov] = [pkg]
+                    provides.extend(x for x in line.split()[1:] if not x.startswith('('))
+
+        # The file provides are kept in filedeps/<pkg>.json under the
+        # original package name
+        origpkg = os.path.basename(os.path.realpath(path_to_pkgfile))
+        filedeps = oe.packagedata.read_filedeps_file(os.path.join(pkgdata_dir, 'filedeps', origpkg + '.json'))
+        for deps in filedeps["provides"].values():
+            provides.extend(bb.utils.explode_deps(" ".join(deps)))
+
+        for prov in provides:
+            if prov in rprov_map:
+                rprov_map[prov].append(pkg)
+            else:
+                rprov_map[prov] = [pkg]
 
     return rprov_map
 
@@ -453,6 +453,8 @@ class BuildPerfTestCase(unittest.TestCase):
                                      ('revision', revision),
                                      ('tasks', OrderedDict())))
             for task in os.listdir(recipe_dir):
+                if task.endswith('.samples'):
+                    continue
                 recipe_bs['tasks'][task] = bs_to_json(os.path.join(recipe_dir,
                                                                    task))
             buildstats.append(recipe_bs)
@@ -5,6 +5,7 @@
 #
 
 import os
+import subprocess
 import sys
 from oeqa.selftest.case import OESelftestTestCase
 import tempfile
@@ -68,6 +69,25 @@ class TestBlobParsing(OESelftestTestCase):
         self.assertEqual(valuesmap, blob_to_dict(blob),
             "commit was not translated correctly to dictionary")
 
+    def test_read_blobs(self):
+        """
+        Test reading several git blobs at once
+        """
+        from oe.buildhistory_analysis import read_blobs, blob_to_dict
+        self.commit_vars(to_add = { "foo" : "1" })
+        blob1 = self.heads_default.commit.tree.blobs[0]
+        self.commit_vars(to_add = { "foo" : "2", "bar" : "3" })
+        blob2 = self.heads_default.commit.tree.blobs[0]
+
+        blobs = read_blobs(self.repo_path, [blob2.hexsha, blob1.hexsha, blob2.hexsha])
+        self.assertEqual(list(blobs), [blob2.hexsha, blob1.hexsha])
+        for blob in (blob1, blob2):
+            self.assertEqual(blobs[blob.hexsha], blob.data_stream.read())
+            self.assertEqual(blob_to_dict(blobs[blob.hexsha]), blob_to_dict(blob))
+
+        with self.assertRaises(ValueError):
+            read_blobs(self.repo_path, ["0" * 40])
+
     def test_compare_dict_blobs(self):
         """
         Test comparisson of dictionaries extracted from git blobs
@@ -155,3 +175,48 @@ class TestFileListCompare(OESelftestTestCase):
         self.maxDiff = None
         self.assertCountEqual(rendered, expectedResult)
 
+class TestIncrementalStaging(OESelftestTestCase):
+
+    def git(self, histdir, *args):
+        return subprocess.check_output(["git", "-c", "user.name=buildhistory", "-c", "user.email=buildhistory@oe"] + list(args),
+                                       cwd=histdir).decode("utf-8")
+
+    def test_stage_changes(self):
+        """
+        Test that staging the recorded changes gives the same tree as staging
+        everything
+        """
+        import oe.buildhistory
+
+        with tempfile.TemporaryDirectory() as histdir:
+            def path(name):
+                return os.path.join(histdir, name)
+
+            for name in ("packages/a/latest", "packages/a/pkg/latest", "packages/b/latest", "metadata-revs"):
+                oe.buildhistory.write_file(histdir, path(name), name)
+            self.git(histdir, "init", "-q")
+            self.assertTrue(oe.buildhistory.stage_changes(histdir))
+            self.git(histdir, "commit", "-q", "-m", "First build")
+
+            # Nothing was written apart from metadata-revs
+            self.assertFalse(oe.buildhistory.write_file(histdir, path("packages/a/latest"), "packages/a/latest"))
+            with open(path("metadata-revs"), "w") as f:
+                f.write("changed")
+            self.assertFalse(oe.buildhistory.stage_changes(histdir))
+            self.assertEqual(self.git(histdir, "diff", "--cached", "--name-only"), "metadata-revs\n")
+            self.git(histdir, "config", "user.name", "buildhistory")
+            self.git(histdir, "config", "user.email", "buildhistory@oe")
+            oe.buildhistory.commit(histdir, "No changes\n\n", "Author <author@example.com>")
+            self.assertEqual(self.git(histdir, "log", "-1", "--format=%an <%ae>%n%B"), "Author <author@example.com>\nNo changes\n\n")
+            self.assertEqual(self.git(histdir, "status", "--porcelain"), "")
+
+            self.assertTrue(oe.buildhistory.write_file(histdir, path("packages/a/latest"), "changed"))
+            self.assertTrue(oe.buildhistory.write_file(histdir, path("packages/c/pkg/latest"), "added"))
+            self.assertTrue(oe.buildhistory.remove(histdir, path("packages/a/pkg")))
+            self.assertFalse(oe.buildhistory.remove(histdir, path("packages/a/pkg")))
+            self.assertTrue(oe.buildhistory.stage_changes(histdir))
+            incremental = self.git(histdir, "write-tree")
+            self.assertFalse(os.path.exists(path(oe.buildhistory.CHANGES_FILE)))
+
+            self.git(histdir, "add", "-A", ".")
+            self.assertEqual(incremental, self.git(histdir, "write-tree"))
@@ -0,0 +1,93 @@
+#
+# Copyright OpenEmbedded Contributors
+#
+# SPDX-License-Identifier: MIT
+#
+
+import collections
+import os
+import sys
+import tempfile
+from unittest.case import TestCase
+
+basepath = os.path.abspath(os.path.dirname(__file__) + '/../../../../../../')
+lib_path = basepath + '/scripts/lib'
+sys.path = sys.path + [lib_path]
+
+class TestTaskRecords(TestCase):
+
+    def test_task_records(self):
+        """
+        Test reading the buildstats of a build back from its task records
+        """
+        import buildstats
+        import oe.buildstats
+
+        Rusage = collections.namedtuple("Rusage", oe.buildstats.RUSAGE_FIELDS)
+        resources = Rusage(1.5, 0.25, 1000, 10, 0, 8, 16, 3, 2)
+        childres = Rusage(10.0, 2.5, 2000, 20, 1, 80, 160, 30, 20)
+        iostats = {"rchar": 100, "wchar": 200, "read_bytes": 4096, "write_bytes": 8192}
+
+        with tempfile.TemporaryDirectory() as bsdir:
+            with open(os.path.join(bsdir, "build_stats"), "w") as f:
+                f.write("Build Started: 1000.00 \nElapsed time: 100.00 seconds \n")
+
+            oe.buildstats.write_task_record(bsdir, "foo-1.0-r0", "do_compile", oe.buildstats.TASK_STARTED, 1010.5)
+            oe.buildstats.write_task_record(bsdir, "bar-2_3.4-r1", "do_install", oe.buildstats.TASK_STARTED, 1020.0)
+            oe.buildstats.write_task_record(bsdir, "foo-1.0-r0", "do_compile", oe.buildstats.TASK_PASSED, 1010.5, 1050.75,
+                                            {"utime": "1", "stime": "2", "cutime": "3", "cstime": "4"},
+                                            iostats, resources, childres)
+
+            with buildstats.TaskRecords(bsdir) as records:
+                self.assertEqual(len(records), 3)
+                self.assertEqual(records.column("start_time"), [1010.5, 1020.0, 1010.5])
+                self.assertEqual(records.stat("walltime"), [None, None, 40.25])
+                self.assertEqual(records.stat("read_ops"), [0, 0, 88])
+
+            bs = buildstats.BuildStats.from_dir(bsdir)
+            self.assertEqual(sorted(bs.keys()), ["bar", "foo"])
+            self.assertEqual(bs["bar"].epoch, "2")
+
+            task = bs["foo"].tasks["do_compile"]
+            self.assertEqual(task["status"], "PASSED")
+            self.assertEqual(task.walltime, 40.25)
+            self.assertEqual(task.cputime, 14.25)
+            self.assertEqual(task.read_bytes, 4096)
+            self.assertEqual(task.write_bytes, 8192)
+            self.assertEqual(task.read_ops, 88)
+            self.assertEqual(task.write_ops, 176)
+            self.assertEqual(task["iostat"]["wchar"], 200)
+            self.assertEqual(task["child_rusage"]["ru_maxrss"], 2000)
+
+            # The task which didn't finish ends with the build
+            task = bs["bar"].tasks["do_install"]
+            self.assertIsNone(task["status"])
+            self.assertEqual(task.walltime, 80.0)
+
+class TestTaskSampler(TestCase):
+
+    def test_task_sampler(self):
+        """
+        Test sampling the process tree of a task
+        """
+        import subprocess
+        import oe.buildstats
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            filename = os.path.join(tempdir, "do_compile.samples")
+            sampler = oe.buildstats.TaskSampler(filename, 0.1)
+            sampler.start()
+            subprocess.check_call([sys.executable, "-c", "import time; x = bytearray(64 * 1024 * 1024); time.sleep(0.5)"])
+            peak_rss, pressure = sampler.stop()
+
+            with open(filename) as f:
+                lines = f.read().splitlines()
+            columns = lines[0].split()
+            self.assertEqual(columns[:7], ["#", "time", "procs", "rss_kb", "cpu_s", "read_bytes", "write_bytes"])
+            self.assertEqual(sorted(pressure.keys()), sorted(columns[7:]))
+            samples = [dict(zip(columns[1:], line.split())) for line in lines[1:]]
+            self.assertGreater(len(samples), 2)
+            # The child was sampled while it held the memory
+            self.assertIn("2", [s["procs"] for s in samples])
+            self.assertGreater(peak_rss, 64 * 1024)
+            self.assertEqual(peak_rss, max(int(s["rss_kb"]) for s in samples))
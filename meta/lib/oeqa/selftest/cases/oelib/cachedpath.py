@@ -0,0 +1,144 @@
+#
+# Copyright OpenEmbedded Contributors
+#
+# SPDX-License-Identifier: MIT
+#
+
+from unittest.case import TestCase
+import oe.cachedpath
+import oe.path
+import errno
+import glob
+import os
+import shutil
+import tempfile
+
+from oeqa.selftest.cases.oelib import path as pathtests
+
+class TestCachedRealPath(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix = "oe-test_cachedpath")
+        self.root = os.path.join(self.tmpdir, "R")
+
+        os.mkdir(os.path.join(self.tmpdir, "_real"))
+        os.symlink("_real", self.root)
+
+        for d in pathtests.TestRealPath.DIRS:
+            os.mkdir(os.path.join(self.root, d))
+        for f in pathtests.TestRealPath.FILES:
+            open(os.path.join(self.root, f), "w")
+        for l in pathtests.TestRealPath.LINKS:
+            os.symlink(l[1], os.path.join(self.root, l[0]))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_realpath(self):
+        cpath = oe.cachedpath.CachedPath()
+        links = pathtests.TestRealPath.LINKS + pathtests.TestRealPath.LINKS_PHYS
+        # Twice so the second round comes from the cache
+        for _ in range(2):
+            for l in links:
+                for use_physdir in (True, False):
+                    path = os.path.join(self.root, l[0])
+                    try:
+                        expected = oe.path.realpath(path, self.root, use_physdir, assume_dir = True)
+                    except OSError as e:
+                        with self.assertRaises(OSError) as cm:
+                            cpath.realpath(path, self.root, use_physdir, assume_dir = True)
+                        self.assertEqual(e.errno, cm.exception.errno)
+                        continue
+                    self.assertEqual(expected, cpath.realpath(path, self.root, use_physdir, assume_dir = True))
+
+    def test_loop(self):
+        cpath = oe.cachedpath.CachedPath()
+        for e in pathtests.TestRealPath.EXCEPTIONS:
+            self.assertRaisesRegex(OSError, r'\[Errno %u\]' % e[1],
+                                   cpath.realpath, os.path.join(self.root, e[0]), self.root, False)
+
+    def test_updatecache(self):
+        cpath = oe.cachedpath.CachedPath()
+        path = os.path.join(self.root, "prog-A")
+        self.assertEqual(self.root + "/usr/bin/prog-A", cpath.realpath(path, self.root, assume_dir = True))
+
+        # Point bin somewhere else
+        bindir = os.path.join(self.root, "bin")
+        os.unlink(bindir)
+        os.symlink("/sbin", bindir)
+        self.assertEqual(self.root + "/usr/bin/prog-A", cpath.realpath(path, self.root, assume_dir = True))
+        cpath.updatecache(bindir)
+        self.assertEqual(self.root + "/sbin/prog-A", cpath.realpath(path, self.root, assume_dir = True))
+
+        # Modifying a regular file doesn't change any resolution
+        passwd = os.path.join(self.root, "etc/passwd")
+        self.assertEqual(passwd, cpath.realpath(os.path.join(self.root, "etc/passwd-3"), self.root))
+        with open(passwd, "w") as f:
+            f.write("root")
+        cpath.updatecache(passwd)
+        self.assertTrue(cpath.realpathcache)
+        self.assertEqual(passwd, cpath.realpath(os.path.join(self.root, "etc/passwd-3"), self.root))
+
+    def test_walk(self):
+        for topdown in (True, False):
+            expected = [(root, sorted(dirs), sorted(files)) for root, dirs, files in
+                        os.walk(self.root, topdown=topdown)]
+            cpath = oe.cachedpath.CachedPath()
+            walked = [(root, sorted(dirs), sorted(files)) for root, dirs, files in
+                      cpath.walk(self.root, topdown=topdown)]
+            self.assertEqual(expected, walked)
+
+        # The file types come from the directory entries without a stat
+        cpath = oe.cachedpath.CachedPath()
+        paths = []
+        for root, dirs, files in cpath.walk(self.root):
+            paths.extend(os.path.join(root, name) for name in dirs + files)
+        self.assertFalse(cpath.lstatcache)
+        for path in paths:
+            self.assertEqual(os.path.islink(path), cpath.islink(path))
+            self.assertEqual(os.path.isdir(path), cpath.isdir(path))
+            self.assertEqual(os.path.isfile(path), cpath.isfile(path))
+            self.assertEqual(os.path.exists(path), cpath.exists(path))
+            self.assertTrue(cpath.lexists(path))
+        self.assertTrue(all(os.path.islink(path) for path in cpath.lstatcache))
+
+        cpath = oe.cachedpath.CachedPath()
+        for root, dirs, files, stats in cpath.walk(self.root, stats=True):
+            self.assertEqual(sorted(dirs + files), sorted(stats))
+            for name in dirs + files:
+                path = os.path.join(root, name)
+                self.assertEqual(os.lstat(path), stats[name])
+                self.assertIs(stats[name], cpath.lstat(path))
+
+        # Pruning dirs stops the walk descending into them
+        cpath = oe.cachedpath.CachedPath()
+        walked = []
+        for root, dirs, files in cpath.walk(self.root):
+            walked.append(root)
+            dirs[:] = [d for d in dirs if d != "usr"]
+        self.assertNotIn(os.path.join(self.root, "usr", "bin"), walked)
+
+    def test_glob(self):
+        open(os.path.join(self.root, "usr/bin/.hidden"), "w").close()
+        # Keep the absolute links inside the tree
+        for l in ("bin", "prog-B", "etc/passwd-3", "etc/shadow-1", "etc/shadow-2", "usr/bin/prog-D"):
+            os.unlink(os.path.join(self.root, l))
+        patterns = ["*", "**", "**/*", "./**", "./**/", "./*/", "./usr/*", "./usr/b*/*",
+                    "./usr/bin/.*", "./usr/bin/*", "./bin/*", "./*/passwd*", "./etc/passwd",
+                    "./etc/missing", "./usr/**/prog-*", "./**/gdbm", "./usr/*/", "./[ab]/*",
+                    "./usr/include/gdbm/", "./b/file/*", "./c", "./c/*", "./*X/prog-?"]
+        cwd = os.getcwd()
+        os.chdir(self.root)
+        try:
+            cpath = oe.cachedpath.CachedPath()
+            for root, dirs, files in cpath.walk("."):
+                pass
+            for pattern in patterns:
+                with self.subTest(pattern=pattern):
+                    self.assertEqual(glob.glob(pattern, recursive=True), cpath.glob(pattern))
+
+            # The listings are updated after changes
+            open("usr/bin/prog-Z", "w").close()
+            cpath.updatecache("usr/bin/prog-Z")
+            self.assertEqual(glob.glob("./usr/bin/*", recursive=True), cpath.glob("./usr/bin/*"))
+        finally:
+            os.chdir(cwd)
@@ -26,3 +26,133 @@ class TestElf(TestCase):
         self.assertEqual(oe.qa.elf_machine_to_string(0x00), "Unset")
         self.assertEqual(oe.qa.elf_machine_to_string(0xDEADBEEF), "Unknown (3735928559)")
         self.assertEqual(oe.qa.elf_machine_to_string("foobar"), "Unknown ('foobar')")
+
+class TestElfDynamic(TestCase):
+    def make_elf(self, bits, endian, sections):
+        """
+        Construct a minimal ELF file with an interpreter and a dynamic
+        section, optionally with a section header table.
+        """
+        import struct
+
+        e = endian == oe.qa.ELFFile.EI_DATA_LSB and "<" or ">"
+        ehsize, phentsize, shentsize = bits == 32 and (52, 32, 40) or (64, 56, 64)
+        dynfmt = e + (bits == 32 and "iI" or "qQ")
+        base = 0x10000
+
+        interp = b"/lib/ld-test.so.1\0"
+        dynstr = b"\0libfoo.so.1\0libbar.so.2\0libtest.so.3\0/opt/lib:$ORIGIN\0/run/path\0"
+        shstrtab = b"\0.dynstr\0.dynamic\0.shstrtab\0"
+
+        phoff = ehsize
+        interpoff = phoff + 3 * phentsize
+        dynstroff = interpoff + len(interp)
+        dynoff = dynstroff + len(dynstr)
+        dynamic = [(oe.qa.ELFFile.DT_NEEDED, 1),
+                   (oe.qa.ELFFile.DT_NEEDED, 13),
+                   (oe.qa.ELFFile.DT_SONAME, 25),
+                   (oe.qa.ELFFile.DT_RPATH, 38),
+                   (oe.qa.ELFFile.DT_RUNPATH, 55),
+                   (oe.qa.ELFFile.DT_STRTAB, base + dynstroff),
+                   (oe.qa.ELFFile.DT_NULL, 0)]
+        dynbytes = b"".join(struct.pack(dynfmt, *d) for d in dynamic)
+        shstroff = dynoff + len(dynbytes)
+        shoff = sections and shstroff + len(shstrtab) or 0
+        total = shstroff + len(shstrtab) + (sections and 4 * shentsize or 0)
+
+        if bits == 32:
+            def phdr(t, off, size):
+                return struct.pack(e + "8I", t, off, base + off, base + off, size, size, 4, 4)
+            def shdr(name, t, off, size, link):
+                return struct.pack(e + "10I", name, t, 0, 0, off, size, link, 0, 1, 0)
+            header = struct.pack(e + "HHIIIIIHHHHHH", 2, 0x28, 1, base, phoff, shoff, 0,
+                                 ehsize, phentsize, 3, shentsize, sections and 4 or 0, 3)
+        else:
+            def phdr(t, off, size):
+                return struct.pack(e + "IIQQQQQQ", t, 4, off, base + off, base + off, size, size, 8)
+            def shdr(name, t, off, size, link):
+                return struct.pack(e + "IIQQQQIIQQ", name, t, 0, 0, off, size, link, 0, 1, 0)
+            header = struct.pack(e + "HHIQQQIHHHHHH", 2, 0xB7, 1, base, phoff, shoff, 0,
+                                 ehsize, phentsize, 3, shentsize, sections and 4 or 0, 3)
+
+        ident = b"\x7fELF" + bytes([bits == 32 and 1 or 2, endian, 1]) + bytes(9)
+        data = ident + header
+        data += phdr(oe.qa.ELFFile.PT_LOAD, 0, total)
+        data += phdr(oe.qa.ELFFile.PT_INTERP, interpoff, len(interp))
+        data += phdr(oe.qa.ELFFile.PT_DYNAMIC, dynoff, len(dynbytes))
+        data += interp + dynstr + dynbytes + shstrtab
+        if sections:
+            data += shdr(0, 0, 0, 0, 0)
+            data += shdr(1, oe.qa.ELFFile.SHT_STRTAB, dynstroff, len(dynstr), 0)
+            data += shdr(9, oe.qa.ELFFile.SHT_DYNAMIC, dynoff, len(dynbytes), 1)
+            data += shdr(18, oe.qa.ELFFile.SHT_STRTAB, shstroff, len(shstrtab), 0)
+        self.assertEqual(len(data), total)
+        return data
+
+    def test_dynamic(self):
+        """
+        Test reading the dynamic section for all ELF classes and endians,
+        with and without a section header table.
+        """
+        import tempfile
+
+        for bits in (32, 64):
+            for endian in (oe.qa.ELFFile.EI_DATA_LSB, oe.qa.ELFFile.EI_DATA_MSB):
+                for sections in (True, False):
+                    with self.subTest(bits=bits, endian=endian, sections=sections):
+                        with tempfile.NamedTemporaryFile() as f:
+                            f.write(self.make_elf(bits, endian, sections))
+                            f.flush()
+                            with oe.qa.ELFFile(f.name) as elf:
+                                elf.open()
+                                self.assertEqual(elf.abiSize(), bits)
+                                self.assertTrue(elf.isDynamic())
+                                self.assertEqual(elf.interpreter(), "/lib/ld-test.so.1")
+                                self.assertEqual(elf.needed(), ["libfoo.so.1", "libbar.so.2"])
+                                self.assertEqual(elf.soname(), "libtest.so.3")
+                                self.assertEqual(elf.rpath(), "/opt/lib:$ORIGIN")
+                                self.assertEqual(elf.runpath(), "/run/path")
+                                self.assertEqual(elf.elfType(), oe.qa.ELFFile.ET_EXEC)
+                                self.assertTrue(elf.isStripped())
+                                self.assertFalse(elf.isPIE())
+                                names = [s[0] for s in elf.section_headers()]
+                                self.assertEqual(names, sections and ["", ".dynstr", ".dynamic", ".shstrtab"] or [])
+
+class TestElfCache(TestCase):
+    def test_cache(self):
+        """
+        Test ELFCache persists entries and drops them when files change
+        """
+        import os
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            cachefile = os.path.join(tempdir, "elf-metadata.cache")
+            path = os.path.join(tempdir, "file")
+            with open(path, "wb") as f:
+                f.write(TestElfDynamic().make_elf(64, oe.qa.ELFFile.EI_DATA_LSB, True))
+
+            cache = oe.qa.ELFCache(cachefile)
+            with oe.qa.ELFFile(path, cache) as elf:
+                elf.open()
+                elf.dynamic()
+                elf.set_objdump("-p", "output")
+            cache.update(path, elftype=9)
+            cache.save()
+
+            cache = oe.qa.ELFCache(cachefile)
+            self.assertEqual(cache.get(path, "elftype"), 9)
+            self.assertEqual(cache.get(path, "elfclass"), 64)
+            self.assertEqual(cache.get(path, "machine"), 0xB7)
+            self.assertEqual(cache.get_objdump(path, "-p"), "output")
+            with oe.qa.ELFFile(path, cache) as elf:
+                elf.open()
+                self.assertEqual(elf.needed(), ["libfoo.so.1", "libbar.so.2"])
+                self.assertEqual(elf.run_objdump("-p", None), "output")
+            # Cache hits don't cause the cache to be written again
+            self.assertFalse(cache.updated)
+
+            # Modifying the file invalidates the entry
+            with open(path, "ab") as f:
+                f.write(b"\0")
+            self.assertIsNone(cache.get(path))
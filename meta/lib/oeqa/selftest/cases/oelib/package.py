@@ -6,11 +6,12 @@
 
 import os
 import shutil
+import struct
 import tempfile
 from unittest.case import TestCase
 
 import oe.path
-from oe.package import copydebugsources
+from oe.package import copydebugsources, is_elf, read_filedeps, save_filedeps
 
 
 class FakeDataStore:
@@ -270,3 +271,58 @@ class TestCopyDebugSources(TestCase):
             with open(copied_source) as f:
                 self.assertEqual(f.read(), "real\n")
             self.assertFalse(os.path.exists(relocation))
+
+
+class TestIsElf(TestCase):
+    def write_elf(self, path, e_type, extra=b""):
+        # A header only 64 bit little endian ELF file, without any sections
+        ident = b"\x7fELF" + bytes([2, 1, 1]) + bytes(9)
+        header = struct.pack("<HHIQQQIHHHHHH", e_type, 0x3E, 1, 0, 0, 0, 0, 64, 56, 0, 64, 0, 0)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(ident + header + extra)
+
+    def test_is_elf(self):
+        with tempfile.TemporaryDirectory(prefix="oe-test-package-") as tmpdir:
+            text = os.path.join(tmpdir, "text")
+            with open(text, "w") as f:
+                f.write("#!/bin/sh\n")
+            self.assertEqual(is_elf(text), (text, 0))
+
+            exe = os.path.join(tmpdir, "usr", "bin", "exe")
+            self.write_elf(exe, 2)
+            self.assertEqual(is_elf(exe), (exe, 1 | 2 | 4))
+
+            lib = os.path.join(tmpdir, "usr", "lib", "libfoo.so")
+            self.write_elf(lib, 3)
+            self.assertEqual(is_elf(lib), (lib, 1 | 2 | 8))
+
+            module = os.path.join(tmpdir, "lib", "modules", "6.0", "foo.ko")
+            self.write_elf(module, 1, b"vermagic=6.0 SMP\0")
+            self.assertEqual(is_elf(module), (module, 1 | 2 | 16))
+
+            signed = os.path.join(tmpdir, "lib", "modules", "6.0", "signed.ko")
+            self.write_elf(signed, 1, b"vermagic=6.0 SMP\0" + b"~Module signature appended~\n")
+            self.assertEqual(is_elf(signed), (signed, 1 | 2 | 16 | 32))
+
+            obj = os.path.join(tmpdir, "usr", "lib", "foo.ko")
+            self.write_elf(obj, 1, b"vermagic=6.0 SMP\0")
+            self.assertEqual(is_elf(obj), (obj, 1 | 2))
+
+
+class TestFileDeps(TestCase):
+    def test_save_filedeps(self):
+        with tempfile.TemporaryDirectory(prefix="oe-test-package-") as tmpdir:
+            d = FakeDataStore({"PKGDESTWORK": tmpdir})
+            self.assertEqual(read_filedeps(d, "pkg"), {"provides": {}, "requires": {}})
+
+            filedeps = read_filedeps(d, "pkg")
+            filedeps["provides"]["/usr/lib/libfoo.so.1"] = ["libfoo.so.1()(64bit)"]
+            filedeps["requires"]["/usr/bin/foo bar"] = ["/bin/sh", "libc.so.6(GLIBC_2.34)(64bit)"]
+            save_filedeps(d, "pkg", filedeps)
+            self.assertEqual(read_filedeps(d, "pkg"), filedeps)
+            self.assertEqual(read_filedeps(d, "other"), {"provides": {}, "requires": {}})
+
+            # Nothing is kept for packages without file dependencies
+            save_filedeps(d, "pkg", {"provides": {}, "requires": {}})
+            self.assertFalse(os.path.exists(os.path.join(tmpdir, "filedeps", "pkg.json")))
@@ -0,0 +1,122 @@
+#
+# Copyright OpenEmbedded Contributors
+#
+# SPDX-License-Identifier: MIT
+#
+
+import os
+import tempfile
+from unittest.case import TestCase
+
+import oe.packagedata
+import oe.pkgdataindex
+
+
+class TestPkgdataIndex(TestCase):
+    def write(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+    def create_recipe(self, pkgdata_dir, pn, packages):
+        self.write(os.path.join(pkgdata_dir, pn), "PACKAGES: %s\n" % " ".join(packages))
+        for pkg in packages:
+            runtime = os.path.join(pkgdata_dir, "runtime", pkg)
+            self.write(runtime,
+                       "PN: %s\n" % pn +
+                       "PKG:%s: lib%s1\n" % (pkg, pkg) +
+                       "RPROVIDES:%s: virtual-%s (>= 1.0) %s-common\n" % (pkg, pn, pn) +
+                       "DESCRIPTION: first\\nsecond\n" +
+                       'FILES_INFO:%s: {"/usr/lib/lib%s.so.1": 10, "/usr/share/%s": 0}\n' % (pkg, pkg, pn))
+            open(runtime + ".packaged", "w").close()
+
+    def test_index(self):
+        with tempfile.TemporaryDirectory() as pkgdata_dir:
+            self.create_recipe(pkgdata_dir, "foo", ["foo", "foo-dev"])
+            self.create_recipe(pkgdata_dir, "bar", ["bar"])
+            # Not packaged and without runtime data
+            os.unlink(os.path.join(pkgdata_dir, "runtime", "foo-dev.packaged"))
+            self.write(os.path.join(pkgdata_dir, "baz"), "PACKAGES: baz\n")
+
+            with oe.pkgdataindex.open_index(pkgdata_dir) as index:
+                self.assertEqual(index.pkgmap(), {"foo": "foo", "foo-dev": "foo", "bar": "bar", "baz": "baz"})
+                self.assertEqual(index.recipe("foo-dev"), "foo")
+                self.assertIsNone(index.recipe("missing"))
+                for pkg in ("foo", "foo-dev", "bar", "baz"):
+                    self.assertEqual(index.read_subpkgdata(pkg),
+                                     oe.packagedata.read_pkgdatafile(os.path.join(pkgdata_dir, "runtime", pkg)))
+                self.assertEqual(index.read_subpkgdata("foo")["DESCRIPTION"], "first\nsecond")
+                self.assertEqual(index.reverse("libfoo1"), ["foo"])
+                self.assertEqual(index.reverse("libfoo-dev1"), [])
+                self.assertEqual(index.rproviders("virtual-foo"), ["foo", "foo-dev"])
+                self.assertEqual(index.rproviders("(>="), [])
+                self.assertEqual(index.file_owners("/usr/share/foo"), ["foo", "foo-dev"])
+                self.assertEqual(index.file_owners("/usr/lib/libbar.so.1"), ["bar"])
+
+            # A changed runtime file is read again
+            runtime = os.path.join(pkgdata_dir, "runtime", "bar")
+            self.write(runtime, "PN: bar\nPKGSIZE:bar: 10\n")
+            with oe.pkgdataindex.open_index(pkgdata_dir) as index:
+                self.assertEqual(index.read_subpkgdata("bar"), {"PN": "bar", "PKGSIZE:bar": "10"})
+
+            # Recipes which are rewritten or removed are updated
+            self.create_recipe(pkgdata_dir, "bar", ["bar", "bar-extra"])
+            os.unlink(os.path.join(pkgdata_dir, "foo"))
+            with oe.pkgdataindex.open_index(pkgdata_dir) as index:
+                self.assertEqual(index.pkgmap(), {"bar": "bar", "bar-extra": "bar", "baz": "baz"})
+                self.assertEqual(index.rproviders("virtual-foo"), [])
+                self.assertEqual(index.file_owners("/usr/share/bar"), ["bar", "bar-extra"])
+                self.assertEqual(index.reverse("libbar-extra1"), ["bar-extra"])
+
+    def test_refresh(self):
+        with tempfile.TemporaryDirectory() as pkgdata_dir:
+            self.create_recipe(pkgdata_dir, "foo", ["foo"])
+            with oe.pkgdataindex.open_index(pkgdata_dir) as index, \
+                    oe.pkgdataindex.open_index(pkgdata_dir) as other:
+                # Nothing has changed, so the index isn't locked for writing
+                def transaction():
+                    raise AssertionError("Unexpected write transaction")
+                transaction_saved = index._transaction
+                index._transaction = transaction
+                self.assertEqual(index.pkgmap(), {"foo": "foo"})
+                self.assertEqual(index.rproviders("foo-common"), ["foo"])
+                index._transaction = transaction_saved
+
+                # Lookups see the pkgdata written after the index was opened,
+                # also when another process updated the index
+                self.create_recipe(pkgdata_dir, "bar", ["bar"])
+                self.assertEqual(other.recipe("bar"), "bar")
+                self.assertEqual(index.recipe("bar"), "bar")
+                self.assertEqual(index.rproviders("bar-common"), ["bar"])
+                os.unlink(os.path.join(pkgdata_dir, "foo"))
+                self.assertEqual(index.pkgmap(), {"bar": "bar"})
+                self.assertEqual(other.file_owners("/usr/share/foo"), [])
+
+    def test_runtime_after_recipe(self):
+        with tempfile.TemporaryDirectory() as pkgdata_dir:
+            # sstate installs PKGDATA_DIR/<pn> before the runtime files
+            self.write(os.path.join(pkgdata_dir, "bash"), "PACKAGES: bash\n")
+            with oe.pkgdataindex.open_index(pkgdata_dir) as index:
+                self.assertEqual(index.rproviders("/bin/sh"), [])
+                self.write(os.path.join(pkgdata_dir, "runtime", "bash"), "PN: bash\nRPROVIDES:bash: /bin/sh\n")
+                open(os.path.join(pkgdata_dir, "runtime", "bash.packaged"), "w").close()
+                self.assertEqual(index.rproviders("/bin/sh"), ["bash"])
+                self.assertEqual(index.reverse("bash"), ["bash"])
+            with oe.pkgdataindex.open_index(pkgdata_dir) as index:
+                self.assertEqual(index.rproviders("/bin/sh"), ["bash"])
+
+    def test_stamp(self):
+        with tempfile.TemporaryDirectory() as pkgdata_dir:
+            self.create_recipe(pkgdata_dir, "foo", ["foo"])
+            oe.pkgdataindex.open_index(pkgdata_dir).close()
+            past = os.stat(pkgdata_dir).st_mtime - 10
+            for path in (pkgdata_dir, os.path.join(pkgdata_dir, "runtime")):
+                os.utime(path, (past, past))
+            with oe.pkgdataindex.open_index(pkgdata_dir) as index:
+                # The pkgdata files aren't checked while the directories
+                # haven't changed
+                def recipe_keys():
+                    raise AssertionError("Unexpected scan of the pkgdata")
+                index._recipe_keys = recipe_keys
+                self.assertEqual(index.rproviders("foo-common"), ["foo"])
+                self.assertEqual(index.recipe("foo"), "foo")
@@ -0,0 +1,290 @@
+#
+# Copyright OpenEmbedded Contributors
+#
+# SPDX-License-Identifier: MIT
+#
+
+from unittest.case import TestCase
+from datetime import datetime, timezone
+from pathlib import Path
+import hashlib
+import io
+import json
+import os
+import tempfile
+import oe.sbom30
+import oe.spdx30
+import oe.spdx_common
+
+
+def make_objset(name):
+    objset = oe.sbom30.ObjectSet(None)
+    base = "http://example.com/" + name
+    ci = oe.spdx30.CreationInfo(
+        specVersion="3.0.1",
+        created=datetime(2024, 1, 1, tzinfo=timezone.utc),
+        createdBy=["http://example.com/agent"],
+    )
+    objset.doc = objset.add(oe.spdx30.SpdxDocument(_id=base, creationInfo=ci, name=name))
+    pkg = objset.add(oe.spdx30.software_Package(_id=base + "/pkg", creationInfo=ci, name=name))
+    files = []
+    for i in range(10):
+        files.append(objset.add(oe.spdx30.software_File(
+            _id=base + "/file%d" % i,
+            creationInfo=ci,
+            name="file%d" % i,
+            verifiedUsing=[oe.spdx30.Hash(algorithm=oe.spdx30.HashAlgorithm.sha256, hashValue="%064x" % i)],
+            extension=[oe.sbom30.OEIdAliasExtension(alias=oe.sbom30.OE_ALIAS_PREFIX + name + "/file%d" % i)],
+        )))
+    objset.add(oe.spdx30.Relationship(
+        _id=base + "/rel",
+        creationInfo=ci,
+        from_=pkg,
+        relationshipType=oe.spdx30.RelationshipType.contains,
+        to=files + ["http://example.com/missing"],
+    ))
+    return objset
+
+
+class TestHashFile(TestCase):
+    def test_hash_file(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            paths = []
+            for i in range(20):
+                path = os.path.join(tempdir, "file%d" % i)
+                with open(path, "wb") as f:
+                    f.write(os.urandom(i * 150000))
+                paths.append(path)
+
+            for path in paths:
+                with open(path, "rb") as f:
+                    data = f.read()
+                # The missing digests are added to the cached ones
+                self.assertEqual(oe.spdx_common.hash_file(path, ("sha256",)),
+                                 {"sha256": hashlib.sha256(data).hexdigest()})
+                self.assertEqual(oe.spdx_common.hash_file(path), {
+                    "sha256": hashlib.sha256(data).hexdigest(),
+                    "sha512": hashlib.sha512(data).hexdigest(),
+                })
+                self.assertEqual(oe.spdx_common.hash_file(path, ("sha1",)),
+                                 {"sha1": hashlib.sha1(data).hexdigest()})
+
+            # A modified file is hashed again
+            with open(paths[0], "wb") as f:
+                f.write(b"changed")
+            self.assertEqual(oe.spdx_common.hash_file(paths[0], ("sha256",))["sha256"],
+                             hashlib.sha256(b"changed").hexdigest())
+
+    def test_scan_files(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            items = []
+            for i in range(50):
+                path = os.path.join(tempdir, "file%d" % i)
+                with open(path, "wb") as f:
+                    f.write(b"// SPDX-License-Identifier: MIT-%d\n" % i)
+                    f.write(os.urandom(i * 1000))
+                items.append((path, bool(i % 2)))
+
+            for threads in ("1", "4"):
+                class D(object):
+                    def getVar(self, name):
+                        return threads
+
+                for (path, licenses), (digests, found) in zip(items, oe.spdx_common.scan_files(D(), items)):
+                    self.assertEqual(digests, oe.spdx_common.hash_file(path))
+                    if licenses:
+                        self.assertEqual(found, oe.spdx_common.extract_licenses(path))
+                        self.assertEqual(len(found), 1)
+                    else:
+                        self.assertIsNone(found)
+
+
+class TestDedup(TestCase):
+    def make_objset(self, n, tool):
+        objset = oe.sbom30.ObjectSet(None)
+        for i in range(n):
+            ci = oe.spdx30.CreationInfo(
+                specVersion="3.0.1",
+                created=datetime(2024, 1, 1, tzinfo=timezone.utc),
+                createdBy=["http://example.com/agent%d" % (i % 2)],
+                createdUsing=[tool],
+            )
+            objset.add(
+                oe.spdx30.simplelicensing_LicenseExpression(
+                    _id="http://example.com/license%d-%d" % (n, i),
+                    creationInfo=ci,
+                    simplelicensing_licenseExpression="MIT" if i % 3 else "GPL-2.0-only",
+                )
+            )
+        objset.create_index()
+        return objset
+
+    def unique_creation_info(self, objset):
+        return set(o.creationInfo for o in objset.foreach_type(oe.spdx30.simplelicensing_LicenseExpression))
+
+    def test_find_duplicates_by_key(self):
+        tool = oe.spdx30.Tool(_id="http://example.com/tool", name="tool")
+        objset = self.make_objset(10, tool)
+        with objset.deduplicate() as dedup:
+            for typ, key in oe.sbom30.SBOM_DEDUP_KEYS:
+                dedup.find_duplicates_by_key(key, typ)
+
+        # Two license expressions and two creators
+        self.assertEqual(len(set(dedup.dedup.values())), 4)
+        kept = set(v for v in dedup.dedup.values() if isinstance(v, oe.spdx30.CreationInfo))
+        self.assertEqual(len(kept), 2)
+        self.assertLessEqual(self.unique_creation_info(objset), kept)
+        licenses = set(o.simplelicensing_licenseExpression for o in objset.objects)
+        self.assertEqual(licenses, {"MIT", "GPL-2.0-only"})
+        self.assertEqual(len(objset.objects), 2)
+
+    def test_merge(self):
+        tool = oe.spdx30.Tool(_id="http://example.com/tool", name="tool")
+        objset = self.make_objset(2, tool)
+        other = self.make_objset(4, oe.spdx30.Tool(_id="http://example.com/tool", name="tool"))
+
+        dedup = oe.sbom30.Dedup(objset)
+        dedup.merge(objset)
+        self.assertEqual(dedup.dedup, {})
+        dedup.merge(other)
+
+        # The creation info of other is replaced by the equivalent ones in
+        # objset, but the license expressions have IRIs so stay
+        self.assertEqual(len(other.objects), 4)
+        self.assertEqual(self.unique_creation_info(objset), set(o.creationInfo for o in other.objects))
+
+
+class TestDocumentCache(TestCase):
+    class D(object):
+        def __init__(self, **variables):
+            self.variables = variables
+
+        def getVar(self, name):
+            return self.variables.get(name)
+
+    def make_doc(self, path, name):
+        objset = make_objset(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("wb") as f:
+            oe.spdx30.JSONLDInlineSerializer().write(objset, f, force_at_graph=True)
+
+    def serialize(self, objset):
+        objset.objects.add(objset.doc)
+        f = io.BytesIO()
+        oe.spdx30.JSONLDInlineSerializer().write(objset, f, force_at_graph=True)
+        objset.objects.remove(objset.doc)
+        return f.getvalue()
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = Path(tempdir) / "doc.spdx.json"
+            self.make_doc(path, "doc")
+            d = self.D(SPDX_DOCUMENT_CACHE=os.path.join(tempdir, "cache"))
+
+            uncached = oe.sbom30.load_jsonld(self.D(), path)
+            first = oe.sbom30.load_jsonld(d, path)
+            cached = oe.sbom30.load_jsonld(d, path)
+            self.assertEqual(len(os.listdir(os.path.join(tempdir, "cache"))), 1)
+
+            for objset in (first, cached):
+                self.assertEqual(self.serialize(uncached), self.serialize(objset))
+                self.assertEqual(set(uncached.obj_by_id), set(objset.obj_by_id))
+                self.assertEqual(set(uncached.obj_by_type), set(objset.obj_by_type))
+                self.assertEqual(set(uncached.by_sha256_hash), set(objset.by_sha256_hash))
+                self.assertEqual(uncached.missing_ids, objset.missing_ids)
+                self.assertEqual(uncached.doc.name, objset.doc.name)
+            self.assertFalse(cached.objects & first.objects)
+
+            # Changing the document invalidates the cache and replaces the
+            # cached copy
+            self.make_doc(path, "changed")
+            self.assertEqual(oe.sbom30.load_jsonld(d, path).doc.name, "changed")
+            self.assertEqual(oe.sbom30.load_jsonld(d, path).doc.name, "changed")
+            cached = [f for _, _, files in os.walk(os.path.join(tempdir, "cache")) for f in files]
+            self.assertEqual(len(cached), 1)
+
+            # Rewriting it in place with the same size and mtime still does
+            st = path.stat()
+            self.make_doc(path, "changes")
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+            self.assertEqual(path.stat().st_size, st.st_size)
+            self.assertEqual(oe.sbom30.load_jsonld(d, path).doc.name, "changes")
+
+    def test_index(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            d = self.D(DEPLOY_DIR_SPDX=tempdir, SPDX_MULTILIB_SSTATE_ARCHS="all core2-64")
+            for arch, name in (("all", "a"), ("core2-64", "b"), ("core2-64", "c")):
+                path = oe.sbom30.jsonld_arch_path(d, arch, "recipes", name)
+                self.make_doc(path, name)
+                link = oe.sbom30.jsonld_arch_path(d, arch, *oe.sbom30.jsonld_hash_path(name))
+                link.parent.mkdir(parents=True, exist_ok=True)
+                link.symlink_to(os.path.relpath(path, link.parent))
+
+            prefix = oe.sbom30.OE_ALIAS_PREFIX
+            spdxids = {prefix + "a/file1", prefix + "b/file2", prefix + "b/file3", prefix + "x/file1"}
+            found = list(oe.sbom30.SpdxIdIndex(d).find_by_spdxids(spdxids))
+            self.assertEqual([(o and o.doc.name, ids) for o, path, ids in found], [
+                ("a", {prefix + "a/file1"}),
+                ("b", {prefix + "b/file2", prefix + "b/file3"}),
+                (None, {prefix + "x/file1"}),
+            ])
+
+    def test_streaming(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = Path(tempdir) / "doc.spdx.json"
+            self.make_doc(path, "doc")
+            data = path.read_bytes()
+
+            expected = oe.sbom30.ObjectSet(None)
+            oe.spdx30.JSONLDDeserializer().read(io.BytesIO(data), expected)
+            streamed = oe.sbom30.ObjectSet(None)
+            oe.sbom30.StreamingJSONLDDeserializer().read(io.BytesIO(data), streamed)
+            self.assertEqual(self.serialize(expected), self.serialize(streamed))
+            self.assertEqual(expected.missing_ids, streamed.missing_ids)
+
+            # Values split over many reads
+            parsed = json.loads(data)
+            for chunksize in (1, 7, 100):
+                items = list(oe.sbom30.JSONLDStreamReader(io.BytesIO(data), chunksize))
+                self.assertEqual(items, [("@context", parsed["@context"])] +
+                                 [("@graph", node) for node in parsed["@graph"]])
+
+            for doc in (b' {"@graph": [], "@context": [1.5, {"a": "b"}]} ', b'{}', b'{"a": 10}'):
+                parsed = json.loads(doc)
+                items = list(oe.sbom30.JSONLDStreamReader(io.BytesIO(doc), 1))
+                self.assertEqual(items, [(k, v) for k, v in parsed.items() if k != "@graph"])
+
+
+class TestIndex(TestCase):
+    def index(self, objset):
+        return (dict(objset.obj_by_id), objset.obj_by_type, objset.by_sha256_hash)
+
+    def test_type_keys(self):
+        for cls in set(oe.spdx30.SHACLObject.CLASSES.values()):
+            expected = set()
+            for typ in oe.spdx30.SHACLObject.CLASSES.values():
+                if issubclass(cls, typ):
+                    expected.add((typ._TYPE, cls is typ))
+                    if typ._COMPACT_TYPE:
+                        expected.add((typ._COMPACT_TYPE, cls is typ))
+            self.assertEqual(set(oe.sbom30.type_keys(cls)), expected)
+
+    def test_add_index(self):
+        objset = make_objset("a")
+        objset.create_index()
+        expected = oe.spdx30.SHACLObjectSet(objset.objects)
+        self.assertEqual(expected.obj_by_type, objset.obj_by_type)
+        self.assertEqual(expected.obj_by_id.items() - objset.obj_by_id.items(), set())
+
+    def test_update_index(self):
+        objset = make_objset("a")
+        objset.link()
+        other = make_objset("b")
+
+        objset.objects |= other.objects
+        objset.update_index(other.objects)
+        updated = self.index(objset)
+        self.assertTrue(all(objset.is_indexed(o) for o in other.foreach()))
+
+        objset.create_index()
+        self.assertEqual(updated, self.index(objset))
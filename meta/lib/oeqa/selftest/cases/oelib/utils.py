@@ -8,7 +8,7 @@ import sys
 from unittest.case import TestCase
 from contextlib import contextmanager
 from io import StringIO
-from oe.utils import packages_filter_out_system, trim_version, multiprocess_launch, filter_default_features
+from oe.utils import packages_filter_out_system, trim_version, multiprocess_launch, multiprocess_launch_mp, MultiprocessPool, filter_default_features
 
 class TestPackagesFilterOutSystem(TestCase):
     def test_filter(self):
@@ -103,6 +103,30 @@ class TestMultiprocessLaunch(TestCase):
             self.assertRaises(bb.BBHandledException, multiprocess_launch, testfunction, ["1", "2", "3", "4", "5", "6"], d, extraargs=(d,))
         self.assertIn("KeyError: 'Invalid number 2'", out.getvalue())
 
+    def test_multiprocesspool(self):
+        import bb
+        import os
+
+        def testfunction(item, offset):
+            return (item + offset, os.getpid())
+
+        # Results come back in order, whatever the chunk size, and the same
+        # worker processes are reused between batches
+        with MultiprocessPool(testfunction, 2, extraargs=(10,), chunksize=3) as pool:
+            first = pool.map(range(20))
+            self.assertEqual([r[0] for r in first], list(range(10, 30)))
+            second = pool.map(range(5))
+            self.assertEqual([r[0] for r in second], list(range(10, 15)))
+            pids = set(r[1] for r in first + second)
+            self.assertLessEqual(len(pids), 2)
+            self.assertNotIn(os.getpid(), pids)
+
+        # Nothing to do with the default chunk size
+        self.assertEqual(multiprocess_launch_mp(lambda x: x, [], 4), [])
+        with MultiprocessPool(lambda x: x, 4) as pool:
+            self.assertEqual(pool.map([]), [])
+            self.assertEqual(pool.map([1]), [1])
+
 
 class TestDefaultFeatures(TestCase):
     def test_filter_default_features(self):
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+#
+# Benchmark oe.buildhistory_analysis.compare_file_lists() on a pair of
+# files-in-image.txt files where the kernel modules directory has been
+# renamed and many libraries have a new version, and check that the changes are the same as with a reference git
+# revision.
+#
+# Copyright OpenEmbedded Contributors
+#
+# SPDX-License-Identifier: GPL-2.0-only
+#
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import types
+
+scripts_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+lib_path = scripts_path + '/lib'
+sys.path = sys.path + [lib_path]
+
+import scriptpath
+scriptpath.add_oe_lib_path()
+if not scriptpath.add_bitbake_lib_path():
+    sys.stderr.write("Unable to find bitbake by searching parent directory of this script or PATH\n")
+    sys.exit(1)
+
+import oe.buildhistory_analysis
+
+corebase = os.path.dirname(scripts_path)
+
+
+def name(i):
+    """
+    A name for i without digits, so it isn't merged with other names when
+    the numbers are masked out to find moves
+    """
+    s = ""
+    while True:
+        i, r = divmod(i, 26)
+        s += chr(ord("a") + r)
+        if not i:
+            return s
+
+
+def add_modules(lines, version, nummodules):
+    """
+    Add nummodules kernel modules to a files-in-image.txt file list, spread
+    over a kernel/drivers tree like a full kernel build
+    """
+    lines = list(lines)
+    moddir = "./lib/modules/%s" % version
+    dirs = set()
+    for i in range(nummodules):
+        subdir = "%s/kernel/drivers/%s/%s" % (moddir, name(i % 97), name(i % 13))
+        if subdir not in dirs:
+            dirs.add(subdir)
+            lines.append("drwxr-xr-x root       root             4096 %s\n" % subdir)
+        # Some module names have numbers in them, like i2c-i801.ko
+        module = name(i) + ("-%d" % (i % 7) if i % 3 == 0 else "")
+        lines.append("-rw-r--r-- root       root            %5d %s/%s.ko\n" % (1000 + i, subdir, module))
+    for index in ("modules.alias", "modules.dep", "modules.symbols"):
+        lines.append("-rw-r--r-- root       root           123456 %s/%s\n" % (moddir, index))
+    return lines
+
+
+def add_libraries(lines, version, numlibs):
+    """
+    Add numlibs versioned shared libraries, which are reported as single
+    file moves when the version changes
+    """
+    lines = list(lines)
+    for i in range(numlibs):
+        lines.append("-rwxr-xr-x root       root            %5d ./usr/lib/lib%s.so.1.%d.0\n" % (1000 + i, name(i), version))
+    return lines
+
+
+def load_reference(rev):
+    """
+    Load oe/buildhistory_analysis.py from the given git revision
+    """
+    source = subprocess.check_output(["git", "-C", corebase, "show", "%s:meta/lib/oe/buildhistory_analysis.py" % rev])
+    module = types.ModuleType("buildhistory_analysis_%s" % rev)
+    exec(compile(source, "buildhistory_analysis.py@%s" % rev, "exec"), module.__dict__)
+    return module
+
+
+def run(module, alines, blines):
+    start = time.monotonic()
+    changes = module.compare_file_lists(alines, blines)
+    elapsed = time.monotonic() - start
+    return [str(c) for c in changes], elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compare_file_lists() on a kernel modules directory rename and library upgrades")
+    parser.add_argument("--modules", type=int, default=20000, help="Number of kernel modules added to each file list (default: %(default)s)")
+    parser.add_argument("--libraries", type=int, default=2000, help="Number of shared libraries with a new version (default: %(default)s)")
+    parser.add_argument("--files", nargs=2, metavar=("OLD", "NEW"),
+                        default=[corebase + "/meta/lib/oeqa/files/buildhistory_filelist1.txt",
+                                 corebase + "/meta/lib/oeqa/files/buildhistory_filelist2.txt"],
+                        help="files-in-image.txt files to compare (default: the pair used by the oe-selftest buildhistory tests)")
+    parser.add_argument("--reference", help="Also compare against compare_file_lists() from this git revision")
+    args = parser.parse_args()
+
+    with open(args.files[0]) as f:
+        alines = add_libraries(add_modules(f.readlines(), "6.6.20-yocto-standard", args.modules), 2, args.libraries)
+    with open(args.files[1]) as f:
+        blines = add_libraries(add_modules(f.readlines(), "6.6.23-yocto-standard", args.modules), 3, args.libraries)
+    print("Comparing %d and %d files" % (len(alines), len(blines)))
+
+    results = []
+    if args.reference:
+        results.append(("reference %s" % args.reference,) + run(load_reference(args.reference), alines, blines))
+    results.append(("current",) + run(oe.buildhistory_analysis, alines, blines))
+
+    ok = True
+    for (name, changes, elapsed) in results:
+        same = changes == results[0][1]
+        ok = ok and same
+        print("%-20s %8.3fs %d changes %s" % (name, elapsed, len(changes), same and "identical" or "DIFFERS"))
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
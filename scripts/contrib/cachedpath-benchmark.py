@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+#
+# Benchmark oe.cachedpath.CachedPath on a synthetic package tree with
+# symlinked library directories, and check that walk() and realpath() give
+# the same results as oe.path.realpath() and, optionally, as CachedPath from
+# a reference git revision.
+#
+# Copyright OpenEmbedded Contributors
+#
+# SPDX-License-Identifier: GPL-2.0-only
+#
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+scripts_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+lib_path = scripts_path + '/lib'
+sys.path = sys.path + [lib_path]
+
+import scriptpath
+scriptpath.add_oe_lib_path()
+if not scriptpath.add_bitbake_lib_path():
+    sys.stderr.write("Unable to find bitbake by searching parent directory of this script or PATH\n")
+    sys.exit(1)
+
+import oe.cachedpath
+import oe.path
+
+
+def create_tree(path, numfiles):
+    """
+    Create a synthetic package output with numfiles files in a multilib style
+    layout where the library directories are reached through symlinks, and
+    the usual library symlink chains.
+    """
+    os.makedirs(os.path.join(path, "usr", "lib"))
+    os.makedirs(os.path.join(path, "usr", "bin"))
+    os.symlink("usr/lib", os.path.join(path, "lib"))
+    os.symlink("lib", os.path.join(path, "lib64"))
+    os.symlink("lib", os.path.join(path, "usr", "lib64"))
+    os.symlink("usr/bin", os.path.join(path, "bin"))
+
+    for i in range(numfiles // 4):
+        libdir = os.path.join(path, "usr", "lib", "pkg%d" % (i % 1000), "plugins%d" % (i % 3))
+        os.makedirs(libdir, exist_ok=True)
+        name = "libfoo%d.so" % i
+        open(os.path.join(libdir, name + ".1.2.3"), "w").close()
+        os.symlink(name + ".1.2.3", os.path.join(libdir, name + ".1"))
+        os.symlink(name + ".1", os.path.join(libdir, name))
+        # A link through the symlinked libdirs
+        os.symlink("/lib64/pkg%d/plugins%d/%s" % (i % 1000, i % 3, name), os.path.join(libdir, name + ".abs"))
+
+
+def load_reference(rev):
+    """
+    Load CachedPath from oe/cachedpath.py at the given git revision
+    """
+    corebase = os.path.dirname(scripts_path)
+    source = subprocess.check_output(["git", "-C", corebase, "show", "%s:meta/lib/oe/cachedpath.py" % rev])
+    module = types.ModuleType("cachedpath_%s" % rev)
+    exec(compile(source, "cachedpath.py@%s" % rev, "exec"), module.__dict__)
+    return module.CachedPath
+
+
+def run(cls, path):
+    """
+    Walk the tree the way process_split_and_strip_files() and
+    populate_packages() do, resolving every symlink and the physical path
+    of every file below the symlinked library directories.
+    """
+    cpath = cls()
+    results = []
+    start = time.monotonic()
+    for root, dirs, files in cpath.walk(path):
+        for f in files:
+            file = os.path.join(root, f)
+            if cpath.islink(file):
+                results.append(cpath.realpath(file, path, False))
+        # The same files again but through the /lib64 -> lib -> usr/lib symlinks
+        aliasdir = path + "/lib64" + root[len(path + "/usr/lib"):]
+        for f in files:
+            results.append(cpath.realpath(os.path.join(aliasdir, f), path, True, assume_dir=True))
+    return results, time.monotonic() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CachedPath.realpath() on a synthetic tree")
+    parser.add_argument("--files", type=int, default=200000, help="Number of files and symlinks in the tree (default: %(default)s)")
+    parser.add_argument("--reference", help="Also compare against CachedPath from this git revision")
+    parser.add_argument("--check", action="store_true", help="Check the results against oe.path.realpath() (slow)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "image")
+        print("Creating %d files in %s" % (args.files, path))
+        create_tree(path, args.files)
+
+        results = []
+        if args.reference:
+            results.append(("reference %s" % args.reference,) + run(load_reference(args.reference), path))
+        results.append(("current",) + run(oe.cachedpath.CachedPath, path))
+
+        if args.check:
+            class UncachedPath(oe.cachedpath.CachedPath):
+                def realpath(self, file, root, use_physdir=True, loop_cnt=100, assume_dir=False):
+                    return oe.path.realpath(file, root, use_physdir, loop_cnt, assume_dir)
+            results.insert(0, ("oe.path",) + run(UncachedPath, path))
+
+        ok = True
+        for (name, paths, elapsed) in results:
+            same = paths == results[0][1]
+            ok = ok and same
+            print("%-20s %8.3fs %d paths %s" % (name, elapsed, len(paths), same and "identical" or "DIFFERS"))
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
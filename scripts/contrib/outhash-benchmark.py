@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+#
+# Benchmark oe.sstatesig.OEOuthashBasic and check that the output hash and
+# signature data don't depend on the number of hashing threads or on the
+# content hash cache, or on the implementation when compared against a
+# reference git revision.
+#
+# Copyright OpenEmbedded Contributors
+#
+# SPDX-License-Identifier: GPL-2.0-only
+#
+
+import argparse
+import io
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+scripts_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+lib_path = scripts_path + '/lib'
+sys.path = sys.path + [lib_path]
+
+import scriptpath
+scriptpath.add_oe_lib_path()
+if not scriptpath.add_bitbake_lib_path():
+    sys.stderr.write("Unable to find bitbake by searching parent directory of this script or PATH\n")
+    sys.exit(1)
+
+import bb.data_smart
+import bb.utils
+import oe.sstatesig
+import oe.utils
+
+
+def create_tree(path, numfiles, seed):
+    """
+    Create a synthetic task output with numfiles files spread over a
+    directory hierarchy, including symlinks and files matched by the default
+    SSTATE_HASHEQUIV_FILEMAP.
+    """
+    rand = random.Random(seed)
+    for i in range(numfiles):
+        dirname = os.path.join(path, "usr", "lib", "dir%d" % (i % 500), "sub%d" % (i % 7))
+        os.makedirs(dirname, exist_ok=True)
+        fn = os.path.join(dirname, "file%d" % i)
+        # Mostly small files with the occasional large one
+        size = rand.choice((0, 100, 2000, 30000, 30000, 30000, 200000)) if i % 1000 else 16 * 1024 * 1024
+        with open(fn, "wb") as f:
+            f.write(rand.randbytes(size))
+        os.chmod(fn, rand.choice((0o644, 0o755, 0o4755, 0o600)))
+        if i % 50 == 0:
+            os.symlink("file%d" % i, os.path.join(dirname, "link%d" % i))
+        if i % 2000 == 0:
+            os.symlink("sub%d" % (i % 7), os.path.join(os.path.dirname(dirname), "dirlink%d" % i))
+
+    bindir = os.path.join(path, "sysroot-destdir", "crossscripts")
+    os.makedirs(bindir, exist_ok=True)
+    with open(os.path.join(bindir, "foo-config"), "w") as f:
+        f.write("#!/bin/sh\necho %s/sysroot\n" % path)
+    postinstdir = os.path.join(path, "postinst-dir")
+    os.makedirs(postinstdir, exist_ok=True)
+    with open(os.path.join(postinstdir, "postinst-useradd-foo"), "w") as f:
+        f.write("#!/bin/sh\nexport PATH=%s/bin \nuseradd foo\n" % path)
+
+
+def load_reference(rev):
+    """
+    Load OEOuthashBasic from oe/sstatesig.py at the given git revision
+    """
+    corebase = os.path.dirname(scripts_path)
+    source = subprocess.check_output(["git", "-C", corebase, "show", "%s:meta/lib/oe/sstatesig.py" % rev])
+    module = types.ModuleType("sstatesig_%s" % rev)
+    module.__dict__.update({"os": os, "bb": bb, "oe": oe})
+    exec(compile(source, "sstatesig.py@%s" % rev, "exec"), module.__dict__)
+    return module.OEOuthashBasic
+
+
+def run(func, path, task, d):
+    sigfile = io.BytesIO()
+    start = time.monotonic()
+    digest = func(path, sigfile, task, d)
+    return digest, sigfile.getvalue(), time.monotonic() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the output hash calculation")
+    parser.add_argument("--path", help="Hash an existing directory instead of a synthetic tree")
+    parser.add_argument("--files", type=int, default=100000, help="Number of files in the synthetic tree (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic tree")
+    parser.add_argument("--task", default="populate_sysroot", help="Task name to hash as (default: %(default)s)")
+    parser.add_argument("--threads", default="1,%d" % oe.utils.cpu_count(at_most=8), help="Comma separated thread counts to test (default: %(default)s)")
+    parser.add_argument("--reference", help="Also compare against OEOuthashBasic from this git revision")
+    parser.add_argument("--cache", action="store_true", help="Also run with a cold and a warm SSTATE_HASHEQUIV_CACHE")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = args.path
+        if not path:
+            path = os.path.join(tempdir, "image")
+            print("Creating %d files in %s" % (args.files, path))
+            create_tree(path, args.files, args.seed)
+
+        d = bb.data_smart.DataSmart()
+        d.setVar("COREBASE", os.path.dirname(scripts_path))
+        d.setVar("TMPDIR", path)
+        d.setVar("SOURCE_DATE_EPOCH", "1520598896")
+        d.setVar("SSTATE_PKGSPEC", "benchmark")
+        d.setVar("SSTATE_HASHEQUIV_FILEMAP", " ".join((
+            "%s:*/postinst-useradd-*:${TMPDIR}" % args.task,
+            "%s:*/postinst-useradd-*:regex-\\s(PATH|HOME|USER)=.*\\s" % args.task,
+            "%s:*/crossscripts/*:${TMPDIR}" % args.task)))
+
+        results = []
+        if args.reference:
+            d.setVar("SSTATE_HASHEQUIV_THREADS", "1")
+            results.append(("reference %s" % args.reference,) + run(load_reference(args.reference), path, args.task, d))
+        for threads in args.threads.split(","):
+            d.setVar("SSTATE_HASHEQUIV_THREADS", threads)
+            results.append(("%s threads" % threads,) + run(oe.sstatesig.OEOuthashBasic, path, args.task, d))
+        if args.cache:
+            d.setVar("SSTATE_HASHEQUIV_CACHE", os.path.join(tempdir, "outhash-cache"))
+            results.append(("cold cache",) + run(oe.sstatesig.OEOuthashBasic, path, args.task, d))
+            results.append(("warm cache",) + run(oe.sstatesig.OEOuthashBasic, path, args.task, d))
+
+        ok = True
+        for (name, digest, sigdata, elapsed) in results:
+            same = digest == results[0][1] and sigdata == results[0][2]
+            ok = ok and same
+            print("%-20s %8.3fs %s %s" % (name, elapsed, digest, same and "identical" or "DIFFERS"))
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+#
+# Benchmark oe.package.populate_packages() on a synthetic recipe and check
+# that the split packages are the same as with a reference git revision.
+#
+# Copyright OpenEmbedded Contributors
+#
+# SPDX-License-Identifier: GPL-2.0-only
+#
+
+import argparse
+import contextlib
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+scripts_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+lib_path = scripts_path + '/lib'
+sys.path = sys.path + [lib_path]
+
+import scriptpath
+scriptpath.add_oe_lib_path()
+if not scriptpath.add_bitbake_lib_path():
+    sys.stderr.write("Unable to find bitbake by searching parent directory of this script or PATH\n")
+    sys.exit(1)
+
+import bb.data_smart
+import bb.utils
+import oe.cachedpath
+import oe.license
+import oe.package
+
+
+def create_recipe(path, numfiles, numpackages):
+    """
+    Create a synthetic PKGD with numfiles files and return the FILES values
+    for numpackages packages. Each package gets a data directory, some
+    libraries and binaries, and a few files are left unshipped.
+    """
+    files = {}
+    pkgs = ["pkg%d" % i for i in range(numpackages)]
+    for i in range(numfiles):
+        pkg = pkgs[i % numpackages]
+        kind = i % 20
+        if kind == 0:
+            fn = "usr/lib/lib%s-%d.so.1" % (pkg, i)
+        elif kind == 1:
+            fn = "usr/lib/lib%s-%d.so" % (pkg, i)
+        elif kind == 2:
+            fn = "usr/bin/%s-%d" % (pkg, i)
+        elif kind == 3:
+            fn = "usr/share/unshipped/%d" % i
+        else:
+            fn = "usr/share/%s/sub%d/file%d" % (pkg, i % 13, i)
+        fn = os.path.join(path, fn)
+        os.makedirs(os.path.dirname(fn), exist_ok=True)
+        if kind == 1:
+            os.symlink(os.path.basename(fn)[:-3] + ".so.1", fn)
+        else:
+            open(fn, "w").close()
+
+    for pkg in pkgs:
+        files[pkg] = "/usr/share/%s /usr/lib/lib%s-*.so.* /usr/bin/%s-*" % (pkg, pkg, pkg)
+    files["%s-dev" % pkgs[0]] = "/usr/lib/*.so /usr/include"
+    return ["%s-dev" % pkgs[0]] + pkgs, files
+
+
+@contextlib.contextmanager
+def reference_modules(rev):
+    """
+    Replace oe.package and oe.cachedpath with the versions from the given
+    git revision
+    """
+    corebase = os.path.dirname(scripts_path)
+    saved = {}
+    for name in ("cachedpath", "package"):
+        source = subprocess.check_output(["git", "-C", corebase, "show", "%s:meta/lib/oe/%s.py" % (rev, name)])
+        module = types.ModuleType("oe.%s" % name)
+        exec(compile(source, "%s.py@%s" % (name, rev), "exec"), module.__dict__)
+        saved[name] = sys.modules["oe." + name]
+        sys.modules["oe." + name] = module
+        setattr(oe, name, module)
+    try:
+        yield
+    finally:
+        for name, module in saved.items():
+            sys.modules["oe." + name] = module
+            setattr(oe, name, module)
+
+
+def run(path, pkgdest, packages, files):
+    d = bb.data_smart.DataSmart()
+    d.setVar("PN", "benchmark")
+    d.setVar("WORKDIR", os.path.dirname(path))
+    d.setVar("DEPLOY_DIR", os.path.join(os.path.dirname(path), "deploy"))
+    d.setVar("PKGD", path)
+    d.setVar("PKGDEST", pkgdest)
+    d.setVar("PACKAGES", " ".join(packages))
+    d.setVar("INSANE_SKIP:benchmark", "installed-vs-shipped")
+    for pkg, value in files.items():
+        d.setVar("FILES:%s" % pkg, value)
+
+    cwd = os.getcwd()
+    start = time.monotonic()
+    try:
+        oe.package.populate_packages(d)
+    finally:
+        os.chdir(cwd)
+    elapsed = time.monotonic() - start
+
+    result = []
+    for root, dirs, names in os.walk(pkgdest):
+        for name in dirs + names:
+            result.append(os.path.relpath(os.path.join(root, name), pkgdest))
+    return sorted(result), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark populate_packages() on a synthetic recipe")
+    parser.add_argument("--files", type=int, default=100000, help="Number of files in the recipe (default: %(default)s)")
+    parser.add_argument("--packages", type=int, default=200, help="Number of packages (default: %(default)s)")
+    parser.add_argument("--reference", help="Also compare against oe.package and oe.cachedpath from this git revision")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "package")
+        print("Creating %d files for %d packages in %s" % (args.files, args.packages, path))
+        packages, files = create_recipe(path, args.files, args.packages)
+
+        results = []
+        if args.reference:
+            with reference_modules(args.reference):
+                results.append(("reference %s" % args.reference,) + run(path, os.path.join(tempdir, "reference"), packages, files))
+        results.append(("current",) + run(path, os.path.join(tempdir, "current"), packages, files))
+
+        ok = True
+        for (name, paths, elapsed) in results:
+            same = paths == results[0][1]
+            ok = ok and same
+            print("%-20s %8.3fs %d paths %s" % (name, elapsed, len(paths), same and "identical" or "DIFFERS"))
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
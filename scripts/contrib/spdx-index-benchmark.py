@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+#
+# Benchmark indexing a large oe.sbom30.ObjectSet with create_index() and
+# link(), and check that the type and ID indexes are the same as with the
+# generated SHACLObjectSet.add_index().
+#
+# Copyright OpenEmbedded Contributors
+#
+# SPDX-License-Identifier: GPL-2.0-only
+#
+
+import argparse
+import os
+import sys
+import time
+
+scripts_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+lib_path = scripts_path + '/lib'
+sys.path = sys.path + [lib_path]
+
+import scriptpath
+scriptpath.add_oe_lib_path()
+if not scriptpath.add_bitbake_lib_path():
+    sys.stderr.write("Unable to find bitbake by searching parent directory of this script or PATH\n")
+    sys.exit(1)
+
+from datetime import datetime, timezone
+
+import oe.sbom30
+import oe.spdx30
+
+
+def create_objset(numelements):
+    """
+    Create an object set with numelements elements, about as many other
+    objects, and the relationships between them, like a large image SBoM
+    """
+    objset = oe.sbom30.ObjectSet(None)
+    base = "http://spdx.org/spdxdocs/benchmark"
+    agent = objset.add(oe.spdx30.Organization(_id=base + "/agent", name="benchmark"))
+    ci = oe.spdx30.CreationInfo(
+        specVersion="3.0.1",
+        created=datetime(2024, 1, 1, tzinfo=timezone.utc),
+        createdBy=[agent],
+    )
+    agent.creationInfo = ci
+
+    for p in range(numelements // 1000):
+        pkg = objset.add(oe.spdx30.software_Package(_id="%s/package%d" % (base, p), creationInfo=ci, name="package%d" % p))
+        files = []
+        for i in range(999):
+            files.append(objset.add(oe.spdx30.software_File(
+                _id="%s/package%d/file%d" % (base, p, i),
+                creationInfo=ci,
+                name="usr/lib/file%d" % i,
+                verifiedUsing=[oe.spdx30.Hash(algorithm=oe.spdx30.HashAlgorithm.sha256, hashValue="%064x" % (p * 1000 + i))],
+                extension=[oe.sbom30.OEIdAliasExtension(alias="%spackage%d/file%d" % (oe.sbom30.OE_ALIAS_PREFIX, p, i))],
+            )))
+        objset.add(oe.spdx30.Relationship(
+            _id="%s/package%d/contains" % (base, p),
+            creationInfo=ci,
+            from_=pkg,
+            relationshipType=oe.spdx30.RelationshipType.contains,
+            to=files,
+        ))
+    return objset
+
+
+def run(objset, cls):
+    """
+    Index and link objset as an instance of cls
+    """
+    objset.__class__ = cls
+    start = time.monotonic()
+    objset.create_index()
+    index_time = time.monotonic() - start
+
+    start = time.monotonic()
+    objset.link()
+    link_time = time.monotonic() - start
+
+    by_type = {k: sorted((exact, id(o)) for exact, o in v) for k, v in objset.obj_by_type.items()}
+    by_id = {k: id(v) for k, v in objset.obj_by_id.items()}
+    return by_type, by_id, index_time, link_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark indexing an SPDX object set")
+    parser.add_argument("--elements", type=int, default=500000, help="Number of elements in the object set (default: %(default)s)")
+    args = parser.parse_args()
+
+    print("Creating %d elements" % args.elements)
+    objset = create_objset(args.elements)
+
+    # The generated SHACLObjectSet.add_index() checks every registered class
+    # for every object, ObjectSet looks up the types of each class once
+    results = []
+    results.append(("SHACLObjectSet",) + run(objset, oe.spdx30.SHACLObjectSet))
+    results.append(("ObjectSet",) + run(objset, oe.sbom30.ObjectSet))
+
+    ok = True
+    for (name, by_type, by_id, index_time, link_time) in results:
+        # ObjectSet also indexes the aliases of the elements
+        same = by_type == results[0][1] and by_id.items() >= results[0][2].items()
+        ok = ok and same
+        print("%-20s create_index %8.3fs link %8.3fs %s" % (name, index_time, link_time, same and "identical" or "DIFFERS"))
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
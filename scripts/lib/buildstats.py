@@ -6,10 +6,12 @@
 """Functionality for analyzing buildstats"""
 import json
 import logging
+import mmap
 import os
 import re
+import struct
 from collections import namedtuple
-from statistics import mean
+from statistics import fmean
 
 
 log = logging.getLogger()
@@ -118,6 +120,194 @@ class BSTask(dict):
         return bs_task
 
 
+# The task records written by write_task_record() in meta/lib/oe/buildstats.py
+TASK_RECORDS = "task_records"
+TASK_NAMES = "task_records.names"
+TASK_RECORDS_MAGIC = b"OEBSTASK"
+TASK_RECORDS_VERSION = 1
+TASK_STATUS = {0: None, 1: 'PASSED', 2: 'FAILED'}
+# The fields whose sum gives the BSTask properties
+TASK_STAT_FIELDS = {
+    'cputime': ('rusage_ru_stime', 'rusage_ru_utime', 'child_rusage_ru_stime', 'child_rusage_ru_utime'),
+    'read_bytes': ('io_read_bytes',),
+    'write_bytes': ('io_write_bytes',),
+    'read_ops': ('rusage_ru_inblock', 'child_rusage_ru_inblock'),
+    'write_ops': ('rusage_ru_oublock', 'child_rusage_ru_oublock'),
+}
+
+
+class TaskRecords(object):
+    """Memory mapped task records of one build"""
+    def __init__(self, path):
+        self.path = path
+        self._map = None
+        self._columns = {}
+        self._stats = {}
+        records_file = os.path.join(path, TASK_RECORDS)
+        with open(records_file, 'rb') as fobj:
+            size = os.fstat(fobj.fileno()).st_size
+            if size:
+                self._map = mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._map is None or self._map[:8] != TASK_RECORDS_MAGIC:
+            self.close()
+            raise BSError("{} is not a task records file".format(records_file))
+        version, self._header_size = struct.unpack_from('<II', self._map, 8)
+        if version != TASK_RECORDS_VERSION:
+            self.close()
+            raise BSError("Unsupported version {} of {}".format(version, records_file))
+        fields = self._map[16:self._header_size].rstrip(b'\0').decode('ascii').split()
+        self.fields = [tuple(f.split(':')) for f in fields]
+        if any(struct.calcsize(code) != 8 for _, code in self.fields):
+            self.close()
+            raise BSError("Unsupported field in {}".format(records_file))
+        self._index = dict((name, i) for i, (name, _) in enumerate(self.fields))
+        # Ignore a record which is still being written
+        self.num_records = (size - self._header_size) // (8 * len(self.fields))
+
+        with open(os.path.join(path, TASK_NAMES), 'rb') as fobj:
+            self._names = fobj.read()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excinfo):
+        self.close()
+
+    def __len__(self):
+        return self.num_records
+
+    def column(self, name):
+        """Get the values of one field of all the records as a list"""
+        if name not in self._columns:
+            if name not in self._index:
+                raise BSError("No field {} in the task records of {}".format(name, self.path))
+            if self._map is None:
+                raise BSError("The task records of {} have been closed".format(self.path))
+            end = self._header_size + self.num_records * 8 * len(self.fields)
+            with memoryview(self._map)[self._header_size:end] as body:
+                with body.cast(self.fields[self._index[name]][1]) as values:
+                    with values[self._index[name]::len(self.fields)] as column:
+                        self._columns[name] = column.tolist()
+        return self._columns[name]
+
+    def load(self):
+        """
+        Read all the fields, so that the records can still be used after
+        closing the file
+        """
+        for name, _ in self.fields:
+            self.column(name)
+
+    def names(self):
+        """Get the "PF task" name of each record as bytes"""
+        names = self._names.split(b'\n')[:-1]
+        if len(names) == self.num_records:
+            # The names are written just before their record, so unless a
+            # writer has been interrupted they are in the same order
+            return names
+        return [self._names[offset:offset + length]
+                for offset, length in zip(self.column('name_offset'),
+                                          self.column('name_length'))]
+
+    def latest(self):
+        """
+        Get a dict of the index of the last record of each task by recipe
+        (PF) and task name
+        """
+        latest = {}
+        for name, i in dict(zip(self.names(), range(self.num_records))).items():
+            pf, task = name.decode('utf-8').split(' ', 1)
+            latest.setdefault(pf, {})[task] = i
+        return latest
+
+    def stat(self, name):
+        """
+        Get the values of one of the BSTaskAggregate properties for all the
+        records. The walltime of the tasks which haven't ended is None.
+        """
+        if name not in self._stats:
+            if name == 'walltime':
+                values = [end - start if end else None for start, end in
+                          zip(self.column('start_time'), self.column('end_time'))]
+            elif name in TASK_STAT_FIELDS:
+                values = [sum(v) for v in zip(*(self.column(f) for f in TASK_STAT_FIELDS[name]))]
+            else:
+                raise BSError("Unknown buildstats attribute {}".format(name))
+            self._stats[name] = values
+        return self._stats[name]
+
+
+class BSTaskRecord(object):
+    """Buildstats of one task in the task records of a build"""
+    __slots__ = ('_records', '_index', '_elapsed_time')
+
+    def __init__(self, records, index, elapsed_time):
+        self._records = records
+        self._index = index
+        self._elapsed_time = elapsed_time
+
+    def _value(self, name):
+        return self._records.column(name)[self._index]
+
+    def __getitem__(self, key):
+        if key == 'start_time':
+            return self._value('start_time')
+        elif key == 'elapsed_time':
+            return self._elapsed_time
+        elif key == 'status':
+            return TASK_STATUS.get(self._value('status'))
+        elif key == 'iostat':
+            return dict((name[3:], self._value(name)) for name, _ in self._records.fields
+                        if name.startswith('io_'))
+        elif key in ('rusage', 'child_rusage'):
+            prefix = key + '_'
+            return dict((name[len(prefix):], self._value(name)) for name, _ in self._records.fields
+                        if name.startswith(prefix))
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    @property
+    def cputime(self):
+        """Sum of user and system time taken by the task"""
+        return self._records.stat('cputime')[self._index]
+
+    @property
+    def walltime(self):
+        """Elapsed wall clock time"""
+        return self._elapsed_time
+
+    @property
+    def read_bytes(self):
+        """Bytes read from the block layer"""
+        return self._records.stat('read_bytes')[self._index]
+
+    @property
+    def write_bytes(self):
+        """Bytes written to the block layer"""
+        return self._records.stat('write_bytes')[self._index]
+
+    @property
+    def read_ops(self):
+        """Number of read operations on the block layer"""
+        return self._records.stat('read_ops')[self._index]
+
+    @property
+    def write_ops(self):
+        """Number of write operations on the block layer"""
+        return self._records.stat('write_ops')[self._index]
+
+
 class BSTaskAggregate(object):
     """Class representing multiple runs of the same task"""
     properties = ('cputime', 'walltime', 'read_bytes', 'write_bytes',
@@ -131,8 +321,9 @@ class BSTaskAggregate(object):
         if name in self.properties:
             if name not in self._properties:
                 # Calculate properties on demand only. We only provide mean
-                # value, so far
-                self._properties[name] = mean([getattr(t, name) for t in self._tasks])
+                # value, so far. fmean() is much faster than mean() which
+                # sums the values exactly as fractions.
+                self._properties[name] = fmean([getattr(t, name) for t in self._tasks])
             return self._properties[name]
         else:
             raise AttributeError("'BSTaskAggregate' has no attribute '{}'".format(name))
@@ -140,7 +331,7 @@ class BSTaskAggregate(object):
     def append(self, task):
         """Append new task"""
         # Reset pre-calculated properties
-        assert isinstance(task, BSTask), "Type is '{}' instead of 'BSTask'".format(type(task))
+        assert isinstance(task, (BSTask, BSTaskRecord)), "Type is '{}' instead of 'BSTask'".format(type(task))
         self._properties = {}
         self._tasks.append(task)
 
@@ -252,11 +443,14 @@ class BuildStats(dict):
         if not os.path.isfile(top_stats):
             raise BSError("{} does not look like a buildstats directory".format(path))
 
-        log.debug("Reading buildstats directory %s", path)
         buildstats = cls()
         build_started, build_elapsed = buildstats.parse_top_build_stats(top_stats)
         build_end = build_started + build_elapsed
 
+        if os.path.isfile(os.path.join(path, TASK_RECORDS)):
+            return cls.from_records(path, build_end)
+
+        log.debug("Reading buildstats directory %s", path)
         subdirs = os.listdir(path)
         for dirname in subdirs:
             recipe_dir = os.path.join(path, dirname)
@@ -265,6 +459,9 @@ class BuildStats(dict):
             name, epoch, version, revision = cls.split_nevr(dirname)
             bsrecipe = BSRecipe(name, epoch, version, revision)
             for task in os.listdir(recipe_dir):
+                if task.endswith('.samples'):
+                    # Samples of the task taken while it ran
+                    continue
                 bsrecipe.tasks[task] = BSTask.from_file(
                     os.path.join(recipe_dir, task), build_end)
             if name in buildstats:
@@ -274,6 +471,39 @@ class BuildStats(dict):
 
         return buildstats
 
+    @classmethod
+    def from_records(cls, path, fallback_end=0):
+        """
+        Load buildstats from the task records of a buildstats directory.
+        fallback_end is an optional end time for tasks that are not recorded
+        as finishing.
+        """
+        log.debug("Reading task records from %s", path)
+        with TaskRecords(path) as records:
+            records.load()
+        latest = records.latest()
+        start_times = records.column('start_time')
+        walltimes = records.stat('walltime')
+
+        buildstats = cls()
+        for dirname, tasks in latest.items():
+            name, epoch, version, revision = cls.split_nevr(dirname)
+            bsrecipe = BSRecipe(name, epoch, version, revision)
+            for task, index in tasks.items():
+                start_time = start_times[index]
+                elapsed_time = walltimes[index]
+                if start_time and elapsed_time is None and fallback_end:
+                    elapsed_time = fallback_end - start_time
+                if not start_time or elapsed_time is None:
+                    raise BSError("Invalid task record for {}:{} in {}".format(dirname, task, path))
+                bsrecipe.tasks[task] = BSTaskRecord(records, index, elapsed_time)
+            if name in buildstats:
+                raise BSError("Cannot handle multiple versions of the same "
+                              "package ({})".format(name))
+            buildstats[name] = bsrecipe
+
+        return buildstats
+
     def aggregate(self, buildstats):
         """Aggregate other buildstats into this"""
         if set(self.keys()) != set(buildstats.keys()):
@@ -18,6 +18,7 @@ logger = logging.getLogger('devtool')
 
 def search(args, config, basepath, workspace):
     """Entry point for the devtool 'search' subcommand"""
+    import oe.packagedata
 
     tinfoil = setup_tinfoil(config_only=False, basepath=basepath)
     try:
@@ -66,10 +67,20 @@ def search(args, config, basepath, workspace):
                                         key = splitline[0]
                                         value = splitline[1].strip()
                                     key = key.replace(":" + pkg, "")
-                                    if key in ['PKG', 'DESCRIPTION', 'FILES_INFO', 'FILERPROVIDES']:
+                                    if key in ['PKG', 'DESCRIPTION', 'FILES_INFO']:
                                         if keyword_rc.search(value):
                                             match = True
                                             break
+                            if match:
+                                break
+                            # The per file provides are kept in filedeps/<pkg>.json
+                            filedeps = oe.packagedata.read_filedeps_file(os.path.join(pkgdata_dir, 'filedeps', pkg + '.json'))
+                            for provides in filedeps['provides'].values():
+                                if any(keyword_rc.search(prov) for prov in provides):
+                                    match = True
+                                    break
+                            if match:
+                                break
                 if match:
                     print_match(fn)
                     matches.append(fn)
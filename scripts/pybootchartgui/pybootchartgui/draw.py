@@ -97,6 +97,14 @@ IO_PRESSURE_TOTAL_COLOR = IO_COLOR
 MEM_PRESSURE_AVG10_COLOR = (0.0, 0.0, 0.0, 1.0)
 # delta total memory pressure color
 MEM_PRESSURE_TOTAL_COLOR = DISK_TPUT_COLOR
+# Task RSS color
+TASK_RSS_COLOR = IO_COLOR
+# Largest task RSS color
+TASK_RSS_MAX_COLOR = (0.0, 0.0, 0.0, 1.0)
+# Task CPU color
+TASK_CPU_COLOR = CPU_COLOR
+# Task I/O color
+TASK_IO_COLOR = DISK_TPUT_COLOR
 
 
 
@@ -371,6 +379,8 @@ def extents(options, xscale, trace):
             h += 30 + bar_h
         if trace.mem_stats:
             h += meminfo_bar_h
+        if trace.task_samples:
+            h += 2 * (30 + bar_h)
         if trace.net_stats:
             h += (30 + bar_h) * len(trace.net_stats)
 
@@ -387,6 +397,71 @@ def clip_visible(clip, rect):
     ymin = min (clip[1] + clip[3], rect[1] + rect[3])
     return (xmin > xmax and ymin > ymax)
 
+def task_samples_per_second(task_samples, value):
+    """
+    Sum value(sample, next_sample) over the sampled tasks for every second,
+    using the pair of samples of each task which spans it
+    """
+    totals = {}
+    for samples in task_samples.values():
+        for sample, next_sample in zip(samples, samples[1:]):
+            v = value(sample, next_sample)
+            for t in range(int(sample.time), int(next_sample.time)):
+                totals[t] = totals.get(t, 0) + v
+    return sorted(totals.items())
+
+def task_samples_rate(sample, next_sample, value):
+    if next_sample.time <= sample.time:
+        return 0
+    return max(0, (value(next_sample) - value(sample)) / (next_sample.time - sample.time))
+
+def render_task_charts(ctx, clip, trace, proc_tree, curr_y, w, sec_w):
+    # render the total RSS of the tasks and the RSS of the largest one
+    rss = task_samples_per_second(trace.task_samples, lambda s, n: s.rss)
+    max_rss = {}
+    for samples in trace.task_samples.values():
+        for sample, next_sample in zip(samples, samples[1:]):
+            for t in range(int(sample.time), int(next_sample.time)):
+                max_rss[t] = max(max_rss.get(t, 0), sample.rss)
+    max_rss = sorted(max_rss.items())
+    peak_task, peak_samples = max(trace.task_samples.items(),
+                                  key = lambda item: max(s.rss for s in item[1]))
+    peak_rss = max(s.rss for s in peak_samples)
+    rss_scale = max([v for _, v in rss] or [0])
+
+    draw_legend_box(ctx, "Task RSS (max %u MiB)" % (rss_scale / 1024), TASK_RSS_COLOR, off_x, curr_y+20, leg_s)
+    draw_legend_line(ctx, "Largest task (%s, %u MiB)" % (peak_task, peak_rss / 1024), \
+             TASK_RSS_MAX_COLOR, off_x + 240, curr_y+20, leg_s)
+
+    chart_rect = (off_x, curr_y+30, w, bar_h)
+    if rss and clip_visible (clip, chart_rect):
+        draw_box_ticks (ctx, chart_rect, sec_w)
+        draw_annotations (ctx, proc_tree, trace.times, chart_rect)
+        draw_chart (ctx, TASK_RSS_COLOR, True, chart_rect, rss, proc_tree, [0, rss_scale])
+        draw_chart (ctx, TASK_RSS_MAX_COLOR, False, chart_rect, max_rss, proc_tree, [0, rss_scale])
+
+    curr_y = curr_y + 30 + bar_h
+
+    # render the CPU usage and I/O throughput of the tasks
+    cpu = task_samples_per_second(trace.task_samples,
+                                  lambda s, n: task_samples_rate(s, n, lambda x: x.cpu))
+    io = task_samples_per_second(trace.task_samples,
+                                 lambda s, n: task_samples_rate(s, n, lambda x: x.read_bytes + x.write_bytes))
+
+    draw_legend_box(ctx, "Task CPU (max %.1f CPUs)" % max([v for _, v in cpu] or [0]), \
+            TASK_CPU_COLOR, off_x, curr_y+20, leg_s)
+    draw_legend_line(ctx, "Task I/O (max %u MiB/s)" % (max([v for _, v in io] or [0]) / 1024 / 1024), \
+             TASK_IO_COLOR, off_x + 240, curr_y+20, leg_s)
+
+    chart_rect = (off_x, curr_y+30, w, bar_h)
+    if cpu and clip_visible (clip, chart_rect):
+        draw_box_ticks (ctx, chart_rect, sec_w)
+        draw_annotations (ctx, proc_tree, trace.times, chart_rect)
+        draw_chart (ctx, TASK_CPU_COLOR, True, chart_rect, cpu, proc_tree, None)
+        draw_chart (ctx, TASK_IO_COLOR, False, chart_rect, io, proc_tree, None)
+
+    return curr_y + 30 + bar_h
+
 def render_charts(ctx, options, clip, trace, curr_y, w, h, sec_w):
     proc_tree = options.proc_tree(trace)
 
@@ -668,6 +743,9 @@ def render_charts(ctx, options, clip, trace, curr_y, w, h, sec_w):
 
         curr_y = curr_y + meminfo_bar_h
 
+    if trace.task_samples:
+        curr_y = render_task_charts(ctx, clip, trace, proc_tree, curr_y, w, sec_w)
+
     return curr_y
 
 def render_processes_chart(ctx, options, trace, curr_y, width, h, sec_w):
@@ -741,8 +819,13 @@ def render_processes_chart(ctx, options, trace, curr_y, width, h, sec_w):
                 draw_fill_rect(ctx, col, (x, y, w, proc_h))
             draw_rect(ctx, PROC_BORDER_COLOR, (x, y, w, proc_h))
 
-            # Show elapsed time for each task
-            process = "%ds %s" % (elapsed_time, process)
+            # Show elapsed time for each task, and the peak RSS if the
+            # task was sampled
+            if process in trace.task_samples:
+                peak_rss = max(sample.rss for sample in trace.task_samples[process])
+                process = "%ds %uMiB %s" % (elapsed_time, peak_rss / 1024, process)
+            else:
+                process = "%ds %s" % (elapsed_time, process)
             draw_label_in_box(ctx, PROC_TEXT_COLOR, process, x, y + proc_h - 4, w, width)
 
             y = y + proc_h
@@ -53,6 +53,7 @@ class Trace:
         self.cpu_pressure = []
         self.io_pressure = []
         self.mem_pressure = []
+        self.task_samples = {}
         self.times = [] # Always empty, but expected by draw.py when drawing system charts.
 
         if len(paths):
@@ -747,6 +748,25 @@ def _parse_bitbake_buildstats(writer, state, filename, file):
     if start and end:
         state.add_process(pn + ":" + task, start, end)
 
+def _parse_task_samples(state, filename, file):
+    paths = filename.split("/")
+    task = paths[-1][:-len(".samples")]
+    pn = paths[-2]
+    columns = []
+    samples = []
+    for line in file:
+        if line.startswith("#"):
+            columns = line[1:].split()
+            continue
+        values = dict(zip(columns, [float(value) for value in line.split()]))
+        if len(values) != len(columns):
+            continue
+        pressure = dict((column, value) for column, value in values.items() if column.endswith("_us"))
+        samples.append(TaskSample(values["time"], int(values["procs"]), values["rss_kb"], values["cpu_s"],
+                                  values["read_bytes"], values["write_bytes"], pressure))
+    if samples:
+        state.task_samples[pn + ":" + task] = samples
+
 def get_num_cpus(headers):
     """Get the number of CPUs from the system.cpu header property. As the
     CPU utilization graphs are relative, the number of CPUs currently makes
@@ -792,6 +812,11 @@ def _do_parse(writer, state, filename, file):
         state.io_pressure = _parse_pressure_logs(file, name)
     elif name == "memory.log":
         state.mem_pressure = _parse_pressure_logs(file, name)
+    elif name.endswith(".samples"):
+        _parse_task_samples(state, filename, file)
+    elif name in ("task_records", "task_records.names", "task_records.lock"):
+        # The binary copy of the task buildstats
+        pass
     elif not filename.endswith('.log'):
         _parse_bitbake_buildstats(writer, state, filename, file)
     t2 = time.process_time()
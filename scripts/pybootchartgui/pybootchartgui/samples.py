@@ -71,6 +71,22 @@ class MemPressureSample:
         self.avg300 = avg300
         self.deltaTotal = deltaTotal
 
+class TaskSample:
+    """
+    One sample of the process tree of a bitbake task, from the <task>.samples
+    buildstats files. rss is in kB, cpu in seconds and the I/O in bytes. The
+    pressure stall times since the task started are in microseconds, by
+    column name.
+    """
+    def __init__(self, time, procs, rss, cpu, read_bytes, write_bytes, pressure):
+        self.time = time
+        self.procs = procs
+        self.rss = rss
+        self.cpu = cpu
+        self.read_bytes = read_bytes
+        self.write_bytes = write_bytes
+        self.pressure = pressure
+
 
 class MemSample:
     used_values = ('MemTotal', 'MemFree', 'Buffers', 'Cached', 'SwapTotal', 'SwapFree',)